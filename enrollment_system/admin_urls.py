@@ -0,0 +1,13 @@
+"""
+Admin URLs for COLD_START_MODE.
+
+The admin is installed with SimpleAdminConfig there, so admin.py modules
+are not imported by django.setup(). urls.py mounts this module at /admin/
+with coldstart.lazy_include(), which only imports it the first time an
+admin URL is resolved or reversed.
+"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
@@ -22,6 +22,14 @@ INSTALLED_APPS = [
     'enrollments', 
 ]
 
+# Cold-start mode for serverless (enrollments/coldstart.py): defer what the
+# first request doesn't need. On by default on Vercel.
+COLD_START_MODE = os.getenv('COLD_START_MODE', '1' if os.getenv('VERCEL') else '0') in ('1', 'True', 'true')
+if COLD_START_MODE:
+    INSTALLED_APPS.remove('django.contrib.humanize')  # no template loads it
+    # Admin modules are autodiscovered on the first /admin/ request instead (admin_urls.py)
+    INSTALLED_APPS[INSTALLED_APPS.index('django.contrib.admin')] = 'django.contrib.admin.apps.SimpleAdminConfig'
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -29,6 +37,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'enrollments.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -39,8 +48,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process; wsgi.py prewarms them in cold-start mode
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -60,6 +75,53 @@ DATABASES = {
     )
 }
 
+# Read replicas (enrollments/replicas.py): comma-separated database URLs,
+# e.g. DATABASE_REPLICA_URLS=sqlite:///db-replica.sqlite3 for local testing
+for _index, _url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    DATABASES[f'replica{_index}'] = dj_database_url.parse(_url.strip(), conn_max_age=600, ssl_require=not DEBUG)
+    DATABASES[f'replica{_index}']['TEST'] = {'MIRROR': 'default'}
+
+if len(DATABASES) > 1:
+    DATABASE_ROUTERS = ['enrollments.replicas.ReplicaRouter']
+
+REPLICA_MAX_LAG_SECONDS = int(os.getenv('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_HEALTH_CHECK_INTERVAL = int(os.getenv('REPLICA_HEALTH_CHECK_INTERVAL', '10'))
+# Read-your-writes window; shorter than the lag a replica may have between two
+# probes would not be enough, so replicas.py never pins for less
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', str(REPLICA_MAX_LAG_SECONDS + REPLICA_HEALTH_CHECK_INTERVAL)))
+# Models whose reads may always go to a replica, not just in @replica_reads views
+REPLICA_READ_MODELS = ['enrollments.enrollmentsummary']
+
+# SQLite production profile (enrollments/db/sqlite_profile.py): WAL, busy timeout,
+# BEGIN IMMEDIATE, ... tuned with DB_SQLITE_* env vars, e.g. DB_SQLITE_ENABLED=False
+# for Django's stock SQLite settings. Ignored for other databases.
+from enrollments.db.sqlite_profile import configure_sqlite, sqlite_settings  # noqa: E402
+
+DB_SQLITE = sqlite_settings()
+for _db in DATABASES.values():
+    configure_sqlite(_db, DB_SQLITE)
+
+# Connection pooling (enrollments/db/pool.py), tuned with DB_POOL_* env vars,
+# e.g. DB_POOL_ENABLED=True DB_POOL_MAX_SIZE=4 (per worker process)
+from enrollments.db.pool import configure_pooling, pool_settings  # noqa: E402
+
+DB_POOL = pool_settings()
+for _db in DATABASES.values():
+    configure_pooling(_db, DB_POOL)
+
+# Data versions (enrollments/versioning.py), dashboard snapshots, reports and
+# form tokens must be seen by every worker process: Redis with REDIS_URL (needs
+# the redis package), else a table in the database (created by a migration)
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'enrollments_cache'}}
+# Upper bound on how long a process keeps its copy of the reference data
+# (enrollments/reference.py) if a version bump is missed
+REFERENCE_DATA_MAX_AGE = int(os.getenv('REFERENCE_DATA_MAX_AGE', '600'))
+# How often a process re-reads the shared reference data version
+REFERENCE_DATA_CHECK_SECONDS = int(os.getenv('REFERENCE_DATA_CHECK_SECONDS', '5'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -79,4 +141,72 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Change feed for downstream sync jobs (enrollments/changefeed.py)
+CHANGE_FEED_TOKEN = os.getenv('CHANGE_FEED_TOKEN', '')
+# Longest a transaction writing tracked rows may stay open; the feed waits
+# this long for a missing sequence number before treating it as rolled back
+CHANGE_FEED_SETTLE_SECONDS = int(os.getenv('CHANGE_FEED_SETTLE_SECONDS', '60'))
+
+# Admin changelists / list views (enrollments/pagination.py): results above
+# this many rows get an estimated (Postgres) or cached (SQLite) count
+APPROXIMATE_COUNT_THRESHOLD = int(os.getenv('APPROXIMATE_COUNT_THRESHOLD', '10000'))
+APPROXIMATE_COUNT_CACHE_SECONDS = int(os.getenv('APPROXIMATE_COUNT_CACHE_SECONDS', '60'))
+
+# Dashboard snapshots (enrollments/dashboards.py) are invalidated by signals;
+# this only bounds how long an untouched one stays in the cache (at most
+# versioning.LOCAL_CACHE_SECONDS if CACHES is process-local)
+DASHBOARD_CACHE_SECONDS = int(os.getenv('DASHBOARD_CACHE_SECONDS', '900'))
+
+# How long a submitted form token is remembered (enrollments/idempotency.py)
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+# ... and how long replaying a registration still logs the new student in
+IDEMPOTENCY_LOGIN_REPLAY_SECONDS = int(os.getenv('IDEMPOTENCY_LOGIN_REPLAY_SECONDS', '60'))
+
+# Columnar files of closed terms for analyses (enrollments/snapshots.py), written by
+# `manage.py snapshot_terms`
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', str(BASE_DIR / 'snapshots'))
+
+# Background jobs (enrollments/jobs.py), run by `manage.py run_jobs`
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', '300'))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+
+# E-mail (enrollments/mail.py). Without EMAIL_HOST messages are only printed
+# by the worker; `manage.py smtp_sink` is a local server to send them to
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', (
+    'django.core.mail.backends.smtp.EmailBackend' if os.getenv('EMAIL_HOST')
+    else 'django.core.mail.backends.console.EmailBackend'
+))
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '30'))
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'registrar@localhost')
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '100'))  # messages per SMTP connection
+EMAIL_RATE_PER_SECOND = float(os.getenv('EMAIL_RATE_PER_SECOND', '20'))  # per worker; 0 = unthrottled
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+
+# Request tracing and the slow-query log (enrollments/tracing.py); reports
+# with `manage.py trace_report`. Off by default: nothing is installed then
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'False') == 'True'
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '0.01'))  # staff can add ?_trace=1 to any page
+TRACING_EXPORT_PATH = os.getenv('TRACING_EXPORT_PATH', str(BASE_DIR / 'traces.jsonl'))
+TRACING_SLOW_QUERY_MS = float(os.getenv('TRACING_SLOW_QUERY_MS', '100'))  # 0 = no slow-query log
+if TRACING_ENABLED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1, 'enrollments.tracing.TracingMiddleware')
+
+# Slow queries are logged to stderr, or to TRACING_SLOW_QUERY_LOG if set
+_slow_query_handler = {'class': 'logging.StreamHandler'}
+if os.getenv('TRACING_SLOW_QUERY_LOG'):
+    _slow_query_handler = {'class': 'logging.FileHandler', 'filename': os.getenv('TRACING_SLOW_QUERY_LOG')}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'slow_queries': _slow_query_handler},
+    'loggers': {
+        'enrollments.slow_queries': {'handlers': ['slow_queries'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -19,8 +19,16 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+if getattr(settings, 'COLD_START_MODE', False):
+    from enrollments.coldstart import lazy_include
+
+    # Imported on the first admin URL, see admin_urls.py
+    admin_path = lazy_include('admin/', 'enrollment_system.admin_urls', admin.site.name)
+else:
+    admin_path = path('admin/', admin.site.urls)
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    admin_path,
     path('', include('enrollments.urls')),
 ]
 
@@ -5,5 +5,12 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'enrollment_system.settings')
 
 application = get_wsgi_application()
 
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'COLD_START_MODE', False):
+    # Import the views and compile the templates now rather than during the first request
+    from enrollments import coldstart  # noqa: E402
+    coldstart.prewarm()
+
 # Add this line for Vercel
 app = application
\ No newline at end of file
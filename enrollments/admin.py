@@ -1,12 +1,33 @@
-from django.contrib import admin
-from .models import Student, Program, SchoolYear, Enrollment, Notification
+from django import forms
+from django.contrib import admin, messages
+from .models import (
+    Student, Program, SchoolYear, Enrollment, Notification, EnrollmentSummary, ChangeLogEntry,
+    ArchivedEnrollment, ArchivedNotification, Job, OutboundEmail, Section, Meeting,
+    FeeSchedule, FeeRule, FeeInstallment,
+)
+from . import fees, search, transitions
+from .pagination import ApproximateCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Tables that grow with every term: no exact COUNT(*) of the whole table
+    # per changelist page, and an estimate for big filtered results
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ['student_id', 'get_full_name', 'email', 'contact_number', 'created_at']
-    search_fields = ['student_id', 'first_name', 'last_name', 'email']
+    # Searched through the token index in search.py, not icontains scans;
+    # search_fields only makes the admin show its search box
+    search_fields = ['search_text']
     list_filter = ['gender', 'created_at']
+    
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search.filter_students(queryset, search_term), False
 
 
 @admin.register(Program)
@@ -18,20 +39,221 @@ class ProgramAdmin(admin.ModelAdmin):
 
 @admin.register(SchoolYear)
 class SchoolYearAdmin(admin.ModelAdmin):
-    list_display = ['__str__', 'is_active', 'enrollment_start', 'enrollment_end']
+    list_display = ['__str__', 'is_active', 'enrollment_start', 'enrollment_end', 'archived_at']
     list_filter = ['is_active', 'semester']
 
 
+class MeetingInline(admin.TabularInline):
+    model = Meeting
+    extra = 1
+
+
+@admin.register(Section)
+class SectionAdmin(admin.ModelAdmin):
+    list_display = ['code', 'program', 'school_year', 'year_level', 'schedule_display']
+    list_filter = ['school_year', 'program', 'year_level']
+    search_fields = ['code']
+    list_select_related = ['program', 'school_year']
+    inlines = [MeetingInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('meetings')
+
+
+class PublishedScheduleInline(admin.TabularInline):
+    # Rules of a published schedule are frozen (fees.py); change them in a new version
+    extra = 0
+
+    def _editable(self, obj):
+        return obj is None or obj.published_at is None
+
+    def has_add_permission(self, request, obj=None):
+        return self._editable(obj) and super().has_add_permission(request, obj)
+
+    def has_change_permission(self, request, obj=None):
+        return self._editable(obj) and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return self._editable(obj) and super().has_delete_permission(request, obj)
+
+
+class FeeRuleInline(PublishedScheduleInline):
+    model = FeeRule
+    fields = ['kind', 'name', 'program', 'program_type', 'year_level', 'student', 'multiplier', 'percent', 'amount']
+    autocomplete_fields = ['program', 'student']
+
+
+class FeeInstallmentInline(PublishedScheduleInline):
+    model = FeeInstallment
+
+
+class FeeScheduleForm(forms.ModelForm):
+    class Meta:
+        model = FeeSchedule
+        fields = ['school_year', 'notes']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        school_year = cleaned_data.get('school_year')
+        # Later versions start as a copy of the latest one (the action below), not empty
+        if self.instance.pk is None and school_year and FeeSchedule.objects.filter(school_year=school_year).exists():
+            raise forms.ValidationError(
+                f"{school_year} already has a fee schedule; use 'Copy into a new draft version' on its latest one."
+            )
+        return cleaned_data
+
+
+@admin.register(FeeSchedule)
+class FeeScheduleAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'school_year', 'version', 'published_at', 'created_by', 'notes']
+    list_filter = ['school_year']
+    form = FeeScheduleForm
+    readonly_fields = ['version', 'created_by', 'published_at']
+    list_select_related = ['school_year', 'created_by']
+    inlines = [FeeRuleInline, FeeInstallmentInline]
+    actions = ['publish_selected', 'new_version_of_selected']
+
+    def get_readonly_fields(self, request, obj=None):
+        return self.readonly_fields + (['school_year'] if obj else [])
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.version, obj.created_by = 1, request.user
+        super().save_model(request, obj, form, change)
+
+    @admin.action(description='Publish selected drafts (then run recompute_fees)')
+    def publish_selected(self, request, queryset):
+        for schedule in queryset.order_by('school_year', 'version'):
+            try:
+                fees.publish(schedule)
+            except fees.FeeError as exc:
+                self.message_user(request, str(exc), messages.ERROR)
+            else:
+                self.message_user(request, f'{schedule} is now in effect. Run recompute_fees for existing enrollments.')
+
+    @admin.action(description='Copy into a new draft version')
+    def new_version_of_selected(self, request, queryset):
+        for school_year in SchoolYear.objects.filter(pk__in=queryset.values('school_year')):
+            try:
+                schedule = fees.new_version(school_year, by=request.user)
+            except fees.FeeError as exc:
+                self.message_user(request, str(exc), messages.ERROR)
+            else:
+                self.message_user(request, f'Created {schedule}.')
+
+
+def _transition_action(name):
+    transition = transitions.TRANSITIONS[name]
+
+    def action(modeladmin, request, queryset):
+        try:
+            changed = transitions.transition_queryset(queryset, name, by=request.user)
+        except transitions.TransitionError as exc:
+            modeladmin.message_user(request, str(exc), messages.ERROR)
+            return
+        skipped = queryset.count() - changed
+        modeladmin.message_user(request, (
+            f'{changed} enrollment(s) now {transition.target}'
+            + (f'; {skipped} skipped (not {" or ".join(transition.sources)})' if skipped > 0 else '.')
+        ))
+
+    action.__name__ = f'{name}_selected'
+    return admin.action(description=f'{transition.verb.capitalize()} selected enrollments')(action)
+
+
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(LargeTableAdmin):
     list_display = ['enrollment_id', 'student', 'program', 'school_year', 'year_level', 'status', 'reviewed_by']
     list_filter = ['status', 'year_level', 'school_year', 'reviewed_by']
-    search_fields = ['enrollment_id', 'student__first_name', 'student__last_name']
-    readonly_fields = ['enrollment_id', 'reviewed_by', 'reviewed_at']
+    search_fields = ['enrollment_id']
+    # Status only changes through the actions (transitions.py), never by editing the row
+    readonly_fields = ['enrollment_id', 'status', 'reviewed_by', 'reviewed_at']
+    actions = [_transition_action(name) for name in transitions.TRANSITIONS]
+    list_select_related = ['student', 'program', 'school_year', 'reviewed_by']
+    autocomplete_fields = ['sections']
+    
+    def get_search_results(self, request, queryset, search_term):
+        # An enrollment ID, or the student's name / ID / e-mail via the search index
+        if not search_term.strip():
+            return queryset, False
+        by_student = search.filter_students(queryset, search_term, field='student')
+        return by_student | queryset.filter(enrollment_id__icontains=search_term.strip()), False
 
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(LargeTableAdmin):
     list_display = ['user', 'notification_type', 'is_read', 'created_at']
     list_filter = ['notification_type', 'is_read']
-    search_fields = ['user__username', 'message']
\ No newline at end of file
+    search_fields = ['user__username', 'message']
+    list_select_related = ['user']
+
+
+@admin.register(EnrollmentSummary)
+class EnrollmentSummaryAdmin(admin.ModelAdmin):
+    list_display = ['program', 'school_year', 'status', 'year_level', 'enrollment_count', 'total_fee_sum', 'updated_at']
+    list_filter = ['status', 'year_level', 'school_year', 'program']
+    list_select_related = ['program', 'school_year']
+
+    # Maintained by signals / rebuild_enrollment_summaries only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ChangeLogEntry)
+class ChangeLogEntryAdmin(LargeTableAdmin):
+    list_display = ['id', 'model', 'object_pk', 'action', 'changed_at']
+    list_filter = ['model', 'action']
+    search_fields = ['object_pk']
+
+    # Append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ReadOnlyArchiveAdmin(LargeTableAdmin):
+    # Archived rows are only written by archive_school_years
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedEnrollment)
+class ArchivedEnrollmentAdmin(ReadOnlyArchiveAdmin):
+    list_display = ['enrollment_id', 'student', 'program', 'school_year', 'year_level', 'status', 'archived_at']
+    list_filter = ['status', 'year_level', 'school_year']
+    search_fields = ['enrollment_id', 'student__search_text']
+    list_select_related = ['student', 'program', 'school_year']
+
+
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(ReadOnlyArchiveAdmin):
+    list_display = ['user', 'notification_type', 'is_read', 'created_at', 'archived_at']
+    list_filter = ['notification_type']
+    search_fields = ['user__username', 'message']
+    list_select_related = ['user']
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'run_at', 'attempts', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['claim_token', 'locked_until', 'progress', 'result', 'last_error', 'started_at', 'finished_at']
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(LargeTableAdmin):
+    list_display = ['recipient', 'kind', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['recipient', 'dedupe_key']
+    readonly_fields = ['enrollment', 'subject', 'body', 'claim_token', 'locked_until', 'last_error', 'sent_at']
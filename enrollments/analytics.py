@@ -0,0 +1,209 @@
+"""
+Revenue and enrollment analytics for finance staff.
+
+Everything is aggregated in SQL over the EnrollmentSummary table (one row
+per program / school year / status / year level, see summaries.py), so
+the cost depends on the number of programs and terms, not on the number
+of enrollments. Finished reports are cached in the shared cache under the
+current enrollment data version (for at most LOCAL_CACHE_SECONDS if the
+cache is process-local, see versioning.py). They are built from the primary,
+even in the @replica_reads analytics view.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Case, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Program, SchoolYear, EnrollmentSummary
+from . import replicas, versioning
+
+# Statuses that count towards collected revenue (pending/rejected/dropped don't)
+REVENUE_STATUSES = ('approved', 'enrolled')
+# Statuses that went through a review decision
+DECIDED_STATUSES = ('approved', 'enrolled', 'rejected', 'dropped')
+
+CACHE_TIMEOUT = 60 * 60
+
+SEMESTER_ORDER = Case(
+    When(school_year__semester='1st', then=Value(1)),
+    When(school_year__semester='2nd', then=Value(2)),
+    When(school_year__semester='summer', then=Value(3)),
+    default=Value(4),
+    output_field=IntegerField(),
+)
+
+
+def _measures():
+    return {
+        'enrollments': Coalesce(Sum('enrollment_count'), 0),
+        'assessed': Coalesce(Sum('total_fee_sum'), Decimal('0')),
+        'paying_enrollments': Coalesce(Sum('enrollment_count', filter=Q(status__in=REVENUE_STATUSES)), 0),
+        'revenue': Coalesce(Sum('total_fee_sum', filter=Q(status__in=REVENUE_STATUSES)), Decimal('0')),
+    }
+
+
+def _school_year_label(year_start, year_end, semester):
+    return f"SY {year_start}-{year_end} ({dict(SchoolYear.SEMESTER_CHOICES).get(semester, semester)})"
+
+
+# ============================================
+# REPORT
+# ============================================
+
+def get_report(school_year=None, program_type=None):
+    """Cached build_report(); the cache key changes whenever enrollment data does."""
+    version = versioning.get_version(versioning.ENROLLMENT_DATA)
+    cache_key = f'enrollments:analytics:v{version}:{school_year or "all"}:{program_type or "all"}'
+    report = cache.get(cache_key)
+    if report is None:
+        # Cached under the version just read, which a replica may not have caught up with
+        with replicas.primary_reads():
+            report = build_report(school_year=school_year, program_type=program_type)
+        cache.set(cache_key, report, versioning.cache_timeout(CACHE_TIMEOUT))
+    return report
+
+
+def build_report(school_year=None, program_type=None):
+    rows = EnrollmentSummary.objects.order_by()
+    if program_type:
+        rows = rows.filter(program__program_type=program_type)
+    # Trends always span every term; the rest honours the school year filter
+    trend_rows = rows
+    if school_year:
+        rows = rows.filter(school_year_id=school_year)
+
+    program_types = dict(Program.PROGRAM_TYPES)
+    year_levels = dict(EnrollmentSummary._meta.get_field('year_level').choices)
+
+    totals = rows.aggregate(**_measures())
+
+    by_program = list(
+        rows.values('program_id', code=F('program__code'), name=F('program__name'))
+        .annotate(**_measures())
+        .order_by('-revenue', 'code')
+    )
+
+    by_program_type = [
+        dict(row, label=program_types.get(row['program_type'], row['program_type']))
+        for row in rows.values(program_type=F('program__program_type'))
+        .annotate(**_measures())
+        .order_by('program_type')
+    ]
+
+    by_year_level = [
+        dict(row, label=year_levels.get(row['year_level'], row['year_level']))
+        for row in rows.values('year_level').annotate(**_measures()).order_by('year_level')
+    ]
+
+    return {
+        'filters': {'school_year': school_year, 'program_type': program_type},
+        'totals': totals,
+        'by_program': by_program,
+        'by_program_type': by_program_type,
+        'by_year_level': by_year_level,
+        'trend': _trend(trend_rows),
+        'pivot': _program_term_pivot(rows),
+        'funnel': _funnel(rows),
+    }
+
+
+def _trend(rows):
+    """Per-term totals in chronological order, with the change from the previous term."""
+    terms = list(
+        rows.values(
+            'school_year_id',
+            year_start=F('school_year__year_start'),
+            year_end=F('school_year__year_end'),
+            semester=F('school_year__semester'),
+        )
+        .annotate(semester_order=SEMESTER_ORDER, **_measures())
+        .order_by('year_start', 'year_end', 'semester_order')
+    )
+    previous = None
+    for term in terms:
+        term['label'] = _school_year_label(term['year_start'], term['year_end'], term['semester'])
+        term['revenue_change'] = term['revenue'] - previous['revenue'] if previous else None
+        term['enrollment_change'] = term['enrollments'] - previous['enrollments'] if previous else None
+        previous = term
+    return terms
+
+
+def _program_term_pivot(rows):
+    """Revenue matrix: one row per program, one column per term."""
+    cells = (
+        rows.values('program_id', 'school_year_id')
+        .annotate(revenue=_measures()['revenue'], enrollments=_measures()['enrollments'])
+    )
+    columns = list(
+        rows.values(
+            'school_year_id',
+            year_start=F('school_year__year_start'),
+            year_end=F('school_year__year_end'),
+            semester=F('school_year__semester'),
+        )
+        .annotate(semester_order=SEMESTER_ORDER)
+        .distinct()
+        .order_by('year_start', 'year_end', 'semester_order')
+    )
+    programs = list(
+        rows.values('program_id', code=F('program__code')).distinct().order_by('code')
+    )
+
+    matrix = {(cell['program_id'], cell['school_year_id']): cell for cell in cells}
+    empty = {'revenue': Decimal('0'), 'enrollments': 0}
+    return {
+        'columns': [
+            {'school_year_id': col['school_year_id'],
+             'label': _school_year_label(col['year_start'], col['year_end'], col['semester'])}
+            for col in columns
+        ],
+        'rows': [
+            {
+                'program_id': program['program_id'],
+                'code': program['code'],
+                'cells': [
+                    {key: matrix.get((program['program_id'], col['school_year_id']), empty)[key]
+                     for key in ('revenue', 'enrollments')}
+                    for col in columns
+                ],
+            }
+            for program in programs
+        ],
+    }
+
+
+def _funnel(rows):
+    """Counts per status plus the average submit-to-decision time in hours."""
+    statuses = dict(EnrollmentSummary._meta.get_field('status').choices)
+    per_status = {
+        row['status']: row
+        for row in rows.values('status').annotate(
+            enrollments=Coalesce(Sum('enrollment_count'), 0),
+            reviewed=Coalesce(Sum('reviewed_count'), 0),
+            avg_review_hours=Cast(Sum('review_seconds_sum'), FloatField())
+            / NullIf(Sum('reviewed_count'), 0) / 3600.0,
+        )
+    }
+    overall = rows.aggregate(
+        submitted=Coalesce(Sum('enrollment_count'), 0),
+        decided=Coalesce(Sum('enrollment_count', filter=Q(status__in=DECIDED_STATUSES)), 0),
+        accepted=Coalesce(Sum('enrollment_count', filter=Q(status__in=REVENUE_STATUSES)), 0),
+        avg_review_hours=Cast(Sum('review_seconds_sum'), FloatField())
+        / NullIf(Sum('reviewed_count'), 0) / 3600.0,
+    )
+    overall['acceptance_rate'] = (
+        round(overall['accepted'] * 100.0 / overall['decided'], 1) if overall['decided'] else None
+    )
+
+    stages = []
+    for status, label in statuses.items():
+        row = per_status.get(status, {})
+        stages.append({
+            'status': status,
+            'label': label,
+            'enrollments': row.get('enrollments', 0),
+            'reviewed': row.get('reviewed', 0),
+            'avg_review_hours': row.get('avg_review_hours'),
+        })
+    return {'overall': overall, 'stages': stages}
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class EnrollmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'enrollments'
+
+    def ready(self):
+        # Register signal handlers (summary tables, etc.)
+        from . import signals  # noqa: F401
+
+        from django.conf import settings
+
+        if getattr(settings, 'TRACING_ENABLED', False):
+            from . import tracing
+
+            tracing.install()
@@ -0,0 +1,141 @@
+"""
+Archival of closed school years.
+
+Enrollments and notifications of inactive school years are moved out of the
+hot Enrollment / Notification tables into ArchivedEnrollment /
+ArchivedNotification, in batches that each commit on their own, so an
+interrupted run simply continues where it stopped. Rows keep their ids
+and enrollment IDs.
+
+Archiving is a move, not a delete: the enrollment summaries keep counting
+archived rows and nothing is written to the change feed.
+
+Lookups that may concern past terms should go through the router helpers
+at the bottom (enrollments_for_school_year, find_enrollment,
+student_enrollment_history) rather than Enrollment.objects directly.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import inbox
+from .models import SchoolYear, Enrollment, Notification, ArchivedEnrollment, ArchivedNotification, OutboundEmail
+
+DEFAULT_BATCH_SIZE = 500
+
+ENROLLMENT_COLUMNS = [
+    'id', 'enrollment_id', 'student_id', 'program_id', 'school_year_id', 'year_level', 'status',
+    'reviewed_by_id', 'reviewed_at', 'admin_notes', 'total_fee', 'created_at', 'updated_at', 'version',
+]
+NOTIFICATION_COLUMNS = [
+    'id', 'user_id', 'notification_type', 'enrollment_id', 'message', 'is_read', 'created_at',
+]
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archivable_school_years():
+    return SchoolYear.objects.filter(is_active=False)
+
+
+# ============================================
+# MOVING ROWS
+# ============================================
+
+def archive_school_year(school_year, batch_size=DEFAULT_BATCH_SIZE, stdout=None):
+    """Move one inactive school year to the archive. Returns the number of enrollments moved."""
+    if school_year.is_active:
+        raise ArchiveError(f'{school_year} is still active; deactivate it before archiving.')
+
+    moved = 0
+    while True:
+        count = _archive_batch(school_year, batch_size)
+        if not count:
+            break
+        moved += count
+        if stdout:
+            stdout.write(f'  {school_year}: {moved} enrollment(s) archived')
+
+    SchoolYear.objects.filter(pk=school_year.pk).update(archived_at=timezone.now())
+    return moved
+
+
+def _archive_batch(school_year, batch_size):
+    with transaction.atomic():
+        rows = list(
+            Enrollment.objects.select_for_update()
+            .filter(school_year=school_year)
+            .order_by('pk')
+            .values(*ENROLLMENT_COLUMNS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ids = [row['id'] for row in rows]
+        now = timezone.now()
+
+        # ignore_conflicts: a crashed earlier run may have copied some rows already
+        ArchivedEnrollment.objects.bulk_create(
+            [ArchivedEnrollment(archived_at=now, **row) for row in rows], ignore_conflicts=True
+        )
+        # The sections taken, from the M2M table (which also has to be emptied
+        # before the enrollments go)
+        hot_sections = Enrollment.sections.through.objects.filter(enrollment_id__in=ids)
+        ArchivedEnrollment.sections.through.objects.bulk_create(
+            [
+                ArchivedEnrollment.sections.through(archivedenrollment_id=enrollment_id, section_id=section_id)
+                for enrollment_id, section_id in hot_sections.values_list('enrollment_id', 'section_id')
+            ],
+            ignore_conflicts=True,
+        )
+        notifications = Notification.objects.filter(enrollment_id__in=ids)
+        # The archive has no watermarks, so settle each row's read state now
+        notification_rows = inbox.apply_watermarks(list(notifications.values(*NOTIFICATION_COLUMNS)))
+        ArchivedNotification.objects.bulk_create(
+            [ArchivedNotification(archived_at=now, **row) for row in notification_rows],
+            ignore_conflicts=True,
+        )
+
+        # _raw_delete skips the delete signals on purpose: the rows are moved,
+        # so summaries must not be decremented and the change feed must not
+        # announce deletes
+        notifications._raw_delete(notifications.db)
+        hot_sections._raw_delete(hot_sections.db)
+        # Queued and sent decision e-mails outlive the enrollment (SET_NULL,
+        # which _raw_delete doesn't apply)
+        OutboundEmail.objects.filter(enrollment_id__in=ids).update(enrollment=None)
+        hot = Enrollment.objects.filter(pk__in=ids)
+        hot._raw_delete(hot.db)
+        return len(ids)
+
+
+# ============================================
+# QUERY-TIME ROUTING
+# ============================================
+
+def is_archived(school_year):
+    return school_year is not None and school_year.archived_at is not None
+
+
+def enrollments_for_school_year(school_year):
+    """The table that holds `school_year`'s enrollments."""
+    if is_archived(school_year):
+        return ArchivedEnrollment.objects.filter(school_year=school_year)
+    return Enrollment.objects.filter(school_year=school_year)
+
+
+def find_enrollment(enrollment_id):
+    """Look an enrollment up by its ENR-... ID in the hot table, then the archive."""
+    return (
+        Enrollment.objects.filter(enrollment_id=enrollment_id).first()
+        or ArchivedEnrollment.objects.filter(enrollment_id=enrollment_id).first()
+    )
+
+
+def student_enrollment_history(student):
+    """A student's archived enrollments, newest term first."""
+    return (
+        ArchivedEnrollment.objects.filter(student=student)
+        .select_related('program', 'school_year', 'reviewed_by')
+        .order_by('-school_year__year_start', '-created_at')
+    )
@@ -0,0 +1,108 @@
+"""
+Change feed for downstream systems (finance, LMS).
+
+Every insert, update and delete of the tracked models is appended to
+ChangeLogEntry by the signal handlers in signals.py. Consumers remember the
+last sequence number they processed and ask for everything after it,
+instead of re-pulling whole tables.
+
+Sequence numbers are allocated when a row is written but become visible at
+commit, so a slow transaction can commit a lower number after a higher one
+is already visible. fetch() therefore stops at the first missing number: the
+entries before it are complete, and a consumer resuming from them can't skip
+a late commit. A number still missing once the entry after it is older than
+CHANGE_FEED_SETTLE_SECONDS (the longest a transaction writing tracked rows
+may stay open) belonged to a rolled-back transaction, and the feed moves
+past it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from .models import Student, Program, SchoolYear, Enrollment, ChangeLogEntry
+
+TRACKED_MODELS = (Student, Program, SchoolYear, Enrollment)
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+
+
+def settle_seconds():
+    return getattr(settings, 'CHANGE_FEED_SETTLE_SECONDS', 60)
+
+
+def clamp_limit(limit):
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _entry(instance, action):
+    data = None
+    if action != 'delete':
+        # Column values as the database sees them (file fields become their
+        # name); the JSONField encoder takes care of dates/decimals
+        data = {
+            field.attname: field.get_prep_value(field.value_from_object(instance))
+            for field in instance._meta.concrete_fields
+            if not field.primary_key
+        }
+    return ChangeLogEntry(
+        model=instance._meta.label_lower,
+        object_pk=str(instance.pk),
+        action=action,
+        data=data,
+    )
+
+
+def record(instance, action):
+    _entry(instance, action).save()
+
+
+def record_many(instances, action, batch_size=1000):
+    """record() for rows written with bulk_create / update, which send no signals."""
+    ChangeLogEntry.objects.bulk_create([_entry(instance, action) for instance in instances], batch_size=batch_size)
+
+
+def fetch(after=0, limit=DEFAULT_LIMIT, models=None, settle=None):
+    """
+    Entries with a sequence number greater than `after`, oldest first.
+    `models` optionally restricts the feed to labels like 'enrollments.enrollment'.
+    """
+    limit = clamp_limit(limit)
+    settle = settle_seconds() if settle is None else settle
+
+    entries = ChangeLogEntry.objects.filter(id__gt=after)
+    if settle:
+        gap = _first_open_gap(after, settle)
+        if gap is not None:
+            entries = entries.filter(id__lt=gap)
+    if models:
+        entries = entries.filter(model__in=[m.lower() for m in models])
+    return entries.order_by('id')[:limit]
+
+
+def _first_open_gap(after, settle):
+    """
+    The lowest sequence number after `after` whose predecessor is missing and
+    may still be committed, i.e. the entry was written less than `settle`
+    seconds ago (None if there is no such gap).
+    """
+    predecessor = ChangeLogEntry.objects.filter(id=OuterRef('id') - 1)
+    return (
+        ChangeLogEntry.objects
+        .filter(id__gt=after + 1, changed_at__gt=timezone.now() - timedelta(seconds=settle))
+        .filter(~Exists(predecessor))
+        .aggregate(gap=Min('id'))['gap']
+    )
+
+
+def entry_to_dict(entry):
+    return {
+        'seq': entry.id,
+        'model': entry.model,
+        'pk': entry.object_pk,
+        'action': entry.action,
+        'changed_at': entry.changed_at,
+        'data': entry.data,
+    }
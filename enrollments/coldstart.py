@@ -0,0 +1,99 @@
+"""
+Cold-start mode for the serverless entry point.
+
+On Vercel every lambda starts from a fresh interpreter, and the first
+request pays for django.setup(), the URLconf, the views and every template
+it renders. With COLD_START_MODE on (the default when VERCEL is set),
+settings.py:
+
+  * drops apps nothing uses at runtime (django.contrib.humanize),
+  * installs the admin without autodiscovery; admin.py modules are
+    imported the first time an admin URL is resolved or reversed
+    (lazy_include() and enrollment_system/admin_urls.py),
+  * renders through the cached template loader,
+
+and wsgi.py calls prewarm() once the application is loaded, so the URLconf
+and views are imported and the landing pages' templates are compiled into
+the cached loader before the first request is handed over.
+
+`manage.py coldstart_report` measures the difference.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import URLResolver, get_resolver
+from django.urls.resolvers import RoutePattern
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# DEFERRED URLCONFS
+# ============================================
+
+class LazyURLResolver(URLResolver):
+    """
+    A namespaced URLResolver whose module is imported the first time one of
+    its URLs is resolved or reversed. A plain include() is imported with the
+    root URLconf, and populating the root for the first {% url %} would
+    import it too.
+    """
+
+    def _populate(self):
+        if 'urlconf_module' in self.__dict__:
+            super()._populate()
+
+    def _reverse_with_prefix(self, *args, **kwargs):
+        self.urlconf_module  # import it now
+        return super()._reverse_with_prefix(*args, **kwargs)
+
+
+def lazy_include(route, urlconf_name, namespace):
+    """path(route, include((urlconf_name, namespace))), but deferred. Use in urlpatterns."""
+    return LazyURLResolver(RoutePattern(route, is_endpoint=False), urlconf_name,
+                           app_name=namespace, namespace=namespace)
+
+
+# ============================================
+# PREWARMING
+# ============================================
+
+# What the landing pages (login, dashboard) render. Compiling every template
+# up front costs more than a typical first request saves.
+PREWARM_TEMPLATES = (
+    'base.html',
+    'atomic/organisms/header.html',
+    'atomic/organisms/messages.html',
+    'atomic/organisms/footer.html',
+    'registration/login.html',
+    'enrollments/dashboard.html',
+    'atomic/molecules/enrollment_card.html',
+    'atomic/molecules/program_card.html',
+)
+
+
+def prewarm_templates():
+    return list(getattr(settings, 'COLD_START_PREWARM_TEMPLATES', PREWARM_TEMPLATES))
+
+
+def prewarm():
+    """Import the URLconf and views and fill the cached template loader. Returns timings in ms."""
+    timings = {}
+
+    started = time.perf_counter()
+    get_resolver().urlconf_module  # imports the project urls and the views behind them
+    timings['urlconf'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    engine = engines['django'].engine
+    for name in prewarm_templates():
+        try:
+            # Goes through the cached loader, which keeps the compiled template
+            engine.get_template(name)
+        except (TemplateDoesNotExist, TemplateSyntaxError):
+            # Let the request that needs it report the error
+            logger.warning('Could not prewarm template %s.', name, exc_info=True)
+    timings['templates'] = (time.perf_counter() - started) * 1000
+    return timings
@@ -0,0 +1,235 @@
+"""
+Cached dashboard snapshots.
+
+dashboard_view used to recompute the same counts, recent enrollments and
+programs on every load, although a student's data changes a few times a
+term. The template context now comes from snapshots in the shared cache:
+
+  * one per user: a student's counts, last five enrollments and available
+    programs, plus anyone's unread notification count;
+  * one shared by all staff: the admin totals and pending approvals.
+
+Keys carry data versions (versioning.py), so nothing is ever deleted. A
+change makes the old key unreachable, and the next load rebuilds lazily.
+signals.py bumps a user's version when their enrollments, notifications or
+profile change. Program / school year changes bump REFERENCE_DATA, which is
+in every key. Staff snapshots follow ENROLLMENT_DATA and STUDENT_DATA.
+Snapshots are built from the primary even in the @replica_reads dashboard
+view, so a lagging replica's rows never get cached under a new version.
+
+Stampedes: when a snapshot is missing, one request (the one that wins a
+cache.add lock) builds it, and the others wait briefly for it. Live
+snapshots are refreshed a little before they expire, with a probability
+that grows as expiry nears and with the build cost ("XFetch"). Meanwhile
+everyone else keeps getting the current copy. Timeouts are jittered, so
+keys written together don't all expire together.
+
+A snapshot is only invalidated everywhere when the cache is shared by all
+processes (settings.CACHES). With a process-local cache another process's
+bump is never seen, so snapshots expire after versioning.LOCAL_CACHE_SECONDS
+instead of DASHBOARD_CACHE_SECONDS.
+
+stats() reports hits, misses and the hit ratio per snapshot kind, for this
+process (see the ops/dashboard-cache/ view).
+"""
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from . import inbox, reference, replicas, summaries, versioning
+from .models import Student, Enrollment
+
+RECENT_ENROLLMENTS = 5
+AVAILABLE_PROGRAMS = 6
+
+# How much earlier than "just in time" a live snapshot may be rebuilt
+# (1.0 is the usual XFetch setting)
+EARLY_REFRESH_BETA = 1.0
+TIMEOUT_JITTER = 0.1
+LOCK_SECONDS = 10
+WAIT_SECONDS = 0.5
+WAIT_STEP_SECONDS = 0.02
+
+
+def _timeout():
+    return versioning.cache_timeout(getattr(settings, 'DASHBOARD_CACHE_SECONDS', 15 * 60))
+
+
+def invalidate_user(user_id):
+    """Make a user's snapshot stale once the current transaction commits."""
+    if user_id:
+        transaction.on_commit(lambda: versioning.bump_version(versioning.user_namespace(user_id)))
+
+
+def invalidate_users(user_ids):
+    """invalidate_user() for many users at once (bulk writes send no signals)."""
+    user_ids = [user_id for user_id in set(user_ids) if user_id]
+
+    def bump():
+        for user_id in user_ids:
+            versioning.bump_version(versioning.user_namespace(user_id))
+
+    if user_ids:
+        transaction.on_commit(bump)
+
+
+# ============================================
+# INSTRUMENTATION
+# ============================================
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+COUNTERS = ('hits', 'misses', 'stale_served', 'early_refreshes', 'waited', 'build_ms_total')
+
+
+def _count(kind, counter, amount=1):
+    with _stats_lock:
+        kind_stats = _stats.setdefault(kind, dict.fromkeys(COUNTERS, 0))
+        kind_stats[counter] += amount
+
+
+def stats():
+    """{kind: counters + hit_ratio} for this process."""
+    with _stats_lock:
+        snapshot = {kind: dict(counters) for kind, counters in _stats.items()}
+    for counters in snapshot.values():
+        # Served from the cache: plain hits, stale-while-refreshing, and
+        # waits that ended with someone else's fresh snapshot
+        served = counters['hits'] + counters['stale_served'] + counters['waited']
+        total = served + counters['misses'] + counters['early_refreshes']
+        builds = counters['misses'] + counters['early_refreshes']
+        counters['hit_ratio'] = served / total if total else None
+        counters['build_ms_avg'] = counters['build_ms_total'] / builds if builds else 0.0
+    return snapshot
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# ============================================
+# CACHE WITH STAMPEDE PROTECTION
+# ============================================
+
+def _get_or_build(kind, key, build):
+    entry = cache.get(key)
+    lock_key = f'{key}:lock'
+    if entry is not None:
+        value, expires_at, build_seconds = entry
+        # XFetch: -log(random()) is usually small, so this only fires close to expiry
+        if time.time() - build_seconds * EARLY_REFRESH_BETA * math.log(random.random() or 1e-12) < expires_at:
+            _count(kind, 'hits')
+            return value
+        if not cache.add(lock_key, 1, LOCK_SECONDS):
+            _count(kind, 'stale_served')
+            return value
+        _count(kind, 'early_refreshes')
+    elif not cache.add(lock_key, 1, LOCK_SECONDS):
+        # Someone else is building it: wait a little rather than pile on
+        deadline = time.monotonic() + WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP_SECONDS)
+            entry = cache.get(key)
+            if entry is not None:
+                _count(kind, 'waited')
+                return entry[0]
+        _count(kind, 'misses')
+        return _build_and_store(kind, key, build)
+    else:
+        _count(kind, 'misses')
+
+    try:
+        return _build_and_store(kind, key, build)
+    finally:
+        cache.delete(lock_key)
+
+
+def _build_and_store(kind, key, build):
+    started = time.perf_counter()
+    # The key carries the versions just read; a replica may not have those writes yet
+    with replicas.primary_reads():
+        value = build()
+    build_seconds = time.perf_counter() - started
+    _count(kind, 'build_ms_total', build_seconds * 1000)
+
+    timeout = _timeout() * (1 - TIMEOUT_JITTER * random.random())
+    cache.set(key, (value, time.time() + timeout, build_seconds), timeout)
+    return value
+
+
+# ============================================
+# SNAPSHOTS
+# ============================================
+
+def _build_user_snapshot(user):
+    snapshot = {'unread_notifications': inbox.unread_count(user)}
+    if user.is_staff:
+        return snapshot
+
+    student = Student.objects.filter(user=user).first()
+    if student:
+        counts = dict(
+            Enrollment.objects.filter(student=student).order_by()
+            .values_list('status').annotate(n=Count('pk'))
+        )
+        recent = list(
+            Enrollment.objects.filter(student=student)
+            .select_related('student', 'program', 'school_year', 'reviewed_by')[:RECENT_ENROLLMENTS]
+        )
+    else:
+        counts, recent = {}, []
+    snapshot.update({
+        'has_student_profile': student is not None,
+        'pending_count': counts.get('pending', 0),
+        'approved_count': counts.get('approved', 0),
+        'enrolled_count': counts.get('enrolled', 0),
+        'recent_enrollments': recent,
+        'available_programs': list(reference.active_programs()[:AVAILABLE_PROGRAMS]),
+    })
+    return snapshot
+
+
+def _build_admin_snapshot():
+    # Read the totals from the summary table instead of counting live rows
+    status_counts = summaries.status_counts()
+    return {
+        'total_students': Student.objects.count(),
+        'total_programs': len(reference.active_programs()),
+        'pending_enrollments': status_counts.get('pending', 0),
+        'approved_enrollments': status_counts.get('approved', 0),
+        'recent_enrollments': list(
+            Enrollment.objects.filter(status='pending')
+            .select_related('student', 'program', 'school_year', 'reviewed_by')
+            .order_by('-created_at')[:RECENT_ENROLLMENTS]
+        ),
+    }
+
+
+def dashboard_context(user):
+    """The dashboard template context for `user`, from cached snapshots."""
+    reference_version = reference.version()
+    user_version = versioning.get_version(versioning.user_namespace(user.pk))
+    kind = 'admin-user' if user.is_staff else 'student'
+    context = dict(_get_or_build(
+        kind,
+        f'enrollments:dashboard:{kind}:{user.pk}:u{user_version}:r{reference_version}',
+        lambda: _build_user_snapshot(user),
+    ))
+    if user.is_staff:
+        enrollment_version = versioning.get_version(versioning.ENROLLMENT_DATA)
+        student_version = versioning.get_version(versioning.STUDENT_DATA)
+        context.update(_get_or_build(
+            'admin',
+            f'enrollments:dashboard:admin:e{enrollment_version}:s{student_version}:r{reference_version}',
+            _build_admin_snapshot,
+        ))
+    context['is_admin'] = user.is_staff
+    return context
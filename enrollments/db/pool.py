@@ -0,0 +1,300 @@
+"""
+Database connection pooling.
+
+configure_pooling() is called from settings.py for every configured
+database and picks one of:
+
+  * psycopg 3 with psycopg_pool installed: Django's native PostgreSQL pool
+    (OPTIONS['pool']), using psycopg_pool's own health check.
+  * anything else (psycopg2, SQLite): the PooledConnectionMixin backends in
+    this package, which keep a small per-process pool of DB-API connections.
+    Django still "closes" the connection at the end of every request, but
+    the close hands it back to the pool instead of tearing it down.
+
+In both cases the pool is per worker process, so the total connections a
+deployment can open is workers x DB_POOL['MAX_SIZE']. On serverless
+(Vercel) keep MIN_SIZE at 0 and MAX_SIZE small.
+
+The time requests spend waiting for a connection is recorded per alias and
+available from pool_stats().
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MIN_SIZE': 0,
+    'MAX_SIZE': 4,           # per worker process
+    'TIMEOUT': 10.0,         # seconds to wait for a free connection
+    'MAX_IDLE': 300.0,       # close connections idle for longer than this
+    'MAX_LIFETIME': 3600.0,  # recycle connections older than this
+    'CHECK_INTERVAL': 30.0,  # health-check connections idle for longer than this
+    'SLOW_WAIT_MS': 100.0,   # log acquisitions slower than this
+}
+
+NATIVE_POOL_ENGINES = ('django.db.backends.postgresql',)
+LOCAL_POOL_ENGINES = {
+    'django.db.backends.sqlite3': 'enrollments.db.sqlite3',
+    'django.db.backends.postgresql': 'enrollments.db.postgresql',
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# ============================================
+# SETTINGS
+# ============================================
+
+def pool_settings(overrides=None):
+    """DEFAULTS overridden by DB_POOL_* environment variables and `overrides`."""
+    config = dict(DEFAULTS)
+    for key, default in DEFAULTS.items():
+        value = os.getenv(f'DB_POOL_{key}')
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            config[key] = value.lower() in ('1', 'true', 'yes')
+        else:
+            config[key] = type(default)(value)
+    config.update(overrides or {})
+    return config
+
+
+def _native_pool_available():
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def configure_pooling(db, config):
+    """Rewrite one DATABASES entry in place according to the pool `config`."""
+    if not config['ENABLED']:
+        # Persistent connections: at least make sure a dead one isn't reused
+        db['CONN_HEALTH_CHECKS'] = True
+        return db
+
+    # With a pool, "closing" at the end of each request is what returns the connection
+    db['CONN_MAX_AGE'] = 0
+    db['CONN_HEALTH_CHECKS'] = False
+    engine = db['ENGINE']
+
+    if engine in NATIVE_POOL_ENGINES and _native_pool_available():
+        from psycopg_pool import ConnectionPool
+
+        db.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': config['MIN_SIZE'],
+            'max_size': config['MAX_SIZE'],
+            'timeout': config['TIMEOUT'],
+            'max_idle': config['MAX_IDLE'],
+            'max_lifetime': config['MAX_LIFETIME'],
+            'check': ConnectionPool.check_connection,
+        }
+    elif engine in LOCAL_POOL_ENGINES:
+        db['ENGINE'] = LOCAL_POOL_ENGINES[engine]
+        db['POOL'] = config
+    return db
+
+
+# ============================================
+# LOCAL POOL
+# ============================================
+
+class LocalPool:
+    """A bounded, thread-safe LIFO pool of DB-API connections."""
+
+    def __init__(self, alias, config):
+        self.alias = alias
+        self.config = config
+        self._idle = deque()     # (connection, created_at, last_used_at)
+        self._created = {}       # id(connection) -> created_at
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'acquired': 0,
+            'created': 0,
+            'closed': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+        }
+
+    def acquire(self, connect):
+        """Return (connection, needs_check), opening one with `connect()` if the pool has room."""
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.config['TIMEOUT']
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    connection, created_at, last_used_at = self._idle.pop()
+                    if (now - created_at > self.config['MAX_LIFETIME']
+                            or now - last_used_at > self.config['MAX_IDLE']):
+                        self._discard(connection)
+                        continue
+                    self._record_wait(started)
+                    return connection, now - last_used_at > self.config['CHECK_INTERVAL']
+
+                if self._size < self.config['MAX_SIZE']:
+                    self._size += 1
+                    break
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No connection available in the '{self.alias}' pool after {self.config['TIMEOUT']}s "
+                        f"(max_size={self.config['MAX_SIZE']})."
+                    )
+                self._cond.wait(remaining)
+
+        # Open the new connection outside the lock
+        try:
+            connection = connect()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created[id(connection)] = time.monotonic()
+            self.stats['created'] += 1
+            self._record_wait(started)
+        return connection, False
+
+    def release(self, connection):
+        try:
+            # Never hand out a connection with a half-finished transaction
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        with self._cond:
+            created_at = self._created.get(id(connection), time.monotonic())
+            self._idle.append((connection, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, connection):
+        with self._cond:
+            self._discard(connection)
+            self._cond.notify()
+
+    def _discard(self, connection):
+        # Caller holds the lock
+        self._created.pop(id(connection), None)
+        self._size -= 1
+        self.stats['closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _record_wait(self, started):
+        # Caller holds the lock
+        wait_ms = (time.perf_counter() - started) * 1000
+        self.stats['acquired'] += 1
+        self.stats['wait_ms_total'] += wait_ms
+        self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+        if wait_ms > self.config['SLOW_WAIT_MS']:
+            logger.warning("Waited %.1f ms for a '%s' database connection.", wait_ms, self.alias)
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.config['MAX_SIZE'],
+                'wait_ms_avg': stats['wait_ms_total'] / stats['acquired'] if stats['acquired'] else 0.0,
+            })
+        return stats
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(alias, config):
+    global _pools_pid
+    with _pools_lock:
+        if os.getpid() != _pools_pid:
+            # Forked worker: connections opened by the parent must not be shared
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = LocalPool(alias, config)
+        return pool
+
+
+class PooledConnectionMixin:
+    """DatabaseWrapper mixin that borrows connections from a LocalPool."""
+
+    def _pool(self):
+        config = self.settings_dict.get('POOL')
+        if not config or not config.get('ENABLED') or getattr(self, 'is_in_memory_db', lambda: False)():
+            return None
+        return get_pool(self.alias, config)
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        connect = super().get_new_connection
+        while True:
+            connection, needs_check = pool.acquire(lambda: connect(conn_params))
+            if not needs_check or self._connection_alive(connection):
+                return connection
+            pool.stats['health_check_failures'] += 1
+            pool.discard(connection)
+
+    @staticmethod
+    def _connection_alive(connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _close(self):
+        pool = self._pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        pool.release(self.connection)
+
+
+# ============================================
+# METRICS
+# ============================================
+
+def pool_stats():
+    """{alias: stats} for every database that uses a pool."""
+    from django.db import connections
+
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        native = getattr(connection, 'pool', None)
+        if native is not None:
+            # psycopg_pool reports its own wait time (requests_wait_ms, ...)
+            stats[alias] = {'backend': 'psycopg_pool', **native.get_stats()}
+        elif isinstance(connection, PooledConnectionMixin) and connection._pool() is not None:
+            stats[alias] = {'backend': 'local', **connection._pool().snapshot()}
+    return stats
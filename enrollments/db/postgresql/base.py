@@ -0,0 +1,9 @@
+# Pooled psycopg2 backend; with psycopg 3 + psycopg_pool installed the stock
+# backend's native pool is used instead (see enrollments/db/pool.py)
+from django.db.backends.postgresql import base
+
+from ..pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,155 @@
+"""
+SQLite production profile.
+
+Django's stock SQLite setup is tuned for one process: in the default
+rollback-journal mode a commit blocks every reader, and a transaction that
+reads before it writes can fail at once with "database is locked" when
+another connection got the write lock first (SQLite won't wait when waiting
+could deadlock). configure_sqlite() is called from settings.py for every
+SQLite database and, with DB_SQLITE['ENABLED'], runs on each new connection:
+
+  * journal_mode=WAL: readers and the writer no longer block each other;
+    only writers queue. (Stored in the database file, so it sticks.)
+  * synchronous=NORMAL: commits skip the fsync. In WAL mode a power cut can
+    lose the last commits but can't corrupt the database.
+  * busy_timeout: how long a writer queues for the lock before giving up.
+  * mmap_size, cache_size, temp_store: reads served from the page cache /
+    memory map instead of read() calls; temp b-trees (sorts) in memory.
+  * journal_size_limit: the WAL file is truncated back to this after a
+    checkpoint, instead of staying at its high-water mark.
+
+and opens transactions (atomic()) with BEGIN IMMEDIATE, which takes the
+write lock up front: a transaction waits its turn (busy_timeout) instead of
+failing at its first write.
+
+The WAL is copied back into the database by automatic checkpoints every
+wal_autocheckpoint pages, but a checkpoint can't get past pages that a
+running read still uses, so under steady traffic the WAL keeps growing.
+Run `manage.py checkpoint_sqlite` from cron (TRUNCATE mode at a quiet
+hour) to catch up.
+
+Every DB_SQLITE key can be overridden with a DB_SQLITE_* environment
+variable; DB_SQLITE_ENABLED=False gives Django's stock behaviour.
+"""
+import os
+
+DEFAULTS = {
+    'ENABLED': True,
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'BUSY_TIMEOUT_MS': 5000,
+    'MMAP_SIZE': 256 * 1024 * 1024,        # bytes, per database (shared by the OS page cache)
+    'CACHE_SIZE_KB': 32 * 1024,            # per connection
+    'TEMP_STORE': 'MEMORY',
+    'WAL_AUTOCHECKPOINT': 1000,            # pages
+    'JOURNAL_SIZE_LIMIT': 64 * 1024 * 1024,
+    'TRANSACTION_MODE': 'IMMEDIATE',
+}
+
+SQLITE_ENGINES = ('django.db.backends.sqlite3', 'enrollments.db.sqlite3')
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+# ============================================
+# SETTINGS
+# ============================================
+
+def sqlite_settings(overrides=None):
+    """DEFAULTS overridden by DB_SQLITE_* environment variables and `overrides`."""
+    config = dict(DEFAULTS)
+    for key, default in DEFAULTS.items():
+        value = os.getenv(f'DB_SQLITE_{key}')
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            config[key] = value.lower() in ('1', 'true', 'yes')
+        else:
+            config[key] = type(default)(value)
+    config.update(overrides or {})
+    return config
+
+
+def init_command(config):
+    """The PRAGMAs run on every new connection, as one OPTIONS['init_command'] string."""
+    pragmas = [
+        # First, so the journal_mode switch below waits for the lock too
+        f"busy_timeout = {int(config['BUSY_TIMEOUT_MS'])}",
+        f"journal_mode = {config['JOURNAL_MODE']}",
+        f"synchronous = {config['SYNCHRONOUS']}",
+        f"mmap_size = {int(config['MMAP_SIZE'])}",
+        # Negative means KiB rather than pages
+        f"cache_size = -{int(config['CACHE_SIZE_KB'])}",
+        f"temp_store = {config['TEMP_STORE']}",
+        f"wal_autocheckpoint = {int(config['WAL_AUTOCHECKPOINT'])}",
+        f"journal_size_limit = {int(config['JOURNAL_SIZE_LIMIT'])}",
+    ]
+    return ' '.join(f'PRAGMA {pragma};' for pragma in pragmas)
+
+
+def configure_sqlite(db, config):
+    """Rewrite one DATABASES entry in place according to the SQLite `config`."""
+    if db['ENGINE'] not in SQLITE_ENGINES:
+        return db
+    options = db.setdefault('OPTIONS', {})
+    # dj_database_url adds this for ssl_require=True; sqlite3.connect() rejects it
+    options.pop('sslmode', None)
+    if not config['ENABLED']:
+        return db
+
+    options['init_command'] = init_command(config)
+    options['transaction_mode'] = config['TRANSACTION_MODE']
+    # sqlite3.connect()'s own busy handler; the PRAGMA above replaces it, keep them equal
+    options['timeout'] = config['BUSY_TIMEOUT_MS'] / 1000
+    return db
+
+
+# ============================================
+# INSPECTION AND CHECKPOINTS
+# ============================================
+
+REPORTED_PRAGMAS = (
+    'journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store',
+    'wal_autocheckpoint', 'journal_size_limit',
+)
+
+
+def current_pragmas(alias='default'):
+    """{pragma: value} as the connection for `alias` actually runs with."""
+    from django.db import connections
+
+    with connections[alias].cursor() as cursor:
+        values = {}
+        for pragma in REPORTED_PRAGMAS:
+            cursor.execute(f'PRAGMA {pragma}')
+            row = cursor.fetchone()
+            # Some return nothing for an in-memory database (mmap_size)
+            values[pragma] = row[0] if row else None
+    return values
+
+
+def wal_size(alias='default'):
+    """Bytes in the -wal file next to the database, 0 if there is none."""
+    from django.db import connections
+
+    try:
+        return os.path.getsize(f"{connections[alias].settings_dict['NAME']}-wal")
+    except OSError:
+        return 0
+
+
+def checkpoint(alias='default', mode='PASSIVE'):
+    """Run a WAL checkpoint; {'busy', 'wal_pages', 'checkpointed_pages'} as SQLite reports them.
+
+    busy is 1 when a FULL / RESTART / TRUNCATE checkpoint couldn't finish
+    because of readers or a writer (after waiting busy_timeout). The page
+    counts are -1 when the database isn't in WAL mode.
+    """
+    from django.db import connections
+
+    mode = mode.upper()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"Unknown checkpoint mode {mode!r}; use one of {', '.join(CHECKPOINT_MODES)}.")
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+        busy, wal_pages, checkpointed_pages = cursor.fetchone()
+    return {'busy': busy, 'wal_pages': wal_pages, 'checkpointed_pages': checkpointed_pages}
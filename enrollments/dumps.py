@@ -0,0 +1,257 @@
+"""
+Fast restore of `manage.py dumpdata` JSON files.
+
+The dumps shipped with the project (data.json, data_clean.json, ...) were
+produced on Windows, so they may be UTF-16 or UTF-8 with a BOM, which
+loaddata can't read. restore() streams the file instead of parsing it in
+one go, spools objects per model to temporary files, and then inserts
+each model in dependency order with bulk_create. No model save() methods
+or signals run, so derived data (enrollment summaries) is rebuilt at the
+end.
+"""
+import codecs
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+# ============================================
+# READING
+# ============================================
+
+def detect_encoding(path):
+    """Guess a dump's text encoding from its BOM (or its first bytes)."""
+    with open(path, 'rb') as fh:
+        head = fh.read(4)
+
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith(codecs.BOM_UTF32_LE) or head.startswith(codecs.BOM_UTF32_BE):
+        return 'utf-32'
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    # No BOM: JSON starts with an ASCII character, so NUL bytes give UTF-16 away
+    if len(head) >= 2 and head[0] == 0 and head[1] != 0:
+        return 'utf-16-be'
+    if len(head) >= 2 and head[0] != 0 and head[1] == 0:
+        return 'utf-16-le'
+    return 'utf-8'
+
+
+def iter_dump_objects(path, encoding=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the objects of a top-level JSON array one at a time, reading the
+    file in chunks so memory use is bounded by the largest single object.
+    """
+    decoder = json.JSONDecoder()
+    encoding = encoding or detect_encoding(path)
+
+    with open(path, encoding=encoding) as fh:
+        buffer = ''
+        pos = 0
+        started = False
+        eof = False
+
+        while True:
+            # Skip whitespace, the opening bracket and separators
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ','
+                                         or (not started and buffer[pos] == '[')):
+                if buffer[pos] == '[':
+                    started = True
+                pos += 1
+
+            if pos < len(buffer):
+                if not started:
+                    raise ValueError(f'{path}: expected a JSON array of objects')
+                if buffer[pos] == ']':
+                    return
+                try:
+                    obj, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield obj
+                    pos = end
+                    continue
+            elif eof:
+                if started:
+                    raise ValueError(f'{path}: unexpected end of file')
+                return
+
+            # Need more text: drop what has been consumed and read the next chunk
+            chunk = fh.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+
+# ============================================
+# RESTORING
+# ============================================
+
+class _Spool:
+    """Per-model temporary JSON-lines files, so the dump is only read once."""
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='restore-dump-')
+        self.files = OrderedDict()
+        self.counts = {}
+
+    def add(self, obj):
+        label = obj['model'].lower()
+        fh = self.files.get(label)
+        if fh is None:
+            fh = self.files[label] = open(os.path.join(self.directory, f'{label}.jsonl'), 'w+', encoding='utf-8')
+            self.counts[label] = 0
+        fh.write(json.dumps(obj, separators=(',', ':')))
+        fh.write('\n')
+        self.counts[label] += 1
+
+    def read(self, label, batch_size):
+        fh = self.files[label]
+        fh.flush()
+        fh.seek(0)
+        batch = []
+        for line in fh:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        for fh in self.files.values():
+            fh.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _dependency_order(labels):
+    models = [apps.get_model(label) for label in labels]
+    by_app = OrderedDict()
+    for model in models:
+        by_app.setdefault(model._meta.app_config, []).append(model)
+    return serializers.sort_dependencies(list(by_app.items()), allow_cycles=True)
+
+
+@contextmanager
+def _raw_timestamps(model):
+    # bulk_create runs Field.pre_save(), which would stamp auto_now /
+    # auto_now_add fields with the current time instead of the dumped values
+    fields = [f for f in model._meta.concrete_fields
+              if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def _insert_batch(model, batch, using):
+    objects, m2m = [], []
+    for deserialized in PythonDeserializer(batch, using=using, ignorenonexistent=True):
+        objects.append(deserialized.object)
+        if deserialized.m2m_data:
+            m2m.append((deserialized.object, deserialized.m2m_data))
+
+    # Rows that already exist are overwritten, the same as loaddata does
+    opts = model._meta
+    update_fields = [f.name for f in opts.concrete_fields if not f.primary_key]
+    model._base_manager.using(using).bulk_create(
+        objects,
+        update_conflicts=bool(update_fields),
+        unique_fields=[opts.pk.name] if update_fields else None,
+        update_fields=update_fields or None,
+    )
+
+    for field_name, values in _group_m2m(m2m).items():
+        field = opts.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        through._base_manager.using(using).filter(
+            **{f'{source}__in': [obj.pk for obj, _ in values]}
+        ).delete()
+        through._base_manager.using(using).bulk_create([
+            through(**{f'{source}_id': obj.pk, f'{target}_id': pk})
+            for obj, pks in values for pk in pks
+        ])
+    return len(objects)
+
+
+def _group_m2m(m2m):
+    grouped = {}
+    for obj, data in m2m:
+        for field_name, pks in data.items():
+            grouped.setdefault(field_name, []).append((obj, pks))
+    return grouped
+
+
+def restore(path, using=DEFAULT_DB_ALIAS, batch_size=DEFAULT_BATCH_SIZE, encoding=None, stdout=None):
+    """
+    Load a dumpdata JSON file into the database. Returns {model label: count}.
+    """
+    connection = connections[using]
+    spool = _Spool()
+    loaded = OrderedDict()
+    try:
+        for obj in iter_dump_objects(path, encoding=encoding):
+            spool.add(obj)
+
+        models = _dependency_order(spool.files.keys())
+        with transaction.atomic(using=using):
+            with connection.constraint_checks_disabled():
+                for model in models:
+                    label = model._meta.label_lower
+                    loaded[label] = 0
+                    with _raw_timestamps(model):
+                        for batch in spool.read(label, batch_size):
+                            loaded[label] += _insert_batch(model, batch, using)
+                    if stdout:
+                        stdout.write(f'  {label}: {loaded[label]}')
+
+            # Same integrity check loaddata does once constraints are back on
+            connection.check_constraints(table_names=[m._meta.db_table for m in models])
+
+            sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+            if sequence_sql:
+                with connection.cursor() as cursor:
+                    for sql in sequence_sql:
+                        cursor.execute(sql)
+    finally:
+        spool.close()
+
+    _refresh_derived_data(loaded)
+    return loaded
+
+
+def _refresh_derived_data(loaded):
+    # bulk_create skipped the Enrollment and Student signals, so bring the
+    # summary table, search index and cache versions up to date in one go
+    from . import reference, search, summaries, versioning
+
+    if loaded.get('enrollments.enrollment'):
+        summaries.rebuild()
+    if loaded.get('enrollments.student'):
+        search.rebuild()
+        search.rebuild_words()
+    if any(label.startswith('enrollments.') for label in loaded):
+        versioning.bump_version(versioning.ENROLLMENT_DATA)
+    if loaded.get('enrollments.program') or loaded.get('enrollments.schoolyear'):
+        reference.bump()
@@ -0,0 +1,313 @@
+"""
+Fee assessment.
+
+An enrollment's total_fee is assessed from the fee schedule in effect for
+its school year (the newest published FeeSchedule version):
+
+    tuition     = program tuition x year-level multiplier (the most specific matching rule, else 1)
+    discount    = tuition x the matching discount percents (together at most 100%)
+    scholarship = (tuition - discount) x the student's scholarship percents + their amounts
+                  (at most tuition - discount)
+    total_fee   = tuition - discount - scholarship + the matching miscellaneous fees
+
+each step rounded to the centavo. A rule matches the enrollments whose
+program, program type, year level (and student, for scholarships) equal
+every one of those it sets. Without a published schedule the fee is the
+program's tuition, as before there were schedules.
+
+Published schedules are never edited: new_version() copies the latest
+rules into a draft, which publish() puts into effect. The schedule's
+installments split a fee into due dates (installment_plan).
+
+recompute() re-assesses a whole term after a new version is published. A
+fee only depends on the program, the year level and the student's
+scholarship rules, so each distinct combination is computed once (in
+Decimal; SQLite would do the arithmetic in floats) and every row just looks
+its own up. Rows are read in pk keyset batches, DEFAULT_BATCH_SIZE per
+transaction, and only those whose fee changes are written, with one
+UPDATE per distinct new fee. UPDATEs send no signals, so each batch
+updates the summaries, the change feed and the dashboard versions
+itself. A dry run reads the same rows and reports what would change.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import changefeed, dashboards, summaries, versioning
+from .models import Enrollment, FeeSchedule, Program
+
+DEFAULT_BATCH_SIZE = 2000
+# pks per UPDATE ... WHERE id IN (...) (SQLite allows 999 parameters by default)
+WRITE_CHUNK_SIZE = 900
+# Rejected and dropped enrollments keep the fee they were last assessed
+ASSESSED_STATUSES = ('pending', 'approved', 'enrolled')
+DEFAULT_SAMPLE = 20
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+Breakdown = namedtuple('Breakdown', 'tuition discount scholarship misc total')
+Change = namedtuple('Change', 'enrollment_id program_id year_level status old new')
+
+
+class FeeError(Exception):
+    pass
+
+
+def _cents(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# ============================================
+# SCHEDULE VERSIONS
+# ============================================
+
+def current_schedule(school_year):
+    """The published schedule in effect for `school_year` (an instance or pk), or None."""
+    return (
+        FeeSchedule.objects.filter(school_year=school_year, published_at__isnull=False)
+        .order_by('-version').first()
+    )
+
+
+def new_version(school_year, by=None, notes=''):
+    """A draft copy of the school year's latest schedule (or an empty first version)."""
+    with transaction.atomic():
+        latest = (
+            FeeSchedule.objects.select_for_update().filter(school_year=school_year)
+            .order_by('-version').first()
+        )
+        if latest and not latest.published_at:
+            raise FeeError(f'{latest} is still a draft; edit or publish that one.')
+        schedule = FeeSchedule.objects.create(
+            school_year=school_year, version=latest.version + 1 if latest else 1, notes=notes, created_by=by,
+        )
+        if latest:
+            for related in (latest.rules, latest.installments):
+                copies = list(related.all())
+                for copy in copies:
+                    copy.pk, copy.schedule = None, schedule
+                related.model.objects.bulk_create(copies)
+    return schedule
+
+
+def publish(schedule):
+    """Put a draft into effect (recompute() then applies it to existing enrollments)."""
+    if schedule.published_at:
+        raise FeeError(f'{schedule} is already published.')
+    shares = [installment.percent for installment in schedule.installments.all()]
+    if shares and sum(shares) != HUNDRED:
+        raise FeeError(f'The installments of {schedule} add up to {sum(shares)}%, not 100%.')
+    with transaction.atomic():
+        newer = FeeSchedule.objects.filter(
+            school_year=schedule.school_year_id, version__gt=schedule.version, published_at__isnull=False,
+        )
+        if newer.exists():
+            raise FeeError(f'A newer version than {schedule} is already published.')
+        schedule.published_at = timezone.now()
+        schedule.save(update_fields=['published_at'])
+    return schedule
+
+
+# ============================================
+# ASSESSING
+# ============================================
+
+class Rules:
+    """
+    A schedule's rules, loaded once to assess any number of its term's enrollments.
+    Programs are fetched as they come up, so assessing one enrollment (on save)
+    reads just its own.
+    """
+
+    def __init__(self, schedule=None):
+        self.schedule = schedule
+        rules = list(schedule.rules.all()) if schedule else []
+        self._by_kind = defaultdict(list)
+        self._scholarships = defaultdict(list)
+        for rule in rules:
+            if rule.kind == 'scholarship':
+                self._scholarships[rule.student_id].append(rule)
+            else:
+                self._by_kind[rule.kind].append(rule)
+        self._programs = {}    # pk -> (tuition_fee, program_type)
+        self._totals = {}
+
+    @classmethod
+    def for_school_year(cls, school_year):
+        return cls(current_schedule(school_year))
+
+    @cached_property
+    def installments(self):
+        return list(self.schedule.installments.all()) if self.schedule else []
+
+    def _program(self, program_id):
+        if program_id not in self._programs:
+            self._programs[program_id] = Program.objects.values_list('tuition_fee', 'program_type').get(pk=program_id)
+        return self._programs[program_id]
+
+    @staticmethod
+    def _matching(rules, program_id, program_type, year_level):
+        return [
+            rule for rule in rules
+            if rule.program_id in (None, program_id)
+            and rule.program_type in ('', program_type)
+            and rule.year_level in ('', year_level)
+        ]
+
+    def breakdown(self, program_id, year_level, student_id=None):
+        tuition_fee, program_type = self._program(program_id)
+
+        def matching(rules):
+            return self._matching(rules, program_id, program_type, year_level)
+
+        multipliers = matching(self._by_kind['multiplier'])
+        multiplier = Decimal('1')
+        if multipliers:
+            # Most criteria set wins (program before program type); ties go to the newest rule
+            multiplier = max(multipliers, key=lambda rule: (
+                sum(map(bool, (rule.program_id, rule.program_type, rule.year_level))),
+                rule.program_id is not None, rule.pk or 0,
+            )).multiplier
+        tuition = _cents(tuition_fee * multiplier)
+
+        discount_percent = min(sum((rule.percent for rule in matching(self._by_kind['discount'])), Decimal('0')), HUNDRED)
+        discount = _cents(tuition * discount_percent / HUNDRED)
+
+        scholarship = Decimal('0')
+        scholarships = matching(self._scholarships.get(student_id, []))
+        if scholarships:
+            percent = min(sum((rule.percent or 0 for rule in scholarships), Decimal('0')), HUNDRED)
+            amount = sum((rule.amount or 0 for rule in scholarships), Decimal('0'))
+            scholarship = min(_cents((tuition - discount) * percent / HUNDRED) + amount, tuition - discount)
+
+        misc = sum((rule.amount for rule in matching(self._by_kind['misc'])), Decimal('0'))
+        total = _cents(tuition - discount - scholarship + misc)
+        return Breakdown(tuition, discount, _cents(scholarship), _cents(misc), total)
+
+    def total(self, program_id, year_level, student_id=None):
+        # Students without scholarships share one entry per program and year level
+        key = (program_id, year_level, student_id if student_id in self._scholarships else None)
+        if key not in self._totals:
+            self._totals[key] = self.breakdown(*key).total
+        return self._totals[key]
+
+    def installment_plan(self, total):
+        """[(label, due date, amount)]; the last installment takes the rounding remainder."""
+        if not self.installments:
+            return [('Full payment', None, total)]
+        plan, remaining = [], total
+        for installment in self.installments[:-1]:
+            amount = _cents(total * installment.percent / HUNDRED)
+            plan.append((installment.label, installment.due_date, amount))
+            remaining -= amount
+        last = self.installments[-1]
+        plan.append((last.label, last.due_date, remaining))
+        return plan
+
+
+def assess(enrollment):
+    """The fee for `enrollment` under its school year's schedule in effect."""
+    rules = Rules.for_school_year(enrollment.school_year_id)
+    return rules.total(enrollment.program_id, enrollment.year_level, enrollment.student_id)
+
+
+# ============================================
+# RECOMPUTING A TERM
+# ============================================
+
+def recompute(school_year, schedule=None, dry_run=False, statuses=ASSESSED_STATUSES,
+              batch_size=DEFAULT_BATCH_SIZE, sample=DEFAULT_SAMPLE, progress=None):
+    """
+    Re-assess the term's enrollments under `schedule` (default: the one in effect)
+    and write the fees that changed, or with dry_run only report them.
+    Returns the counts, the fee changes per program and the first `sample` changes.
+    `progress(done, total)` is called after each batch; returning False stops early.
+    """
+    if school_year.archived_at:
+        raise FeeError(f'{school_year} is archived.')
+    current = current_schedule(school_year)
+    if schedule is None:
+        schedule = current
+    elif schedule.school_year_id != school_year.pk:
+        raise FeeError(f'{schedule} is not a schedule of {school_year}.')
+    elif not dry_run and schedule != current:
+        raise FeeError(f'{schedule} is not the schedule in effect; publish it first (or do a dry run).')
+
+    rules = Rules(schedule)
+    candidates = Enrollment.objects.filter(school_year=school_year, status__in=statuses)
+    report = {
+        'schedule': schedule, 'total': candidates.count(), 'scanned': 0, 'changed': 0,
+        'increase': Decimal('0'), 'decrease': Decimal('0'),
+        # program_id: [changed, net change]
+        'by_program': defaultdict(lambda: [0, Decimal('0')]),
+        'changes': [], 'finished': False,
+    }
+
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = candidates.filter(pk__gt=last_pk).order_by('pk')
+            if not dry_run:
+                # Locked until the batch commits, so nothing changes between reading and writing
+                rows = rows.select_for_update(of=('self',))
+            rows = list(
+                rows.values_list('pk', 'enrollment_id', 'student_id', 'student__user_id', *summaries.MEASURE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                report['finished'] = True
+                break
+            last_pk = rows[-1][0]
+
+            changed = []
+            for pk, enrollment_id, student_id, user_id, *measured in rows:
+                program_id, _, status, year_level, old_fee = measured[:5]
+                new_fee = rules.total(program_id, year_level, student_id)
+                if new_fee == old_fee:
+                    continue
+                changed.append((pk, user_id, measured, new_fee))
+                report['by_program'][program_id][0] += 1
+                report['by_program'][program_id][1] += new_fee - old_fee
+                report['increase' if new_fee > old_fee else 'decrease'] += abs(new_fee - old_fee)
+                if len(report['changes']) < sample:
+                    report['changes'].append(Change(enrollment_id, program_id, year_level, status, old_fee, new_fee))
+            if changed and not dry_run:
+                _write(changed)
+            report['scanned'] += len(rows)
+            report['changed'] += len(changed)
+
+        if progress and progress(report['scanned'], report['total']) is False:
+            break
+    report['by_program'] = dict(report['by_program'])
+    return report
+
+
+def _write(changed):
+    # One UPDATE per distinct new fee rather than bulk_update()'s CASE WHEN pk
+    # per row: a term's fees only take a few distinct values, and building the
+    # CASE expressions was most of the time spent
+    now = timezone.now()
+    by_fee = defaultdict(list)
+    for pk, _, _, new_fee in changed:
+        by_fee[new_fee].append(pk)
+    for new_fee, pks in by_fee.items():
+        for start in range(0, len(pks), WRITE_CHUNK_SIZE):
+            Enrollment.objects.filter(pk__in=pks[start:start + WRITE_CHUNK_SIZE]).update(
+                # version: same as a save() (see Enrollment.version)
+                total_fee=new_fee, version=F('version') + 1, updated_at=now,
+            )
+
+    # What the Enrollment signals would have done, once per batch
+    summaries.record_changes(
+        (summaries.measure(*measured), summaries.measure(*measured[:4], new_fee, *measured[5:]))
+        for _, _, measured, new_fee in changed
+    )
+    pks = [row[0] for row in changed]
+    for start in range(0, len(pks), WRITE_CHUNK_SIZE):
+        changefeed.record_many(Enrollment.objects.filter(pk__in=pks[start:start + WRITE_CHUNK_SIZE]), 'update')
+    dashboards.invalidate_users(row[1] for row in changed)
+    transaction.on_commit(lambda: versioning.bump_version(versioning.ENROLLMENT_DATA))
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Student, Program, SchoolYear, Enrollment
+from django.forms.models import ModelChoiceIterator
+from .models import Student, Program, SchoolYear, Enrollment, Section
+from . import reference, schedules
 
 class RegisterForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -60,19 +62,148 @@ class SchoolYearForm(forms.ModelForm):
             'enrollment_end': forms.DateInput(attrs={'class': 'form-input', 'type': 'date'}),
         }
 
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for obj in self.field.objects():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.objects()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.objects())
+
+
+class ReferenceChoiceField(forms.ModelChoiceField):
+    """A ModelChoiceField whose choices and validation come from the reference data registry."""
+    iterator = ReferenceChoiceIterator
+
+    def __init__(self, objects, lookup, **kwargs):
+        # The queryset is only there for ModelChoiceField's sake; it is never evaluated
+        super().__init__(**kwargs)
+        self.objects = objects
+        self.lookup = lookup
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            obj = self.lookup(int(getattr(value, 'pk', value)))
+        except (TypeError, ValueError):
+            obj = None
+        if obj is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value},
+            )
+        return obj
+
+
+class SectionChoiceField(forms.ModelMultipleChoiceField):
+    def label_from_instance(self, obj):
+        return f'{obj.code} - {obj.school_year}: {obj.schedule_display()}'
+
+
 class EnrollmentForm(forms.ModelForm):
+    # Only active programs and school years, to prevent enrolling in closed terms
+    program = ReferenceChoiceField(
+        reference.active_programs, reference.active_program,
+        queryset=Program.objects.filter(is_active=True),
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    school_year = ReferenceChoiceField(
+        reference.active_school_years, reference.active_school_year,
+        queryset=SchoolYear.objects.filter(is_active=True),
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    sections = SectionChoiceField(
+        queryset=Section.objects.none(), required=False,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-checkbox'}),
+        help_text='Sections of the chosen program and school year. Meeting times may not overlap.',
+    )
+    # The row version the form was made from (optimistic locking on update, see the view)
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    # Conflict messages shown at most; the rest are summarized
+    MAX_CONFLICT_ERRORS = 5
+
     class Meta:
         model = Enrollment
         # enrollment_id is generated in the model save() method, so we exclude it here
-        fields = ['program', 'school_year', 'year_level']
+        fields = ['program', 'school_year', 'year_level', 'sections']
         widgets = {
-            'program': forms.Select(attrs={'class': 'form-select'}),
-            'school_year': forms.Select(attrs={'class': 'form-select'}),
             'year_level': forms.Select(attrs={'class': 'form-select'}),
         }
-    
-    def __init__(self, *args, **kwargs):
+
+    def __init__(self, *args, student=None, **kwargs):
         super().__init__(*args, **kwargs)
-        # Only show active programs and school years to prevent enrolling in closed terms
-        self.fields['program'].queryset = Program.objects.filter(is_active=True)
-        self.fields['school_year'].queryset = SchoolYear.objects.filter(is_active=True)
\ No newline at end of file
+        # The student is set by the view on create, so it is passed in for the conflict check
+        self.student = student or (self.instance.student if self.instance.student_id else None)
+        self.fields['version'].initial = self.instance.version
+        # Only the sections of the chosen term; until both are picked there is nothing to list
+        program, school_year = self._chosen('program'), self._chosen('school_year')
+        if program is None or school_year is None:
+            self.fields['sections'].help_text = 'Choose a program and school year to see their sections.'
+        else:
+            self.fields['sections'].queryset = (
+                Section.objects.filter(program_id=program.pk, school_year_id=school_year.pk)
+                .select_related('program', 'school_year').prefetch_related('meetings')
+            )
+
+    def _chosen(self, name):
+        """The active program / school year picked so far (submitted, or the initial one), or None."""
+        field = self.fields[name]
+        if self.is_bound:
+            value = field.widget.value_from_datadict(self.data, self.files, self.add_prefix(name))
+        else:
+            value = self.get_initial_for_field(field, name)
+        try:
+            return field.to_python(value)
+        except forms.ValidationError:
+            return None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        sections = cleaned_data.get('sections')
+        program, school_year = cleaned_data.get('program'), cleaned_data.get('school_year')
+        if not sections or not program or not school_year:
+            return cleaned_data
+
+        conflicts = schedules.section_conflicts(
+            sections, self.student, school_year, exclude_enrollment=self.instance.pk,
+        )
+        for first, second in conflicts[:self.MAX_CONFLICT_ERRORS]:
+            self.add_error('sections', f'Schedule conflict: {schedules.conflict_display(first, second)}.')
+        if len(conflicts) > self.MAX_CONFLICT_ERRORS:
+            self.add_error('sections', f'... and {len(conflicts) - self.MAX_CONFLICT_ERRORS} more conflict(s).')
+        return cleaned_data
+
+    def _get_validation_exclusions(self):
+        # The registry lookup already proved these rows exist; skip the model
+        # field validation, which would query for them again
+        exclude = super()._get_validation_exclusions()
+        exclude.update({'program', 'school_year'})
+        return exclude
+
+
+class RolloverForm(forms.Form):
+    source = forms.ModelChoiceField(
+        queryset=SchoolYear.objects.all(), label='From school year',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    target = forms.ModelChoiceField(
+        queryset=SchoolYear.objects.filter(is_active=True), label='To school year',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def clean(self):
+        from .rollover import RolloverError, check_terms
+
+        cleaned_data = super().clean()
+        if cleaned_data.get('source') and cleaned_data.get('target'):
+            try:
+                check_terms(cleaned_data['source'], cleaned_data['target'])
+            except RolloverError as exc:
+                raise forms.ValidationError(str(exc))
+        return cleaned_data
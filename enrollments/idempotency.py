@@ -0,0 +1,181 @@
+"""
+Idempotency keys for form submissions.
+
+A double click, or a retry after a slow response, submits the same form
+twice. Forms that create things carry a random token ({% idempotency_field %}
+from the submissions tag library), and their views are wrapped in
+@idempotent(scope):
+
+  * The first submission of a token inserts its IdempotencyKey row and runs
+    the view in the same transaction. If the view redirects (success), the
+    redirect and the messages it queued are stored on the row and commit
+    together with whatever the view wrote. Anything else (the form shown
+    again with errors, an exception) rolls it all back, so the corrected
+    form can be sent with the same token.
+  * A replay of a finished submission gets the same redirect and messages,
+    from the cache if this process has them, else from the row. The view
+    doesn't run.
+  * A replay that arrives while the first submission is still running
+    blocks on the row's unique key until that transaction ends (the
+    database does the waiting). Then it replays the result, or runs as the
+    first submission if that one was rolled back.
+
+Keys are per scope and per submitter (the user, or before login the CSRF
+cookie), hashed, and kept IDEMPOTENCY_KEY_TTL seconds;
+`manage.py purge_idempotency_keys` deletes the expired ones. Replaying a
+submission that logged someone in (registration) logs them in again, but
+only for IDEMPOTENCY_LOGIN_REPLAY_SECONDS: that covers a retry that left
+the browser before the first response's session cookie arrived, without
+letting whoever holds the token and the old CSRF cookie log in for a day.
+"""
+import hashlib
+import re
+import secrets
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model, login
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+FIELD_NAME = 'idempotency_key'
+REPLAY_HEADER = 'Idempotent-Replay'
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_-]{16,64}')
+
+
+def ttl_seconds():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+
+def login_replay_seconds():
+    return getattr(settings, 'IDEMPOTENCY_LOGIN_REPLAY_SECONDS', 60)
+
+
+def new_token():
+    return secrets.token_urlsafe(24)
+
+
+def posted_token(request):
+    token = request.POST.get(FIELD_NAME, '')
+    return token if TOKEN_PATTERN.fullmatch(token) else None
+
+
+def token_for_form(request):
+    """The token to embed: the one just posted (the form is shown again), or a fresh one."""
+    return (request.method == 'POST' and posted_token(request)) or new_token()
+
+
+def _submitter(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    # Rotated by login(), so a retry of the registration still carries the old one
+    csrf_secret = request.META.get('CSRF_COOKIE')
+    return f'csrf:{csrf_secret}' if csrf_secret else None
+
+
+def _key(scope, submitter, token):
+    return hashlib.sha256(f'{scope}\n{submitter}\n{token}'.encode()).hexdigest()
+
+
+def _cache_key(key):
+    return f'enrollments:idempotency:{key}'
+
+
+# ============================================
+# VIEW DECORATOR
+# ============================================
+
+def idempotent(scope):
+    """Run a form-handling view once per submitted token; replay its redirect for repeats."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            token = posted_token(request) if request.method == 'POST' else None
+            submitter = _submitter(request) if token else None
+            if not submitter:
+                return view_func(request, *args, **kwargs)
+
+            key = _key(scope, submitter, token)
+            result = cache.get(_cache_key(key))
+            if result is not None:
+                return _replay(request, result)
+            return _run_once(request, scope, key, view_func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def _claim(scope, key):
+    """The new IdempotencyKey, or None if the token was already used (call inside a transaction)."""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    key=key, scope=scope, expires_at=now + timedelta(seconds=ttl_seconds()),
+                )
+        except IntegrityError:
+            # Not purged yet, but past its TTL: the token counts as unused
+            if not IdempotencyKey.objects.filter(key=key, expires_at__lte=now).delete()[0]:
+                return None
+    return None
+
+
+def _run_once(request, scope, key, view_func, args, kwargs):
+    was_anonymous = not request.user.is_authenticated
+    with transaction.atomic():
+        claim = _claim(scope, key)
+        if claim is None:
+            result = IdempotencyKey.objects.filter(key=key).values_list('result', flat=True).first()
+            if result:
+                return _replay(request, result)
+            # Deleted between our insert and this read (purged); just run the view
+            return view_func(request, *args, **kwargs)
+
+        response = view_func(request, *args, **kwargs)
+        if not isinstance(response, HttpResponseRedirect):
+            # Nothing happened (the form has errors); the token can be sent again
+            transaction.set_rollback(True)
+            return response
+
+        logged_in = was_anonymous and request.user.is_authenticated
+        claim.result = {
+            'location': response['Location'],
+            'messages': _queued_messages(request),
+            'login': request.user.pk if logged_in else None,
+            'login_until': time.time() + login_replay_seconds() if logged_in else None,
+        }
+        claim.save(update_fields=['result'])
+        transaction.on_commit(lambda: cache.set(_cache_key(key), claim.result, ttl_seconds()))
+    return response
+
+
+def _queued_messages(request):
+    storage = messages.get_messages(request)
+    queued = [[message.level, str(message.message), message.extra_tags] for message in storage]
+    # Iterating marks them shown; they still are for the original response
+    storage.used = False
+    return queued
+
+
+def _replay(request, result):
+    if (result.get('login') and not request.user.is_authenticated
+            and time.time() < (result.get('login_until') or 0)):
+        user = get_user_model().objects.filter(pk=result['login']).first()
+        if user is not None:
+            login(request, user)
+    for level, message, extra_tags in result.get('messages', []):
+        messages.add_message(request, level, message, extra_tags=extra_tags)
+    response = HttpResponseRedirect(result['location'])
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def purge_expired():
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
@@ -0,0 +1,146 @@
+"""
+Notification inbox: unread first, cursor paging, cheap mark-read.
+
+A notification is read when its own is_read flag is set, or when its id is
+at or below the user's NotificationReadState.read_up_to watermark. Ids only
+grow, so "mark all as read" moves the watermark in a single upsert, however
+many notifications the user has. Marking one or a few is a single UPDATE.
+
+Pages are keyed by id, newest first, instead of OFFSET. The unread section
+comes first, then the read one, and both walk an index on
+(user, is_read, id) / (user, id). A cursor is 'u<id>' (more unread before
+that id) or 'r<id>' (read ones before it, or from the top when no id is
+given).
+"""
+from collections import namedtuple
+
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import Notification, NotificationReadState
+
+PAGE_SIZE = 20
+
+InboxPage = namedtuple('InboxPage', 'notifications next_cursor')
+
+
+def watermark(user):
+    return (
+        NotificationReadState.objects.filter(user=user)
+        .values_list('read_up_to', flat=True).first()
+    ) or 0
+
+
+def unread_filter(read_up_to):
+    return Q(is_read=False, id__gt=read_up_to)
+
+
+def read_filter(read_up_to):
+    return Q(is_read=True) | Q(id__lte=read_up_to)
+
+
+def unread_count(user, read_up_to=None):
+    if read_up_to is None:
+        read_up_to = watermark(user)
+    return Notification.objects.filter(unread_filter(read_up_to), user=user).count()
+
+
+def newest_id(user):
+    return Notification.objects.filter(user=user).aggregate(newest=Max('id'))['newest'] or 0
+
+
+# ============================================
+# PAGING
+# ============================================
+
+def _parse_cursor(cursor):
+    """('u' or 'r', id or None); anything unreadable starts from the top."""
+    cursor = cursor or ''
+    if cursor[:1] in ('u', 'r') and (cursor[1:].isdigit() or cursor == 'r'):
+        return cursor[0], int(cursor[1:]) if cursor[1:] else None
+    return 'u', None
+
+
+def page(user, cursor='', read_up_to=None, size=PAGE_SIZE):
+    """One page of the user's inbox. is_read on the returned rows is the effective state."""
+    if read_up_to is None:
+        read_up_to = watermark(user)
+    section, before = _parse_cursor(cursor)
+    mine = Notification.objects.filter(user=user)
+
+    unread = []
+    if section == 'u':
+        rows = mine.filter(unread_filter(read_up_to))
+        if before:
+            rows = rows.filter(id__lt=before)
+        unread = list(rows.order_by('-id')[:size + 1])
+        if len(unread) > size:
+            return InboxPage(unread[:size], f'u{unread[size - 1].pk}')
+        before = None
+
+    rows = mine.filter(read_filter(read_up_to))
+    if before:
+        rows = rows.filter(id__lt=before)
+    read = list(rows.order_by('-id')[:size + 1 - len(unread)])
+    for notification in read:
+        notification.is_read = True
+
+    notifications = unread + read
+    if len(notifications) <= size:
+        return InboxPage(notifications, None)
+    if len(unread) == size:
+        # This page ended exactly at the last unread one
+        return InboxPage(unread, 'r')
+    return InboxPage(notifications[:size], f'r{notifications[size - 1].pk}')
+
+
+# ============================================
+# MARKING READ
+# ============================================
+
+def mark_read(user, ids):
+    """Mark some of the user's notifications read, in one UPDATE. Returns the rows changed."""
+    ids = [int(pk) for pk in ids]
+    if not ids:
+        return 0
+    marked = Notification.objects.filter(user=user, pk__in=ids, is_read=False).update(is_read=True)
+    if marked:
+        _changed(user)
+    return marked
+
+
+def mark_all_read(user, up_to=None):
+    """
+    Move the user's watermark up to `up_to` (the newest id they were shown),
+    or to their newest notification. Never moves it back or past what exists.
+    """
+    newest = newest_id(user)
+    up_to = newest if up_to is None else min(int(up_to), newest)
+    if up_to <= 0:
+        return
+    moved = NotificationReadState.objects.filter(user=user, read_up_to__lt=up_to).update(
+        read_up_to=up_to, updated_at=timezone.now(),
+    )
+    if not moved:
+        # No row yet (or it is already further along)
+        _, moved = NotificationReadState.objects.get_or_create(user=user, defaults={'read_up_to': up_to})
+    if moved:
+        _changed(user)
+
+
+def _changed(user):
+    # UPDATEs don't send signals; the dashboard shows the unread count
+    from . import dashboards
+
+    dashboards.invalidate_user(user.pk)
+
+
+def apply_watermarks(rows):
+    """Fold the watermarks into is_read on notification value dicts (e.g. when archiving)."""
+    user_ids = {row['user_id'] for row in rows}
+    read_up_to = dict(
+        NotificationReadState.objects.filter(user_id__in=user_ids).values_list('user_id', 'read_up_to')
+    )
+    for row in rows:
+        row['is_read'] = row['is_read'] or row['id'] <= read_up_to.get(row['user_id'], 0)
+    return rows
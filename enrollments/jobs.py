@@ -0,0 +1,295 @@
+"""
+Background jobs.
+
+Work too heavy for a request (e-mail runs, exports, bulk updates, imports)
+is queued as a Job row and run by `manage.py run_jobs` worker processes.
+A job names a function decorated with @task, by dotted path, and carries a
+JSON payload that is passed to it as keyword arguments:
+
+    @jobs.task
+    def export_enrollments(job, school_year):
+        ...
+
+    jobs.enqueue(export_enrollments, {'school_year': 3}, priority=5)
+
+Workers take ready jobs in priority order, then run_at order. A claim is a
+lease: nobody else sees the job until locked_until (the visibility timeout),
+and progress() renews it. If a worker dies mid-job, the lease lapses and
+requeue_expired() puts the job back (or, for a keyed job enqueued again in
+the meantime, folds it into the queued one). Failed jobs are retried with
+exponential backoff, up to max_attempts. A worker that is asked to shut
+down finishes the job in hand; long jobs should check job.stopping()
+between chunks of work and leave the rest for a later run.
+
+Claiming uses SELECT ... FOR UPDATE SKIP LOCKED where the database has it
+(Postgres), so workers never queue up behind each other's rows. SQLite has
+no row locks but runs one write at a time, so there a single UPDATE picks
+and marks the rows. claim_rows() is shared with mail.py's outbox.
+"""
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 60 * 60
+ERROR_MAX_LENGTH = 4000
+
+
+def visibility_timeout():
+    return getattr(settings, 'JOB_VISIBILITY_TIMEOUT', 5 * 60)
+
+
+def task(func):
+    """Mark a function as runnable by the workers."""
+    func.is_job_task = True
+    return func
+
+
+def task_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, payload=None, priority=0, run_at=None, delay=None, key=None, max_attempts=3):
+    """
+    Queue `func` (a @task function or its dotted path). With a `key`, a job
+    with that key that is still queued is returned instead of adding another
+    (moved up to `run_at` if that is sooner).
+    """
+    name = func if isinstance(func, str) else task_name(func)
+    run_at = run_at or timezone.now()
+    if delay:
+        run_at += timedelta(seconds=delay)
+    job = Job(name=name, payload=payload or {}, priority=priority, run_at=run_at, key=key, max_attempts=max_attempts)
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        Job.objects.filter(key=key, status=QUEUED, run_at__gt=run_at).update(run_at=run_at)
+        return Job.objects.filter(key=key, status=QUEUED).first() or enqueue(
+            func, payload, priority=priority, run_at=run_at, key=key, max_attempts=max_attempts,
+        )
+
+
+# ============================================
+# CLAIMING
+# ============================================
+
+def _skip_locked(model):
+    return connections[router.db_for_write(model)].features.has_select_for_update_skip_locked
+
+
+def claim_rows(candidates, limit, **changes):
+    """
+    Atomically take up to `limit` rows of the ordered queryset `candidates`
+    and apply `changes` to them. Returns the rows' new claim_token.
+    """
+    model = candidates.model
+    token = uuid.uuid4().hex
+    if _skip_locked(model):
+        with transaction.atomic(using=router.db_for_write(model)):
+            pks = list(candidates.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            if pks:
+                model.objects.filter(pk__in=pks).update(claim_token=token, **changes)
+    else:
+        # The subquery runs inside the UPDATE, under SQLite's write lock,
+        # so two workers can never pick the same rows
+        model.objects.filter(pk__in=candidates.values('pk')[:limit]).update(claim_token=token, **changes)
+    return token
+
+
+def claim(limit=1, timeout=None):
+    """Claim up to `limit` ready jobs for this worker."""
+    timeout = timeout or visibility_timeout()
+    now = timezone.now()
+    ready = Job.objects.filter(status=QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+    token = claim_rows(
+        ready, limit,
+        status=RUNNING, locked_until=now + timedelta(seconds=timeout), started_at=now, attempts=F('attempts') + 1,
+    )
+    claimed = list(Job.objects.filter(claim_token=token, status=RUNNING).order_by('-priority', 'run_at', 'id'))
+    for job in claimed:
+        job.lease_seconds = timeout
+        job.stopping = lambda: False
+    return claimed
+
+
+def requeue_expired():
+    """Put back jobs whose worker let the lease lapse (crashed, killed, hung)."""
+    now = timezone.now()
+    expired = Job.objects.filter(status=RUNNING, locked_until__lt=now)
+    failed = expired.filter(attempts__gte=F('max_attempts')).update(
+        status=FAILED, finished_at=now, claim_token='', locked_until=None,
+        last_error='The worker stopped renewing its claim (visibility timeout).',
+    )
+    requeued = _requeue(expired, now)
+    if failed or requeued:
+        logger.warning('Requeued %s and failed %s job(s) with expired claims.', requeued, failed)
+    return requeued + failed
+
+
+def _requeue(jobs, run_at, **changes):
+    """
+    Put the running `jobs` (a queryset) back in the queue. A keyed job that was
+    enqueued again while it ran already has a queued twin, and a second queued
+    row would break the key's uniqueness: it is folded into the twin instead
+    (which keeps the earlier run_at) and marked done. Returns how many were put back or folded.
+    """
+    back = dict(status=QUEUED, run_at=run_at, claim_token='', locked_until=None, **changes)
+    count = jobs.filter(key__isnull=True).update(**back)
+    for pk, key in jobs.filter(key__isnull=False).values_list('pk', 'key'):
+        try:
+            with transaction.atomic():
+                count += jobs.filter(pk=pk).update(**back)
+        except IntegrityError:
+            Job.objects.filter(key=key, status=QUEUED, run_at__gt=run_at).update(run_at=run_at)
+            twin = Job.objects.filter(key=key, status=QUEUED).values_list('pk', flat=True).first()
+            count += jobs.filter(pk=pk).update(
+                status=DONE, finished_at=timezone.now(), claim_token='', locked_until=None,
+                result={'merged_into': twin}, **changes,
+            )
+    return count
+
+
+def _mine(job):
+    return Job.objects.filter(pk=job.pk, claim_token=job.claim_token, status=RUNNING)
+
+
+def progress(job, done, total=None):
+    """Report progress and renew the claim. False means the job was lost to another worker."""
+    job.progress = {'done': done, 'total': total}
+    return bool(_mine(job).update(
+        progress=job.progress,
+        locked_until=timezone.now() + timedelta(seconds=getattr(job, 'lease_seconds', visibility_timeout())),
+    ))
+
+
+# ============================================
+# RUNNING
+# ============================================
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run(job):
+    """Run a claimed job and record the outcome."""
+    try:
+        func = import_string(job.name)
+        if not getattr(func, 'is_job_task', False):
+            raise ImportError(f'{job.name} is not a @jobs.task function.')
+        result = func(job, **job.payload)
+    except Exception:
+        error = traceback.format_exc()[-ERROR_MAX_LENGTH:]
+        logger.exception('Job %s (%s) failed, attempt %s of %s.', job.pk, job.name, job.attempts, job.max_attempts)
+        if job.attempts < job.max_attempts:
+            _requeue(_mine(job), timezone.now() + timedelta(seconds=retry_delay(job.attempts)), last_error=error)
+        else:
+            _mine(job).update(status=FAILED, finished_at=timezone.now(), claim_token='', locked_until=None, last_error=error)
+        return False
+
+    if not _mine(job).update(status=DONE, result=result, finished_at=timezone.now(), locked_until=None):
+        logger.warning('Job %s (%s) finished after its claim expired; the result was dropped.', job.pk, job.name)
+    return True
+
+
+def release(job):
+    """Hand a claimed job back unrun (e.g. on shutdown), without using up an attempt."""
+    _requeue(_mine(job), job.run_at, attempts=F('attempts') - 1)
+
+
+def retention_days():
+    return getattr(settings, 'JOB_RETENTION_DAYS', 7)
+
+
+def work(stop, batch_size=1, poll_interval=1.0, timeout=None, once=False):
+    """
+    Worker loop: claim, run, repeat until `stop` (a threading or
+    multiprocessing Event) is set, or the queue is empty with `once`.
+    Returns how many jobs were run.
+    """
+    ran = 0
+    next_sweep = 0
+    try:
+        while not stop.is_set():
+            if timezone.now().timestamp() >= next_sweep:
+                requeue_expired()
+                purge(retention_days())
+                next_sweep = timezone.now().timestamp() + poll_interval * 10
+            claimed = claim(batch_size, timeout)
+            if not claimed:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            for job in claimed:
+                if stop.is_set():
+                    release(job)
+                    continue
+                job.stopping = stop.is_set
+                run(job)
+                ran += 1
+    finally:
+        # Threads get their own connections; don't leave them open
+        connections.close_all()
+    return ran
+
+
+# ============================================
+# QUEUE STATISTICS (staff page)
+# ============================================
+
+def queue_stats(recent_failures=10):
+    now = timezone.now()
+    by_status = dict(Job.objects.order_by().values_list('status').annotate(n=Count('pk')))
+    ready = Job.objects.filter(status=QUEUED, run_at__lte=now)
+    ready_count = ready.count()
+    oldest = ready.order_by('run_at').values_list('run_at', flat=True).first()
+
+    by_name = {}
+    rows = (
+        Job.objects.filter(Q(status__in=[QUEUED, RUNNING]) | Q(finished_at__gte=now - timedelta(hours=1)))
+        .order_by().values_list('name', 'status').annotate(n=Count('pk'))
+    )
+    for name, status, count in rows:
+        by_name.setdefault(name, dict.fromkeys([QUEUED, RUNNING, DONE, FAILED], 0))[status] = count
+
+    return {
+        'by_status': {status: by_status.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)},
+        'ready': ready_count,
+        'scheduled': by_status.get(QUEUED, 0) - ready_count,
+        'oldest_ready_seconds': (now - oldest).total_seconds() if oldest else None,
+        'done_last_minute': Job.objects.filter(status=DONE, finished_at__gte=now - timedelta(minutes=1)).count(),
+        'done_last_hour': Job.objects.filter(status=DONE, finished_at__gte=now - timedelta(hours=1)).count(),
+        'failed_last_hour': Job.objects.filter(status=FAILED, finished_at__gte=now - timedelta(hours=1)).count(),
+        'by_name': dict(sorted(by_name.items())),
+        'recent_failures': list(
+            Job.objects.filter(status=FAILED).order_by('-finished_at')
+            .values('id', 'name', 'attempts', 'finished_at', 'last_error')[:recent_failures]
+        ),
+    }
+
+
+def purge(older_than_days):
+    """Delete finished jobs older than `older_than_days`."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = Job.objects.filter(status__in=[DONE, FAILED], finished_at__lt=cutoff).delete()
+    return deleted
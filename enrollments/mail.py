@@ -0,0 +1,255 @@
+"""
+E-mail about enrollment decisions, delivered in batches.
+
+Approving or rejecting an enrollment queues an OutboundEmail row in the same
+transaction as the decision, plus a delivery job a few seconds out. That
+job has a fixed key, so however many decisions come in at the end of a
+review period, they share one queued delivery run (see jobs.py).
+
+The run (deliver) claims due messages EMAIL_BATCH_SIZE at a time and sends
+each batch over one SMTP connection, at most EMAIL_RATE_PER_SECOND per
+worker. If the server refuses a recipient, or answers 5xx, that message
+fails for good. Anything else (a dropped connection, a timeout, a 4xx, a
+template that doesn't render) puts the message back with a backoff, up to
+EMAIL_MAX_ATTEMPTS; after a broken connection the rest of the batch goes
+over a fresh one. Every recipient gets a message (recipient, dedupe_key)
+once. Rows are claimed the way jobs are, so two workers never send the same
+row. Only a worker dying between sending and recording a batch can make its
+messages go out again; its claims count as attempts, so a message that keeps
+killing workers ends up failed too.
+
+Subjects and bodies are rendered from templates/enrollments/email/ when the
+message is sent. To try it locally, run `manage.py smtp_sink` and start the
+worker with EMAIL_HOST=localhost EMAIL_PORT=1025.
+"""
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import jobs
+from .models import OutboundEmail
+
+PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+
+DECISION_KINDS = ('enrollment_approved', 'enrollment_rejected')
+DELIVERY_JOB_KEY = 'mail.deliver'
+# Wait this long for more decisions before starting a delivery run
+BATCH_WINDOW_SECONDS = 5
+ERROR_MAX_LENGTH = 1000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ============================================
+# QUEUEING
+# ============================================
+
+def queue_decision_email(enrollment):
+    """Queue the approval / rejection e-mail for a just-reviewed enrollment."""
+    kind = f'enrollment_{enrollment.status}'
+    recipient = enrollment.student.email
+    if kind not in DECISION_KINDS or not recipient:
+        return None
+    email, created = OutboundEmail.objects.get_or_create(
+        recipient=recipient, dedupe_key=f'{kind}:{enrollment.pk}',
+        defaults={'kind': kind, 'enrollment': enrollment},
+    )
+    if created:
+        schedule_delivery()
+    return email
+
+
+def schedule_delivery(run_at=None):
+    return jobs.enqueue(
+        deliver, key=DELIVERY_JOB_KEY,
+        run_at=run_at or timezone.now() + timedelta(seconds=BATCH_WINDOW_SECONDS),
+    )
+
+
+# ============================================
+# RENDERING
+# ============================================
+
+def render(email):
+    """(subject, body) for an OutboundEmail whose enrollment is loaded."""
+    enrollment = email.enrollment
+    context = {
+        'enrollment': enrollment,
+        'student': enrollment.student,
+        'program': enrollment.program,
+        'school_year': enrollment.school_year,
+    }
+    subject = render_to_string(f'enrollments/email/{email.kind}_subject.txt', context)
+    body = render_to_string(f'enrollments/email/{email.kind}.txt', context)
+    # Subjects must be one line
+    return ' '.join(subject.split()), body
+
+
+# ============================================
+# DELIVERY
+# ============================================
+
+class Throttle:
+    """Spaces calls to wait() at least 1 / rate seconds apart (no limit when rate is 0)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+def _permanent(exc):
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+def _due():
+    return OutboundEmail.objects.filter(status=PENDING, next_attempt_at__lte=timezone.now())
+
+
+def _requeue_stuck():
+    # Claimed by a worker that died before recording the batch
+    stuck = OutboundEmail.objects.filter(status=SENDING, locked_until__lt=timezone.now())
+    stuck.filter(attempts__gte=_setting('EMAIL_MAX_ATTEMPTS', 5)).update(
+        status=FAILED, claim_token='', locked_until=None,
+        last_error='The worker sending it stopped before recording the result.',
+    )
+    return stuck.update(status=PENDING, claim_token='', locked_until=None)
+
+
+def _claim_batch(size):
+    now = timezone.now()
+    token = jobs.claim_rows(
+        _due().order_by('next_attempt_at', 'id'), size,
+        status=SENDING, locked_until=now + timedelta(seconds=jobs.visibility_timeout()),
+        attempts=F('attempts') + 1,
+    )
+    return list(
+        OutboundEmail.objects.filter(claim_token=token, status=SENDING)
+        .select_related('enrollment__student', 'enrollment__program', 'enrollment__school_year')
+    )
+
+
+def _send_batch(emails, throttle):
+    """Send one batch over one connection; marks each email sent, pending or failed (unsaved)."""
+    max_attempts = _setting('EMAIL_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+
+    def retry_or_fail(email, error, permanent=False):
+        email.last_error = error[:ERROR_MAX_LENGTH]
+        if permanent or email.attempts >= max_attempts:
+            email.status = FAILED
+        else:
+            email.status = PENDING
+            email.next_attempt_at = now + timedelta(seconds=jobs.retry_delay(email.attempts))
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except (smtplib.SMTPException, OSError) as exc:
+        for email in emails:
+            retry_or_fail(email, f'Could not connect: {exc!r}')
+        return
+
+    try:
+        for index, email in enumerate(emails):
+            if email.enrollment is None:
+                retry_or_fail(email, 'The enrollment no longer exists.', permanent=True)
+                continue
+            try:
+                email.subject, email.body = render(email)
+            except Exception as exc:
+                retry_or_fail(email, f'Could not render: {exc!r}')
+                continue
+            throttle.wait()
+            try:
+                EmailMessage(email.subject, email.body, to=[email.recipient], connection=connection).send()
+            except (smtplib.SMTPException, OSError) as exc:
+                retry_or_fail(email, repr(exc), permanent=_permanent(exc))
+                if _permanent(exc) or isinstance(exc, smtplib.SMTPResponseException):
+                    # The server answered, so the session is still usable
+                    continue
+                # The connection is broken; carry on over a new one
+                try:
+                    connection.close()
+                    connection.open()
+                except (smtplib.SMTPException, OSError) as exc:
+                    for rest in emails[index + 1:]:
+                        retry_or_fail(rest, f'Could not reconnect: {exc!r}')
+                    return
+            except Exception as exc:
+                # Raised before anything reached the server (a bad header, say)
+                retry_or_fail(email, repr(exc))
+            else:
+                email.status = SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+    finally:
+        connection.close()
+
+
+@jobs.task
+def deliver(job, batch_size=None):
+    """Send due e-mails batch by batch until none are left. Returns the counts."""
+    batch_size = batch_size or _setting('EMAIL_BATCH_SIZE', 100)
+    throttle = Throttle(_setting('EMAIL_RATE_PER_SECOND', 20))
+    _requeue_stuck()
+    total = _due().count()
+    counts = dict.fromkeys([SENT, PENDING, FAILED], 0)
+
+    # Between batches, so a worker shutting down isn't held up for long;
+    # whatever is left gets a new run below
+    while not job.stopping():
+        emails = _claim_batch(batch_size)
+        if not emails:
+            break
+        try:
+            _send_batch(emails, throttle)
+        finally:
+            # Record what went out even when the batch stopped part-way; rows
+            # still marked sending are put back by _requeue_stuck() later
+            emails = [email for email in emails if email.status != SENDING]
+            for email in emails:
+                email.claim_token, email.locked_until = '', None
+                counts[email.status] += 1
+            OutboundEmail.objects.bulk_update(
+                emails, ['status', 'subject', 'body', 'sent_at', 'next_attempt_at', 'last_error', 'claim_token', 'locked_until'],
+            )
+        done = sum(counts.values())
+        if not jobs.progress(job, done, max(total, done)):
+            break
+
+    # Messages put back for a retry (or left over) need a run of their own
+    next_attempt_at = (
+        OutboundEmail.objects.filter(status=PENDING).order_by('next_attempt_at')
+        .values_list('next_attempt_at', flat=True).first()
+    )
+    if next_attempt_at:
+        schedule_delivery(max(next_attempt_at, timezone.now()))
+    return {'sent': counts[SENT], 'retrying': counts[PENDING], 'failed': counts[FAILED]}
+
+
+def stats():
+    by_status = dict(OutboundEmail.objects.order_by().values_list('status').annotate(n=Count('pk')))
+    return {
+        'by_status': {status: by_status.get(status, 0) for status in (PENDING, SENDING, SENT, FAILED)},
+        'sent_last_hour': OutboundEmail.objects.filter(
+            status=SENT, sent_at__gte=timezone.now() - timedelta(hours=1),
+        ).count(),
+    }
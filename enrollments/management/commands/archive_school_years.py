@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from enrollments import archive
+from enrollments.models import SchoolYear
+
+
+class Command(BaseCommand):
+    help = (
+        'Move enrollments and notifications of inactive school years into the archive tables. '
+        'Runs in batches; safe to interrupt and re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school-year', type=int, action='append', dest='school_years',
+                            help='Archive this school year id (repeatable). Default: every inactive one.')
+        parser.add_argument('--batch-size', type=int, default=archive.DEFAULT_BATCH_SIZE,
+                            help='Enrollments moved per transaction (default: %(default)s).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived.')
+
+    def handle(self, *args, **options):
+        school_years = archive.archivable_school_years()
+        if options['school_years']:
+            school_years = SchoolYear.objects.filter(pk__in=options['school_years'])
+
+        total = 0
+        for school_year in school_years:
+            pending = school_year.enrollments.count()
+            if options['dry_run']:
+                self.stdout.write(f'{school_year}: {pending} enrollment(s) to archive')
+                continue
+            try:
+                moved = archive.archive_school_year(
+                    school_year,
+                    batch_size=options['batch_size'],
+                    stdout=self.stdout if options['verbosity'] > 1 else None,
+                )
+            except archive.ArchiveError as exc:
+                raise CommandError(str(exc))
+            total += moved
+            self.stdout.write(f'{school_year}: archived {moved} enrollment(s)')
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Archived {total} enrollment(s).'))
@@ -0,0 +1,82 @@
+import itertools
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, engines
+
+from enrollments.models import Enrollment, Program
+
+CARDS = {
+    'enrollment': ('atomic/molecules/enrollment_card.html', 'enrollment_card'),
+    'program': ('atomic/molecules/program_card.html', 'program_card'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Render N enrollment and program cards the old way ({% include %} with {% url %} per row) '
+        'and through the cards tag library, and compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000, help='Cards per render (default: %(default)s).')
+        parser.add_argument('--repeat', type=int, default=7, help='Renders per variant (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        engine = engines['django'].engine
+        # A staff user sees every action link, i.e. the most {% url %}s per card
+        user = User(username='bench', is_staff=True)
+
+        rows = {
+            'enrollment': Enrollment.objects.select_related('program', 'school_year', 'student', 'reviewed_by'),
+            'program': Program.objects.all(),
+        }
+        for kind, (template_name, tag) in CARDS.items():
+            objects = list(rows[kind][:options['cards']])
+            if not objects:
+                self.stdout.write(f'No {kind} rows in the database; skipping.')
+                continue
+            objects = list(itertools.islice(itertools.cycle(objects), options['cards']))
+
+            # The card as it was before: the same markup with plain {% url %} tags
+            source = engine.get_template(template_name).source
+            old_card = engine.from_string(source.replace('{% load cards %}\n', '').replace('{% row_url ', '{% url '))
+            variants = {
+                'include + url': (
+                    engine.from_string(f'{{% for {kind} in rows %}}{{% include card with {kind}={kind} %}}{{% endfor %}}'),
+                    {'card': old_card},
+                ),
+                'include + row_url': (
+                    engine.from_string(f"{{% for {kind} in rows %}}{{% include '{template_name}' %}}{{% endfor %}}"),
+                    {},
+                ),
+                f'{tag} tag': (
+                    engine.from_string(f'{{% load cards %}}{{% for {kind} in rows %}}{{% {tag} {kind} %}}{{% endfor %}}'),
+                    {},
+                ),
+            }
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{len(objects)} {kind} cards, {options["repeat"]} renders each'))
+            baseline, reference = None, None
+            for label, (template, extra) in variants.items():
+                timings, output = [], None
+                for _ in range(options['repeat']):
+                    context = Context({'rows': objects, 'user': user, **extra})
+                    started = time.perf_counter()
+                    output = template.render(context)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                normalized = ''.join(output.split())  # whitespace differs by the {% load %} line
+                if reference is None:
+                    reference = normalized
+                elif normalized != reference:
+                    raise CommandError(f'{label} rendered different markup than the old include path.')
+
+                best = min(timings)
+                baseline = baseline or best
+                self.stdout.write(
+                    f'  {label:<22} best {best:8.1f} ms  median {statistics.median(timings):8.1f} ms  '
+                    f'{best * 1000 / len(objects):6.1f} us/card  x{baseline / best:.2f}'
+                )
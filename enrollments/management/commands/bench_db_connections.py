@@ -0,0 +1,67 @@
+import copy
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from enrollments.db.pool import configure_pooling, pool_settings
+from enrollments.models import Program
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per-request latency with a fresh connection per request against pooled '
+        'connections, using the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Simulated requests per run (default: %(default)s).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        original = copy.deepcopy(settings.DATABASES[alias])
+        try:
+            for label, enabled in (('connect per request', False), ('pooled', True)):
+                db = self._unpooled(original)
+                configure_pooling(db, pool_settings({'ENABLED': enabled}))
+                db['CONN_MAX_AGE'] = 0
+                self._swap_connection(alias, db)
+                self._report(label, self._run(alias, options['requests']))
+        finally:
+            self._swap_connection(alias, original)
+
+    def _unpooled(self, original):
+        db = copy.deepcopy(original)
+        db.pop('POOL', None)
+        db.get('OPTIONS', {}).pop('pool', None)
+        db['ENGINE'] = db['ENGINE'].replace('enrollments.db.', 'django.db.backends.')
+        return db
+
+    def _swap_connection(self, alias, db):
+        connections[alias].close()
+        settings.DATABASES[alias] = db
+        connections.settings[alias] = db
+        del connections[alias]
+
+    def _run(self, alias, requests):
+        timings = []
+        connection = connections[alias]
+        for _ in range(requests):
+            started = time.perf_counter()
+            # What one request does: connect (or borrow), a query, close (or return)
+            connection.ensure_connection()
+            Program.objects.using(alias).filter(is_active=True).exists()
+            connection.close()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def _report(self, label, timings):
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{label:>20}: mean {statistics.mean(timings):.3f} ms  '
+            f'p50 {statistics.median(timings):.3f} ms  p95 {p95:.3f} ms'
+        )
@@ -0,0 +1,181 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from enrollments import fees, summaries
+from enrollments.models import (
+    Enrollment, EnrollmentSummary, FeeInstallment, FeeRule, FeeSchedule, Program, SchoolYear, Student,
+)
+
+SEED_PREFIX = 'bench-fee-'
+BENCH_YEAR = 2990
+PROGRAMS_PER_STUDENT = 4
+STATUS_WEIGHTS = {'pending': 30, 'approved': 25, 'enrolled': 35, 'rejected': 5, 'dropped': 5}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time fee recomputation (fees.recompute) for a school year of synthetic enrollments: the dry-run '
+        'diff, the first assessment under a schedule, a re-run with nothing to change, and a new version '
+        'that changes one program, against assessing row by row with save(). Everything runs in one '
+        'transaction that is rolled back at the end (per-batch commits become savepoints), unless --keep.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enrollments', type=int, default=100000, help='(default: %(default)s)')
+        parser.add_argument('--programs', type=int, default=20, help='(default: %(default)s)')
+        parser.add_argument('--batch-size', type=int, default=fees.DEFAULT_BATCH_SIZE, help='(default: %(default)s)')
+        parser.add_argument('--baseline-rows', type=int, default=1000,
+                            help='Rows to assess one save() at a time, extrapolated (default: %(default)s).')
+        parser.add_argument('--keep', action='store_true', help='Commit the synthetic school year instead.')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['random_seed'])
+        with transaction.atomic():
+            school_year, programs = self._seed(options['enrollments'], options['programs'], rng)
+            schedule = self._first_schedule(school_year, programs, rng)
+            total = options['enrollments']
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'\n{total} enrollments, {len(programs)} programs, '
+                f"{schedule.rules.count()} fee rules ({schedule.rules.filter(kind='scholarship').count()} scholarships)"
+            ))
+            self.stdout.write(f"  {'run':<34}{'scanned':>9}{'changed':>9}{'seconds':>9}{'rows/s':>10}")
+            self._baseline(school_year, options['baseline_rows'], total)
+            batch_size = options['batch_size']
+            self._run('dry run, v1 over tuition copies', school_year, schedule, True, batch_size)
+            self._run('apply v1', school_year, None, False, batch_size)
+            self._run('apply v1 again (nothing to do)', school_year, None, False, batch_size)
+
+            v2 = fees.new_version(school_year, notes='Laboratory fee up for one program')
+            FeeRule.objects.filter(schedule=v2, kind='misc', program=programs[0]).update(amount=Decimal('5000.00'))
+            self._run('dry run, draft v2', school_year, v2, True, batch_size)
+            fees.publish(v2)
+            self._run('apply v2 (one program changes)', school_year, None, False, batch_size)
+
+            self._check(school_year)
+            if not options['keep']:
+                transaction.set_rollback(True)
+        if options['keep']:
+            self.stdout.write(f'Kept {school_year} (id {school_year.pk}).')
+
+    def _run(self, label, school_year, schedule, dry_run, batch_size):
+        started = time.perf_counter()
+        report = fees.recompute(school_year, schedule, dry_run=dry_run, statuses=list(STATUS_WEIGHTS), batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"  {label:<34}{report['scanned']:>9}{report['changed']:>9}{elapsed:>9.2f}{report['scanned'] / elapsed:>10,.0f}"
+        )
+
+    def _baseline(self, school_year, rows, total):
+        # The obvious loop: assess and save() every enrollment (signals and all)
+        enrollments = list(Enrollment.objects.filter(school_year=school_year).order_by('-pk')[:rows])
+        started = time.perf_counter()
+        for enrollment in enrollments:
+            enrollment.total_fee = fees.assess(enrollment)
+            enrollment.save(update_fields=['total_fee', 'updated_at'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"  {f'save() per row, {len(enrollments)} rows':<34}{len(enrollments):>9}{len(enrollments):>9}"
+            f'{elapsed:>9.2f}{len(enrollments) / elapsed:>10,.0f}'
+            f'   (~{elapsed * total / len(enrollments):.0f}s for {total})'
+        )
+
+    def _check(self, school_year):
+        # The per-batch summary deltas must add up to what is in the table now
+        live = Enrollment.objects.filter(school_year=school_year).aggregate(total=Sum('total_fee'))['total']
+        summarized = EnrollmentSummary.objects.filter(school_year=school_year).aggregate(total=Sum('total_fee_sum'))['total']
+        style = self.style.SUCCESS if live == summarized else self.style.ERROR
+        self.stdout.write(style(f'  total fees {live:,.2f}, summaries {summarized:,.2f}'))
+
+    # ============================================
+    # SYNTHETIC TERM
+    # ============================================
+
+    def _seed(self, count, program_count, rng, batch_size=5000):
+        started = time.perf_counter()
+        today = timezone.localdate()
+        school_year = SchoolYear.objects.create(
+            year_start=BENCH_YEAR, year_end=BENCH_YEAR + 1, semester='1st', is_active=True,
+            enrollment_start=today, enrollment_end=today + timedelta(days=30),
+        )
+        types = [code for code, _ in Program.PROGRAM_TYPES]
+        programs = Program.objects.bulk_create([
+            Program(
+                code=f'BFEE-{n:02d}', name=f'Bench program {n}', program_type=types[n % len(types)],
+                description='Created by bench_fee_recompute.', duration_years=4,
+                tuition_fee=Decimal(rng.randrange(15000, 60000, 250)),
+            )
+            for n in range(program_count)
+        ])
+
+        students = []
+        for offset in range(0, -(-count // PROGRAMS_PER_STUDENT), batch_size):
+            numbers = range(offset, min(offset + batch_size, -(-count // PROGRAMS_PER_STUDENT)))
+            users = User.objects.bulk_create([User(username=f'{SEED_PREFIX}{n}', password='!') for n in numbers])
+            students += Student.objects.bulk_create([
+                Student(
+                    user=user, student_id=f'BF-{n:07d}', first_name='Bench', last_name=f'Student {n}',
+                    date_of_birth=date(2004, 1, 1), gender='O', contact_number='-',
+                    email=f'{SEED_PREFIX}{n}@example.edu', address='-', guardian_name='-', guardian_contact='-',
+                )
+                for n, user in zip(numbers, users)
+            ])
+
+        statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+        enrollments = []
+        for n in range(count):
+            student = students[n // PROGRAMS_PER_STUDENT]
+            program = programs[(n + n // PROGRAMS_PER_STUDENT) % len(programs)]
+            enrollments.append(Enrollment(
+                enrollment_id=f'BFEE-{n:07d}', student=student, program=program, school_year=school_year,
+                year_level=str(rng.randint(1, 4)), status=rng.choices(statuses, weights)[0],
+                # What save() used to do: a copy of the tuition
+                total_fee=program.tuition_fee,
+            ))
+        Enrollment.objects.bulk_create(enrollments, batch_size=batch_size)
+        summaries.rebuild([program.pk for program in programs])
+        self.stdout.write(f'Seeded {count} enrollments in {time.perf_counter() - started:.1f}s.')
+        return school_year, programs
+
+    def _first_schedule(self, school_year, programs, rng):
+        schedule = FeeSchedule.objects.create(school_year=school_year, version=1, notes='bench_fee_recompute')
+        rules = [
+            FeeRule(schedule=schedule, kind='multiplier', name='3rd year', year_level='3', multiplier=Decimal('1.050')),
+            FeeRule(schedule=schedule, kind='multiplier', name='4th year', year_level='4', multiplier=Decimal('1.100')),
+            FeeRule(schedule=schedule, kind='multiplier', name=f'{programs[1].code} thesis year', program=programs[1],
+                    year_level='4', multiplier=Decimal('1.250')),
+            FeeRule(schedule=schedule, kind='discount', name='Vocational subsidy', program_type='vocational',
+                    percent=Decimal('15.00')),
+            FeeRule(schedule=schedule, kind='misc', name='Library', amount=Decimal('1500.00')),
+            FeeRule(schedule=schedule, kind='misc', name='Athletics', amount=Decimal('750.00')),
+        ]
+        rules += [
+            FeeRule(schedule=schedule, kind='misc', name=f'{program.code} laboratory', program=program,
+                    amount=Decimal(rng.randrange(1000, 4000, 250)))
+            for program in programs if program.program_type == 'undergraduate'
+        ]
+        # About 2% of students have a scholarship
+        scholars = Student.objects.filter(user__username__startswith=SEED_PREFIX).order_by('?')
+        for student in scholars[:max(1, scholars.count() // 50)]:
+            if rng.random() < 0.5:
+                rules.append(FeeRule(schedule=schedule, kind='scholarship', name='Academic', student=student,
+                                     percent=Decimal(rng.choice([25, 50, 100]))))
+            else:
+                rules.append(FeeRule(schedule=schedule, kind='scholarship', name='Grant', student=student,
+                                     amount=Decimal('5000.00')))
+        FeeRule.objects.bulk_create(rules)
+        FeeInstallment.objects.bulk_create([
+            FeeInstallment(schedule=schedule, label=label, due_date=school_year.enrollment_start + timedelta(days=days),
+                           percent=Decimal(percent))
+            for label, days, percent in (('Downpayment', 0, 40), ('Midterms', 60, 30), ('Finals', 120, 30))
+        ])
+        return fees.publish(schedule)
@@ -0,0 +1,124 @@
+import copy
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from enrollments.db import sqlite_profile
+
+PROFILE_OPTIONS = ('init_command', 'transaction_mode', 'timeout')
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare Django's stock SQLite settings with the production profile (enrollments/db/sqlite_profile.py) "
+        'under concurrent gunicorn workers: for each, copy the database, serve the copy with gunicorn and '
+        'run stress_enrollments (reads and writes mixed) against it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='gunicorn (sync) workers (default: %(default)s).')
+        parser.add_argument('--processes', type=int, default=2, help='Client processes (default: %(default)s).')
+        parser.add_argument('--threads', type=int, default=4, help='Client threads per process (default: %(default)s).')
+        parser.add_argument('--duration', type=float, default=15, help='Seconds per profile (default: %(default)s).')
+        parser.add_argument('--students', type=int, default=10, help='Students per client thread (default: %(default)s).')
+        parser.add_argument('--mix', default='browse=6,create=3,approve=1,reject=1,delete=1',
+                            help='Operation weights, as for stress_enrollments (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        original = copy.deepcopy(settings.DATABASES[DEFAULT_DB_ALIAS])
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite' or connections[DEFAULT_DB_ALIAS].is_in_memory_db():
+            raise CommandError('The default database must be an SQLite file.')
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            raise CommandError('Needs gunicorn (pip install gunicorn).')
+
+        with tempfile.TemporaryDirectory(prefix='bench-sqlite-') as workdir:
+            for label, enabled in (('stock', False), ('production profile', True)):
+                path = Path(workdir) / f"{'production' if enabled else 'stock'}.sqlite3"
+                self._copy_database(original['NAME'], path, 'WAL' if enabled else 'DELETE')
+                db = self._profile_db(original, path, enabled)
+                _swap_connection(db)
+                server = None
+                try:
+                    self.stdout.write(self.style.MIGRATE_HEADING(
+                        f"\n{label}: {sqlite_profile.current_pragmas()['journal_mode']} journal, "
+                        f"{options['workers']} gunicorn worker(s), "
+                        f"{options['processes'] * options['threads']} client thread(s)"
+                    ))
+                    server, port = self._start_gunicorn(path, enabled, options['workers'], Path(workdir) / f'{path.stem}.log')
+                    try:
+                        call_command(
+                            'stress_enrollments', url=f'http://127.0.0.1:{port}', mix=options['mix'],
+                            processes=options['processes'], threads=options['threads'],
+                            duration=options['duration'], students=options['students'],
+                            stdout=self.stdout, stderr=self.stderr,
+                        )
+                    except CommandError as exc:
+                        # Keep going: the other profile's numbers are the point
+                        self.stdout.write(self.style.WARNING(f'  {exc}'))
+                finally:
+                    if server is not None:
+                        server.terminate()
+                        server.wait(timeout=STARTUP_TIMEOUT)
+                    _swap_connection(original)
+
+    def _copy_database(self, source, target, journal_mode):
+        source_connection = sqlite3.connect(str(source))
+        target_connection = sqlite3.connect(str(target))
+        try:
+            source_connection.backup(target_connection)
+            target_connection.execute(f'PRAGMA journal_mode = {journal_mode}')
+        finally:
+            source_connection.close()
+            target_connection.close()
+
+    def _profile_db(self, original, path, enabled):
+        """`original` pointed at `path`, with only the profile's options or only Django's."""
+        db = copy.deepcopy(original)
+        db['NAME'] = str(path)
+        for option in PROFILE_OPTIONS:
+            db.setdefault('OPTIONS', {}).pop(option, None)
+        return sqlite_profile.configure_sqlite(db, sqlite_profile.sqlite_settings({'ENABLED': enabled}))
+
+    def _start_gunicorn(self, path, enabled, workers, log_path):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', DB_SQLITE_ENABLED=str(enabled))
+        with open(log_path, 'w') as log:
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', 'enrollment_system.wsgi:application',
+                 '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+                cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited:\n{log_path.read_text()[-2000:]}')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server, port
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'gunicorn did not start listening within {STARTUP_TIMEOUT}s.')
+
+
+def _swap_connection(db):
+    connections[DEFAULT_DB_ALIAS].close()
+    settings.DATABASES[DEFAULT_DB_ALIAS] = db
+    connections.settings[DEFAULT_DB_ALIAS] = db
+    del connections[DEFAULT_DB_ALIAS]
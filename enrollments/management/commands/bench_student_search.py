@@ -0,0 +1,152 @@
+import json
+import random
+import statistics
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+
+from enrollments import search
+from enrollments.models import Student, StudentSearchToken
+from enrollments.views import student_search_view
+
+SEED_PREFIX = 'bench-student-'
+
+FIRST_NAMES = [
+    'Juan', 'Jose', 'Maria', 'Ma. Cristina', 'John Paul', 'Mark Anthony', 'Jhon', 'Rhea', 'Kristine',
+    'Angelica', 'Jericho', 'Niño', 'Felipe', 'Vicente', 'Enrique', 'Cecilia', 'Rosario', 'Miguel',
+    'Princess', 'Jonathan', 'Michelle', 'Carlo', 'Lorenzo', 'Ysabel', 'Joshua', 'Althea', 'Rodel',
+]
+LAST_NAMES = [
+    'Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Bautista', 'Villanueva', 'Ramos', 'Aquino',
+    'Castillo', 'Rodriguez', 'Gonzales', 'Fernandez', 'Lopez', 'De Guzman', 'Pascual', 'Domingo',
+    'Nuñez', 'Macapagal', 'Dimaculangan', 'Evangelista', 'Quiambao', 'Sarmiento', 'Tolentino', 'Ocampo',
+]
+
+# How people mistype the names above (spellings that sound the same)
+MISSPELLINGS = [
+    ('Jo', 'Jho'), ('z', 's'), ('ca', 'ka'), ('co', 'ko'), ('cu', 'ku'), ('ce', 'se'), ('ci', 'si'),
+    ('v', 'b'), ('F', 'P'), ('o', 'u'), ('e', 'i'), ('ñ', 'ny'), ('ll', 'l'), ('th', 't'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Time student typeahead queries (prefixes, full names, misspellings, student IDs) against '
+        'the current database, optionally seeding synthetic students first. Use a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Synthetic students to add first.')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded students and exit.')
+        parser.add_argument('--queries', type=int, default=500, help='Queries per kind (default: %(default)s).')
+        parser.add_argument('--endpoint', action='store_true',
+                            help='Time the students/search.json view instead of search.typeahead().')
+        parser.add_argument('--random-seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['random_seed'])
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=SEED_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} seeded row(s).')
+            return
+        if options['seed']:
+            self._seed(options['seed'], rng)
+
+        total = Student.objects.count()
+        if not total:
+            raise CommandError('No students to search; pass --seed N.')
+        sample = list(
+            Student.objects.order_by('?')
+            .values_list('pk', 'student_id', 'first_name', 'last_name')[:options['queries']]
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{total} students, {StudentSearchToken.objects.count()} tokens, {len(sample)} queries per kind'
+        ))
+
+        run = self._endpoint_runner() if options['endpoint'] else search.typeahead
+        # (query, does a result count as finding the student) per kind. Names
+        # repeat a lot, so any namesake of the student is a hit.
+        kinds = {
+            'last name prefix': (lambda s: s[3][:rng.randint(2, 5)], None),
+            'first + last prefix': (lambda s: f'{s[2]} {s[3][:3]}', None),
+            'full name': (lambda s: f'{s[2]} {s[3]}', self._namesake),
+            'misspelled name': (lambda s: self._misspell(f'{s[2]} {s[3]}', rng), self._namesake),
+            'student id': (lambda s: s[1], lambda s, r: r['id'] == s[0]),
+        }
+        for label, (make_query, is_hit) in kinds.items():
+            timings, hits = [], 0
+            run('warm up')
+            for student in sample:
+                query = make_query(student)
+                started = time.perf_counter()
+                results = run(query)
+                timings.append((time.perf_counter() - started) * 1000)
+                if is_hit:
+                    hits += any(is_hit(student, r) for r in results)
+
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+            found = f'found in top {search.DEFAULT_LIMIT}: {hits * 100 / len(sample):5.1f}%' if is_hit else ''
+            self.stdout.write(
+                f'  {label:<20} p50 {statistics.median(timings):6.2f} ms  p95 {p95:6.2f} ms  '
+                f'max {timings[-1]:6.2f} ms  {found}'
+            )
+
+    @staticmethod
+    def _namesake(student, result):
+        name = search.normalize(result['name'])
+        return result['id'] == student[0] or (
+            name.startswith(search.normalize(student[2]) + ' ') and name.endswith(' ' + search.normalize(student[3]))
+        )
+
+    def _endpoint_runner(self):
+        factory = RequestFactory()
+        user = User(username='bench', is_staff=True)
+
+        def run(query):
+            request = factory.get('/students/search.json', {'q': query})
+            request.user = user
+            return json.loads(student_search_view(request).content)['results']
+        return run
+
+    @staticmethod
+    def _misspell(name, rng):
+        options = [(a, b) for a, b in MISSPELLINGS if a in name]
+        if not options:
+            return name
+        wrong, right = rng.choice(options)
+        return name.replace(wrong, right, 1)
+
+    def _seed(self, count, rng, batch_size=5000):
+        start = User.objects.filter(username__startswith=SEED_PREFIX).count()
+        started = time.perf_counter()
+        for offset in range(start, start + count, batch_size):
+            numbers = range(offset, min(offset + batch_size, start + count))
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'{SEED_PREFIX}{n}', password='!') for n in numbers
+                ])
+                students = []
+                for n, user in zip(numbers, users):
+                    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                    student = Student(
+                        user=user, student_id=f'B{2000 + n % 25}-{n:07d}',
+                        first_name=first, middle_name=rng.choice(LAST_NAMES), last_name=last,
+                        date_of_birth=date(2004, 1, 1), gender='O', contact_number='09170000000',
+                        email=f'{first.split()[0].lower()}.{n}@example.edu', address='-',
+                        guardian_name='-', guardian_contact='-',
+                    )
+                    student.search_text = search.search_text(search.student_tokens(student))
+                    students.append(student)
+                # bulk_create skips the signals, so write the tokens here
+                students = Student.objects.bulk_create(students)
+                StudentSearchToken.objects.bulk_create(
+                    [row for s in students for row in search._token_rows(StudentSearchToken, s.pk, search.student_tokens(s))],
+                    batch_size=batch_size,
+                )
+            self.stdout.write(f'  seeded {numbers[-1] + 1 - start}/{count} students', ending='\r')
+        self.stdout.write(f'\nSeeded {count} students in {time.perf_counter() - started:.0f} s.')
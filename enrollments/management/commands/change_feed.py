@@ -0,0 +1,44 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from enrollments import changefeed
+
+
+class Command(BaseCommand):
+    help = (
+        'Print change-feed entries after a cursor as JSON lines, followed by a trailer '
+        'line with the cursor to pass as --after next time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=int, default=0, help='Last sequence number already processed.')
+        parser.add_argument('--limit', type=int, default=changefeed.DEFAULT_LIMIT,
+                            help='Maximum entries per batch (default: %(default)s).')
+        parser.add_argument('--model', action='append', dest='models',
+                            help="Only this model, e.g. 'enrollments.enrollment' (repeatable).")
+        parser.add_argument('--all', action='store_true',
+                            help='Keep fetching batches until the feed is exhausted.')
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        out = open(options['output'], 'w', encoding='utf-8') if options['output'] else sys.stdout
+        cursor = options['after']
+        limit = changefeed.clamp_limit(options['limit'])
+        total = 0
+        try:
+            while True:
+                count = 0
+                for entry in changefeed.fetch(after=cursor, limit=limit, models=options['models']).iterator():
+                    out.write(json.dumps(changefeed.entry_to_dict(entry), cls=DjangoJSONEncoder) + '\n')
+                    cursor = entry.id
+                    count += 1
+                total += count
+                if not options['all'] or count < limit:
+                    break
+            out.write(json.dumps({'cursor': cursor, 'count': total}) + '\n')
+        finally:
+            if out is not sys.stdout:
+                out.close()
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from enrollments import schedules
+from enrollments.models import SchoolYear, Student
+
+
+class Command(BaseCommand):
+    help = (
+        'List students whose active enrollments in a term have sections meeting at the same time. '
+        'Sweeps the term once (see enrollments/schedules.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school-year', type=int, action='append', dest='school_years',
+                            help='Check this school year id (repeatable). Default: every active one.')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Conflicts to print per school year (default: %(default)s, 0 for all).')
+
+    def handle(self, *args, **options):
+        school_years = SchoolYear.objects.filter(is_active=True)
+        if options['school_years']:
+            school_years = SchoolYear.objects.filter(pk__in=options['school_years'])
+
+        for school_year in school_years:
+            started = time.perf_counter()
+            conflicts = list(schedules.term_conflicts(school_year))
+            elapsed = time.perf_counter() - started
+
+            shown = conflicts[:options['limit']] if options['limit'] else conflicts
+            student_ids = dict(
+                Student.objects.filter(pk__in={c.student_id for c in shown}).values_list('pk', 'student_id')
+            )
+            for conflict in shown:
+                self.stdout.write(
+                    f'  {student_ids.get(conflict.student_id, conflict.student_id)}: '
+                    f'{schedules.conflict_display(conflict.first, conflict.second)}'
+                )
+            if len(shown) < len(conflicts):
+                self.stdout.write(f'  ... and {len(conflicts) - len(shown)} more')
+
+            students = len({c.student_id for c in conflicts})
+            style = self.style.WARNING if conflicts else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{school_year}: {len(conflicts)} conflict(s) affecting {students} student(s) ({elapsed:.2f}s)'
+            ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from enrollments.db import sqlite_profile
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite write-ahead log back into the database (PRAGMA wal_checkpoint). '
+        'PASSIVE never blocks the app; TRUNCATE waits for a quiet moment and empties the -wal file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default='PASSIVE', type=str.upper, choices=sqlite_profile.CHECKPOINT_MODES,
+                            help='Checkpoint mode (default: %(default)s).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--every', type=float, default=0,
+                            help='Keep running, one checkpoint every this many seconds.')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if connections[alias].vendor != 'sqlite':
+            raise CommandError(f"The '{alias}' database isn't SQLite.")
+        if sqlite_profile.current_pragmas(alias)['journal_mode'] != 'wal':
+            raise CommandError(f"The '{alias}' database isn't in WAL mode; there is nothing to checkpoint.")
+
+        while True:
+            size_before = sqlite_profile.wal_size(alias)
+            started = time.perf_counter()
+            result = sqlite_profile.checkpoint(alias, options['mode'])
+            line = (
+                f"{options['mode']}: {result['checkpointed_pages']}/{result['wal_pages']} WAL page(s) checkpointed, "
+                f"-wal {size_before / 1024:.0f} KiB -> {sqlite_profile.wal_size(alias) / 1024:.0f} KiB "
+                f"({time.perf_counter() - started:.3f}s)"
+            )
+            if result['busy']:
+                self.stdout.write(self.style.WARNING(f'{line}; blocked by readers or a writer, incomplete'))
+            else:
+                self.stdout.write(line)
+            if not options['every']:
+                return
+            # Don't hold a connection (or a WAL snapshot) between runs
+            connections[alias].close()
+            time.sleep(options['every'])
@@ -0,0 +1,153 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter, the way a new lambda does: import the WSGI
+# app, then serve the same request twice
+PROBE = '''
+import io, json, sys, time
+started = time.perf_counter()
+from enrollment_system.wsgi import application
+imported = time.perf_counter()
+
+def get(path, host):
+    statuses = []
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': host,
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(response)
+    getattr(response, 'close', lambda: None)()
+    return statuses[0]
+
+status = get(sys.argv[1], sys.argv[2])
+first = time.perf_counter()
+first_wall = time.time()
+first_cpu = time.process_time()
+get(sys.argv[1], sys.argv[2])
+second = time.perf_counter()
+print(json.dumps({
+    'status': status,
+    'import_ms': (imported - started) * 1000,
+    'first_ms': (first - imported) * 1000,
+    'second_ms': (second - first) * 1000,
+    'first_wall': first_wall,
+    'ttfr_cpu_ms': first_cpu * 1000,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure cold starts of the WSGI entry point in fresh interpreters: time to first '
+        'response and an import-time breakdown (python -X importtime), with and without '
+        'COLD_START_MODE.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/login/', help='Request path to time (default: %(default)s).')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode (default: %(default)s).')
+        parser.add_argument('--top', type=int, default=15, help='Modules/packages to list (default: %(default)s).')
+        parser.add_argument('--mode', choices=('both', 'default', 'cold-start'), default='both')
+
+    def handle(self, *args, **options):
+        modes = [('default', '0'), ('cold-start', '1')]
+        if options['mode'] != 'both':
+            modes = [m for m in modes if m[0] == options['mode']]
+
+        envs = {
+            label: dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE, COLD_START_MODE=flag)
+            for label, flag in modes
+        }
+        # Alternate the modes so drift in machine load hits both alike
+        results = {label: [] for label in envs}
+        for _ in range(options['runs']):
+            for label, env in envs.items():
+                results[label].append(self._probe(env, options))
+
+        for label, env in envs.items():
+            self._report_timings(label, results[label])
+            self._report_imports(label, self._importtime(env, options), options['top'])
+
+        if len(results) == 2:
+            self.stdout.write('')
+            for key, title in (('ttfr_ms', 'Time to first response'), ('ttfr_cpu_ms', 'CPU to first response')):
+                before = statistics.median(r[key] for r in results['default'])
+                after = statistics.median(r[key] for r in results['cold-start'])
+                self.stdout.write(f'{title} (median): {before:.0f} ms -> {after:.0f} ms '
+                                  f'({(after - before) / before * 100:+.1f}%)')
+
+    # ============================================
+    # PROBES
+    # ============================================
+
+    def _run(self, env, options, extra_args=()):
+        spawned = time.time()
+        proc = subprocess.run(
+            [sys.executable, *extra_args, '-c', PROBE, options['path'], options['host']],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode:
+            raise CommandError(f'Probe process failed:\n{proc.stderr[-2000:]}')
+        return spawned, proc
+
+    def _probe(self, env, options):
+        spawned, proc = self._run(env, options)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        # Includes interpreter startup, which the in-process timers can't see
+        result['ttfr_ms'] = (result['first_wall'] - spawned) * 1000
+        return result
+
+    def _importtime(self, env, options):
+        _, proc = self._run(env, options, ('-X', 'importtime'))
+        modules = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+        return modules
+
+    # ============================================
+    # OUTPUT
+    # ============================================
+
+    def _report_timings(self, label, runs):
+        def line(title, key, note=''):
+            values = [r[key] for r in runs]
+            self.stdout.write(f'  {title:<24} median {statistics.median(values):7.1f} ms  '
+                              f'min {min(values):7.1f} ms  {note}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label} ({len(runs)} runs)'))
+        line('import + django.setup():', 'import_ms')
+        line('first request:', 'first_ms', f'({runs[0]["status"]})')
+        line('second request:', 'second_ms')
+        line('time to first response:', 'ttfr_ms', '(from process spawn)')
+        line('CPU to first response:', 'ttfr_cpu_ms', '(less sensitive to machine load)')
+
+    def _report_imports(self, label, modules, top):
+        total_ms = sum(m[1] for m in modules) / 1000
+        self.stdout.write(f'  {len(modules)} modules imported, {total_ms:.1f} ms (under -X importtime)')
+
+        packages = {}
+        for name, self_us, _ in modules:
+            parts = name.split('.')
+            package = '.'.join(parts[:3] if parts[0] == 'django' and len(parts) > 2 else parts[:2])
+            packages[package] = packages.get(package, 0) + self_us
+
+        self.stdout.write('  by package (self time):')
+        for package, us in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+            self.stdout.write(f'    {us / 1000:8.1f} ms  {package}')
+        self.stdout.write('  slowest modules (self | cumulative):')
+        for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[1])[:top]:
+            self.stdout.write(f'    {self_us / 1000:8.1f} | {cumulative_us / 1000:8.1f} ms  {name}')
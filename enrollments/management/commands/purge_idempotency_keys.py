@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from enrollments import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys past IDEMPOTENCY_KEY_TTL (run it daily, like clearsessions).'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Deleted {idempotency.purge_expired()} expired idempotency key(s).')
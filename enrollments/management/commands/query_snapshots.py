@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from enrollments import snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Group and count enrollments across term snapshots, without touching the database. '
+        'e.g. --by term,program_type --where status=approved,enrolled --sum total_fee_cents'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Snapshot files. Default: every one in settings.SNAPSHOT_DIR.')
+        parser.add_argument('--by', default='term', help='Comma-separated columns to group by (default: %(default)s).')
+        parser.add_argument('--where', action='append', default=[], metavar='COLUMN=VALUE[,VALUE...]',
+                            help='Keep rows whose column has one of the values (repeatable; all must match).')
+        parser.add_argument('--sum', default='', help='Comma-separated integer columns to add up.')
+        parser.add_argument('--columns', action='store_true', help="List the snapshots' columns and exit.")
+
+    def handle(self, *args, **options):
+        paths = options['files'] or snapshots.snapshot_files()
+        if not paths:
+            raise CommandError(f'No snapshots in {snapshots.snapshot_dir()}; run snapshot_terms first.')
+
+        if options['columns']:
+            with snapshots.Snapshot(paths[0]) as snapshot:
+                self.stdout.write(f'{snapshots.TERM_COLUMN} (from the header)')
+                for name, column in snapshot.columns.items():
+                    distinct = f", {len(column['dictionary'])} distinct" if column['kind'] == 'dict' else ''
+                    self.stdout.write(f"{name} ({column['kind']}{distinct})")
+            return
+
+        by = [name for name in options['by'].split(',') if name]
+        sums = [name for name in options['sum'].split(',') if name]
+        where = {}
+        for condition in options['where']:
+            name, _, values = condition.partition('=')
+            if not values:
+                raise CommandError(f'--where {condition!r}: expected COLUMN=VALUE[,VALUE...]')
+            # Compared as text: year levels are stored as strings, durations as integers
+            allowed = frozenset(values.split(','))
+            where[name] = lambda value, allowed=allowed: str(value) in allowed
+
+        started = time.perf_counter()
+        try:
+            groups = snapshots.group_by_terms(paths, by, where=where, sums=sums)
+        except snapshots.SnapshotError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write('\t'.join([*by, 'count', *sums]))
+        for key, measures in sorted(groups.items(), key=lambda item: tuple(map(str, item[0]))):
+            self.stdout.write('\t'.join(str(value) for value in [*key, *measures.values()]))
+        rows = sum(measures['count'] for measures in groups.values())
+        self.stdout.write(f'{rows} row(s) in {len(groups)} group(s) from {len(paths)} snapshot(s) in {elapsed:.3f}s')
+
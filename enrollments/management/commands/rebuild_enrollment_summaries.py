@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from enrollments import summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the EnrollmentSummary table from live enrollments (safe to run while the site is up).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--program', type=int, action='append', dest='programs',
+            help='Only rebuild this program id (can be given more than once).',
+        )
+
+    def handle(self, *args, **options):
+        rebuilt = summaries.rebuild(options['programs'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt enrollment summaries for {rebuilt} program(s).'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from enrollments import search
+
+
+class Command(BaseCommand):
+    help = 'Recompute Student.search_text and the student search tokens (after bulk loads that skip signals).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = search.rebuild(batch_size=options['batch_size'])
+        words = search.rebuild_words(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} student(s) and {words} word(s) for search.'))
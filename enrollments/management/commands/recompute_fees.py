@@ -0,0 +1,98 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from enrollments import fees
+from enrollments.models import Enrollment, FeeSchedule, Program, SchoolYear
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-assess a school year's enrollment fees under its fee schedule in effect and write the ones "
+        'that changed. --dry-run reports the differences instead (also for a draft --schedule-version).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('school_year', type=int, help='School year id.')
+        parser.add_argument('--schedule-version', type=int, help='Schedule version to assess with (default: the one in effect).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change.')
+        parser.add_argument('--status', action='append', dest='statuses', choices=[s for s, _ in Enrollment.STATUS_CHOICES],
+                            help=f"Enrollment status to re-assess (repeatable; default: {', '.join(fees.ASSESSED_STATUSES)}).")
+        parser.add_argument('--batch-size', type=int, default=fees.DEFAULT_BATCH_SIZE,
+                            help='Enrollments per transaction (default: %(default)s).')
+        parser.add_argument('--sample', type=int, default=fees.DEFAULT_SAMPLE,
+                            help='Changed enrollments to list (default: %(default)s).')
+        parser.add_argument('--explain', metavar='ENROLLMENT_ID',
+                            help="Show how one enrollment's fee is assessed, with its installments, and exit.")
+
+    def handle(self, *args, **options):
+        try:
+            school_year = SchoolYear.objects.get(pk=options['school_year'])
+        except SchoolYear.DoesNotExist as exc:
+            raise CommandError(str(exc))
+
+        schedule = fees.current_schedule(school_year)
+        if options['schedule_version'] is not None:
+            try:
+                schedule = FeeSchedule.objects.get(school_year=school_year, version=options['schedule_version'])
+            except FeeSchedule.DoesNotExist:
+                raise CommandError(f"{school_year} has no fee schedule version {options['schedule_version']}.")
+
+        if options['explain']:
+            self._explain(school_year, schedule, options['explain'])
+            return
+
+        def progress(done, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {done}/{total}')
+
+        started = time.perf_counter()
+        try:
+            report = fees.recompute(
+                school_year, schedule, dry_run=options['dry_run'],
+                statuses=options['statuses'] or fees.ASSESSED_STATUSES,
+                batch_size=options['batch_size'], sample=options['sample'], progress=progress,
+            )
+        except fees.FeeError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        codes = dict(Program.objects.values_list('pk', 'code'))
+        if report['changes']:
+            self.stdout.write('enrollment\tprogram\tyear\tstatus\told\tnew')
+            for change in report['changes']:
+                self.stdout.write('\t'.join(str(value) for value in (
+                    change.enrollment_id, codes.get(change.program_id), change.year_level, change.status,
+                    change.old, change.new,
+                )))
+            if report['changed'] > len(report['changes']):
+                self.stdout.write(f"... and {report['changed'] - len(report['changes'])} more")
+        for program_id, (changed, net) in sorted(report['by_program'].items(), key=lambda item: codes[item[0]]):
+            self.stdout.write(f'  {codes[program_id]}: {changed} enrollment(s), {net:+,.2f}')
+
+        verb = 'would change' if options['dry_run'] else 'changed'
+        schedule = report['schedule']
+        assessed_by = (
+            f"fees v{schedule.version}{'' if schedule.published_at else ' (draft)'}" if schedule
+            else 'program tuition (no schedule published)'
+        )
+        summary = (
+            f"{school_year} under {assessed_by}: "
+            f"{report['changed']} of {report['scanned']} fee(s) {verb} "
+            f"(+{report['increase']:,.2f} / -{report['decrease']:,.2f}) in {elapsed:.1f}s"
+        )
+        self.stdout.write(summary if options['dry_run'] else self.style.SUCCESS(summary))
+
+    def _explain(self, school_year, schedule, enrollment_id):
+        try:
+            enrollment = Enrollment.objects.select_related('program').get(school_year=school_year, enrollment_id=enrollment_id)
+        except Enrollment.DoesNotExist:
+            raise CommandError(f'No enrollment {enrollment_id} in {school_year}.')
+        rules = fees.Rules(schedule)
+        breakdown = rules.breakdown(enrollment.program_id, enrollment.year_level, enrollment.student_id)
+        self.stdout.write(f"{enrollment_id}: {enrollment.program.code}, year {enrollment.year_level}, under {schedule or 'no schedule'}")
+        for name in breakdown._fields:
+            self.stdout.write(f'  {name:<12}{getattr(breakdown, name):>12,.2f}')
+        self.stdout.write(f'  {"assessed":<12}{enrollment.total_fee:>12,.2f}')
+        for label, due_date, amount in rules.installment_plan(breakdown.total):
+            self.stdout.write(f"  {label} ({due_date or 'upon enrollment'}): {amount:,.2f}")
@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from enrollments.db.sqlite_profile import SQLITE_ENGINES
+from enrollments.replicas import replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        'Local stand-in for replication: copy the SQLite primary database into each SQLite '
+        'replica every --lag seconds, so replica reads are up to that far behind.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lag', type=float, default=2.0, help='Seconds between copies (default: %(default)s).')
+        parser.add_argument('--once', action='store_true', help='Copy once and exit.')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = [settings.DATABASES[alias] for alias in replica_aliases()]
+        engines = {db['ENGINE'] for db in [primary] + replicas}
+        if not replicas:
+            raise CommandError('No replicas configured; set DATABASE_REPLICA_URLS.')
+        # Django's backend or the profile's (enrollments.db.sqlite3, see sqlite_profile.py)
+        if not engines <= set(SQLITE_ENGINES):
+            raise CommandError('replicate_sqlite only works when the primary and all replicas are SQLite files.')
+
+        while True:
+            started = time.perf_counter()
+            for replica in replicas:
+                source = sqlite3.connect(str(primary['NAME']))
+                target = sqlite3.connect(str(replica['NAME']))
+                try:
+                    source.backup(target)
+                finally:
+                    source.close()
+                    target.close()
+            self.stdout.write(f'Replicated to {len(replicas)} replica(s) in {time.perf_counter() - started:.3f}s')
+            if options['once']:
+                return
+            time.sleep(options['lag'])
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from enrollments import rollover
+from enrollments.models import SchoolYear
+
+
+class Command(BaseCommand):
+    help = (
+        'Create pending enrollments in the target school year for continuing students of the '
+        'source one (same program, next year level). Safe to interrupt and re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=int, help='School year id to roll over from.')
+        parser.add_argument('target', type=int, help='School year id to enroll students in.')
+        parser.add_argument('--batch-size', type=int, default=rollover.DEFAULT_BATCH_SIZE,
+                            help='Enrollments created per transaction (default: %(default)s).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be created.')
+
+    def handle(self, *args, **options):
+        try:
+            source = SchoolYear.objects.get(pk=options['source'])
+            target = SchoolYear.objects.get(pk=options['target'])
+        except SchoolYear.DoesNotExist as exc:
+            raise CommandError(str(exc))
+
+        started = time.perf_counter()
+        try:
+            if options['dry_run']:
+                counts = rollover.preview(source, target)
+                self.stdout.write(
+                    f"{source} -> {target}: {counts['eligible']} eligible, {counts['to_create']} to create, "
+                    f"{counts['already_enrolled']} already enrolled, {counts['completed']} completed the program"
+                )
+                return
+
+            def progress(done, total):
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {done}/{total}')
+
+            counts = rollover.roll_over(source, target, batch_size=options['batch_size'], progress=progress)
+        except rollover.RolloverError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{source} -> {target}: created {counts['created']} enrollment(s), "
+            f"{counts['completed']} student(s) completed the program ({time.perf_counter() - started:.1f}s)"
+        ))
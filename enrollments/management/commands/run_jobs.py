@@ -0,0 +1,85 @@
+import multiprocessing
+import signal
+import threading
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+# Only Django itself is imported up here: with the 'spawn' start method
+# (Windows, macOS) worker processes import this module before
+# django.setup(), so enrollments.jobs is imported inside the functions.
+
+
+def _work(stop, options):
+    from enrollments import jobs
+
+    return jobs.work(
+        stop, batch_size=options['batch'], poll_interval=options['poll_interval'],
+        timeout=options['visibility_timeout'], once=options['once'],
+    )
+
+
+def _process_main(stop, options):
+    django.setup()
+    # The parent decides when to stop; finish the current job first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    _work(stop, options)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background jobs (enrollments/jobs.py) until stopped. Ctrl-C or SIGTERM finishes the '
+        'jobs in hand and exits; a second one exits right away and the unfinished jobs are picked '
+        'up again once their visibility timeout runs out.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker processes (default: %(default)s).')
+        parser.add_argument('--threads', action='store_true', help='Use threads instead of processes.')
+        parser.add_argument('--batch', type=int, default=1, help='Jobs each worker claims at a time.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty (default: %(default)s).')
+        parser.add_argument('--visibility-timeout', type=int, default=None,
+                            help='Seconds a claimed job stays hidden from other workers without reporting '
+                                 'progress (default: settings.JOB_VISIBILITY_TIMEOUT).')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1 or options['batch'] < 1:
+            raise CommandError('--concurrency and --batch must be at least 1.')
+
+        if options['threads'] or concurrency == 1:
+            stop = threading.Event()
+            workers = [threading.Thread(target=_work, args=(stop, options), daemon=True) for _ in range(concurrency)]
+        else:
+            from django.db import connections
+
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            stop = multiprocessing.Event()
+            workers = [multiprocessing.Process(target=_process_main, args=(stop, options)) for _ in range(concurrency)]
+
+        def shut_down(signum, frame):
+            if stop.is_set():
+                self.stdout.write(self.style.WARNING('Stopping now.'))
+                for worker in workers:
+                    if isinstance(worker, multiprocessing.Process):
+                        worker.kill()
+                raise SystemExit(1)
+            self.stdout.write('Finishing the current jobs (press Ctrl-C again to stop now)...')
+            stop.set()
+
+        signal.signal(signal.SIGINT, shut_down)
+        signal.signal(signal.SIGTERM, shut_down)
+
+        kind = 'thread' if isinstance(stop, threading.Event) else 'process'
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Running jobs with {concurrency} {kind} worker(s).'))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            # Short joins so the main thread keeps handling signals
+            while worker.is_alive():
+                worker.join(0.5)
+        self.stdout.write('Stopped.')
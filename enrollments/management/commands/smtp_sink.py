@@ -0,0 +1,97 @@
+import asyncio
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local SMTP server that accepts and discards every message, to try out e-mail '
+        'delivery (EMAIL_HOST=localhost EMAIL_PORT=1025). Reports connections and messages.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--print', action='store_true', dest='print_messages', help='Print each message.')
+        parser.add_argument('--fail-every', type=int, default=0,
+                            help='Answer every Nth message with a temporary 451 error, to exercise retries.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.connections = self.messages = self.failed = 0
+        self.recipients = {}
+        # Stop (and report) on SIGTERM too, not just Ctrl-C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+        repeated = sum(1 for count in self.recipients.values() if count > 1)
+        self.stdout.write(
+            f'\n{self.messages} message(s) over {self.connections} connection(s), {self.failed} refused with 451, '
+            f'{len(self.recipients)} recipient(s), {repeated} of them got more than one message.'
+        )
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._session, self.options['host'], self.options['port'])
+        self.stdout.write(f"SMTP sink listening on {self.options['host']}:{self.options['port']} (Ctrl-C to stop).")
+        async with server:
+            last = None
+            while True:
+                await asyncio.sleep(5)
+                if (self.connections, self.messages) != last:
+                    last = (self.connections, self.messages)
+                    self.stdout.write(f'{time.strftime("%H:%M:%S")}  {self.messages} message(s), '
+                                      f'{self.connections} connection(s)')
+
+    async def _session(self, reader, writer):
+        self.connections += 1
+
+        def reply(line):
+            writer.write(line.encode() + b'\r\n')
+
+        reply('220 localhost smtp_sink')
+        recipients = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            verb = line[:4].upper()
+            if verb == b'EHLO':
+                reply('250-localhost')
+                reply('250-8BITMIME')
+                reply('250 SMTPUTF8')
+            elif verb in (b'HELO', b'MAIL', b'NOOP'):
+                reply('250 OK')
+            elif verb == b'RSET':
+                recipients = []
+                reply('250 OK')
+            elif verb == b'RCPT':
+                recipients.append(line[8:].strip(b' <>\r\n').decode(errors='replace'))
+                reply('250 OK')
+            elif verb == b'DATA':
+                reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while (chunk := await reader.readline()) not in (b'.\r\n', b''):
+                    data.append(chunk)
+                every = self.options['fail_every']
+                if every and (self.messages + self.failed + 1) % every == 0:
+                    self.failed += 1
+                    reply('451 Try again later')
+                else:
+                    self.messages += 1
+                    for recipient in recipients:
+                        self.recipients[recipient] = self.recipients.get(recipient, 0) + 1
+                    if self.options['print_messages']:
+                        self.stdout.write(b''.join(data).decode(errors='replace'))
+                    reply('250 OK')
+                recipients = []
+            elif verb == b'QUIT':
+                reply('221 Bye')
+                break
+            else:
+                reply('502 Command not implemented')
+            await writer.drain()
+        writer.close()
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from enrollments import snapshots
+from enrollments.models import SchoolYear
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the enrollments of closed (inactive) school years, with their student and program, '
+        'to columnar snapshot files for analyses (see query_snapshots). Existing snapshots are kept '
+        'unless --force is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--school-year', type=int, action='append', dest='school_years',
+                            help='Snapshot this school year id (repeatable). Default: every inactive one.')
+        parser.add_argument('--output-dir', help='Default: settings.SNAPSHOT_DIR.')
+        parser.add_argument('--force', action='store_true', help='Rewrite snapshots that already exist.')
+
+    def handle(self, *args, **options):
+        school_years = SchoolYear.objects.filter(is_active=False)
+        if options['school_years']:
+            school_years = SchoolYear.objects.filter(pk__in=options['school_years'])
+
+        written = 0
+        for school_year in school_years.order_by('year_start', 'semester'):
+            path = snapshots.snapshot_path(school_year, options['output_dir'])
+            if path.exists() and not options['force']:
+                self.stdout.write(f'{school_year}: {path} exists, skipped')
+                continue
+            started = time.perf_counter()
+            try:
+                path, rows = snapshots.write_snapshot(school_year, path)
+            except snapshots.SnapshotError as exc:
+                raise CommandError(str(exc))
+            written += 1
+            self.stdout.write(
+                f'{school_year}: {rows} enrollment(s), {path.stat().st_size / 1024:.0f} KiB -> {path} '
+                f'({time.perf_counter() - started:.1f}s)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} snapshot(s).'))
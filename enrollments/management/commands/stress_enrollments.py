@@ -0,0 +1,519 @@
+import copy
+import http.client
+import logging
+import os
+import random
+import re
+import secrets
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from http.cookies import SimpleCookie
+from multiprocessing import get_context
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models are imported inside the methods: the client processes import this
+# module under spawn, before (and without) Django being set up
+
+OPERATIONS = ('browse', 'create', 'approve', 'reject', 'delete')
+PROGRAMS = 3
+FEED_INTERVAL = 0.1
+FEED_SIZE = 300
+ERROR_SAMPLES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer the enrollment write path (create, approve, reject, delete; optionally mixed with '
+        'browse, the staff enrollment list) from pools of client processes and threads over HTTP, then check the invariants: unique enrollment IDs, one '
+        'review per enrollment, one decision notification per reviewed enrollment, summaries '
+        'matching the rows. Runs against the configured database, then against Postgres too when '
+        '--postgres-url (or STRESS_POSTGRES_URL) points at one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Client processes (default: %(default)s).')
+        parser.add_argument('--threads', type=int, default=4, help='Client threads per process (default: %(default)s).')
+        parser.add_argument('--duration', type=float, default=15, help='Seconds of load per database (default: %(default)s).')
+        parser.add_argument('--students', type=int, default=20, help='Students per client thread (default: %(default)s).')
+        parser.add_argument('--mix', default='create=4,approve=2,reject=1,delete=1',
+                            help='Relative weights of the operations (default: %(default)s).')
+        parser.add_argument('--url', help='Use this running server (same database) instead of starting one. '
+                                          'Lock waits are only measured for the built-in server.')
+        parser.add_argument('--postgres-url', default=os.getenv('STRESS_POSTGRES_URL', ''),
+                            help='A scratch Postgres database to run against as well; it gets migrated.')
+        parser.add_argument('--lock-threshold-ms', type=float, default=5,
+                            help='Statements slower than this count as waiting for a lock (default: %(default)s).')
+        parser.add_argument('--keep', action='store_true', help="Don't delete the test programs, users and enrollments.")
+
+    def handle(self, *args, **options):
+        try:
+            mix = {name: float(weight) for name, weight in (part.split('=') for part in options['mix'].split(','))}
+        except ValueError:
+            raise CommandError('--mix looks like browse=2,create=4,approve=2,reject=1,delete=1')
+        if set(mix) - set(OPERATIONS) or not any(mix.values()):
+            raise CommandError(f'--mix takes weights for {", ".join(OPERATIONS)}.')
+        options['mix'] = mix
+
+        targets = [(connections[DEFAULT_DB_ALIAS].vendor, None)]
+        if options['postgres_url']:
+            targets.append(('postgresql', options['postgres_url']))
+
+        failed = False
+        for label, url in targets:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label}'))
+            original = copy.deepcopy(settings.DATABASES[DEFAULT_DB_ALIAS])
+            try:
+                if url:
+                    if options['url']:
+                        self.stdout.write('  skipped: --url servers use their own database')
+                        continue
+                    reason = self._use_database(url)
+                    if reason:
+                        self.stdout.write(f'  skipped: {reason}')
+                        continue
+                failed |= not self._run_target(options)
+            finally:
+                if url:
+                    _swap_connection(original)
+        if failed:
+            raise CommandError('Invariants violated (see above).')
+
+    def _use_database(self, url):
+        """Point the default connection at `url` and migrate it; a reason string if that fails."""
+        import dj_database_url
+        from django.db.utils import load_backend
+
+        try:
+            db = dj_database_url.parse(url, conn_max_age=0)
+        except Exception as exc:
+            return f'bad URL ({exc})'
+        try:
+            load_backend(db['ENGINE'])
+        except Exception as exc:
+            return str(exc)
+        try:
+            _swap_connection(db)
+            connections[DEFAULT_DB_ALIAS].ensure_connection()
+        except Exception as exc:
+            return f'cannot connect ({exc.__class__.__name__}: {exc})'.strip()
+        call_command('migrate', verbosity=0, interactive=False)
+        return None
+
+    # ============================================
+    # ONE DATABASE
+    # ============================================
+
+    def _run_target(self, options):
+        run_id = secrets.token_hex(3)
+        clients = options['processes'] * options['threads']
+        fixtures = _create_fixtures(run_id, clients, options['students'])
+        server, lock_timer = None, None
+        feed_manager = get_context('spawn').Manager()
+        feed = feed_manager.Namespace(pending=[], live=[])
+        stop_feed = threading.Event()
+        feeder = threading.Thread(target=_feed, args=(feed, fixtures['program_ids'], stop_feed), name='stress-feeder')
+        try:
+            if options['url']:
+                address = urlsplit(options['url'])
+                host, port = address.hostname, address.port or 80
+            else:
+                lock_timer = _LockTimer(options['lock_threshold_ms'] / 1000)
+                server = _start_server(lock_timer)
+                host, port = server.server_address[:2]
+            feeder.start()
+
+            started = time.perf_counter()
+            specs = [
+                {
+                    'host': host, 'port': port, 'duration': options['duration'], 'mix': options['mix'],
+                    'programs': fixtures['program_ids'], 'school_year': fixtures['school_year_id'],
+                    'sessions': fixtures['sessions'][index * options['threads']:(index + 1) * options['threads']],
+                    'cookie_names': (settings.SESSION_COOKIE_NAME, settings.CSRF_COOKIE_NAME),
+                    'feed': feed, 'seed': index,
+                }
+                for index in range(options['processes'])
+            ]
+            with ProcessPoolExecutor(options['processes'], mp_context=get_context('spawn')) as pool:
+                results = [thread for process in pool.map(_client_process, specs) for thread in process]
+            elapsed = time.perf_counter() - started
+        finally:
+            stop_feed.set()
+            if feeder.is_alive():
+                feeder.join()
+            feed_manager.shutdown()
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                lock_timer.uninstall()
+                logging.getLogger('django.request').disabled = False
+
+        self._report(results, elapsed, lock_timer)
+        ok = self._check_invariants(fixtures, results)
+        if not options['keep']:
+            _delete_fixtures(fixtures)
+        return ok
+
+    def _report(self, results, elapsed, lock_timer):
+        by_operation = {name: {'ok': 0, 'conflict': 0, 'error': 0, 'latencies': []} for name in OPERATIONS}
+        errors = Counter()
+        for thread in results:
+            for name, stats in thread['operations'].items():
+                for key in ('ok', 'conflict', 'error'):
+                    by_operation[name][key] += stats[key]
+                by_operation[name]['latencies'] += stats['latencies']
+            errors.update(thread['errors'])
+
+        total = sum(len(stats['latencies']) for stats in by_operation.values())
+        total_errors = sum(stats['error'] for stats in by_operation.values())
+        self.stdout.write(
+            f'  {total} requests in {elapsed:.1f}s: {total / elapsed:.0f}/s, '
+            f'{total_errors} errors ({total_errors / max(total, 1) * 100:.1f}%)'
+        )
+        self.stdout.write(f"  {'operation':<10} {'n':>6} {'/s':>6} {'ok':>6} {'conflict':>9} {'error':>6} {'p50 ms':>7} {'p95 ms':>7}")
+        for name, stats in by_operation.items():
+            latencies = sorted(stats['latencies'])
+            if not latencies:
+                continue
+            p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+            self.stdout.write(
+                f"  {name:<10} {len(latencies):>6} {len(latencies) / elapsed:>6.0f} {stats['ok']:>6} "
+                f"{stats['conflict']:>9} {stats['error']:>6} {statistics.median(latencies) * 1000:>7.0f} {p95 * 1000:>7.0f}"
+            )
+        if lock_timer is not None:
+            self.stdout.write(
+                f'  lock waits: {lock_timer.slow} of {lock_timer.statements} statements over '
+                f'{lock_timer.threshold * 1000:.0f} ms, {lock_timer.waited:.1f}s in total '
+                f'({lock_timer.waited / max(total, 1) * 1000:.1f} ms per request)'
+            )
+        for error, count in errors.most_common(ERROR_SAMPLES):
+            self.stdout.write(f'  {count}x {error}')
+
+    def _check_invariants(self, fixtures, results):
+        from django.db.models import Count
+
+        from enrollments import summaries
+        from enrollments.models import ArchivedEnrollment, Enrollment, Notification
+
+        program_ids = fixtures['program_ids']
+        live = Enrollment.objects.filter(program_id__in=program_ids)
+        enrollment_ids = list(live.values_list('enrollment_id', flat=True))
+        enrollment_ids += ArchivedEnrollment.objects.filter(
+            enrollment_id__in=enrollment_ids).values_list('enrollment_id', flat=True)
+        duplicate_ids = [i for i, n in Counter(enrollment_ids).items() if n > 1]
+
+        # Every successful approve / reject response, including for enrollments deleted since
+        decisions = Counter(pk for thread in results for pk in thread['decisions'])
+        reviewed_twice = [pk for pk, n in decisions.items() if n > 1]
+
+        notified = dict(
+            Notification.objects.filter(
+                enrollment__program_id__in=program_ids,
+                notification_type__in=('enrollment_approved', 'enrollment_rejected'),
+            ).order_by().values_list('enrollment_id').annotate(n=Count('pk'))
+        )
+        statuses = dict(live.values_list('pk', 'status'))
+        mismatched = [
+            pk for pk, status in statuses.items()
+            if notified.get(pk, 0) != (1 if status in ('approved', 'rejected') else 0)
+        ]
+
+        counted = summaries.status_counts(program_id__in=program_ids)
+        actual = dict(live.order_by().values_list('status').annotate(n=Count('pk')))
+        summary_drift = {
+            status: (counted.get(status, 0), actual.get(status, 0))
+            for status in set(counted) | set(actual) if counted.get(status, 0) != actual.get(status, 0)
+        }
+
+        checks = [
+            ('unique enrollment IDs', not duplicate_ids, f'{len(duplicate_ids)} duplicated, e.g. {duplicate_ids[:3]}'),
+            ('one review per enrollment', not reviewed_twice,
+             f'{len(reviewed_twice)} enrollment(s) reviewed more than once, e.g. {reviewed_twice[:3]}'),
+            ('notifications match decisions', not mismatched,
+             f'{len(mismatched)} enrollment(s) with the wrong number of decision notifications, e.g. {mismatched[:3]}'),
+            ('summaries match rows', not summary_drift, f'(summary, actual) by status: {summary_drift}'),
+        ]
+        self.stdout.write(f'  {len(statuses)} enrollment(s) left, {sum(decisions.values())} decision(s) made')
+        for name, passed, detail in checks:
+            if passed:
+                self.stdout.write(self.style.SUCCESS(f'  ok    {name}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'  FAIL  {name}: {detail}'))
+        return all(passed for _, passed, _ in checks)
+
+
+# ============================================
+# FIXTURES
+# ============================================
+
+def _create_fixtures(run_id, clients, students_per_client):
+    from datetime import date
+    from decimal import Decimal
+    from importlib import import_module
+
+    from django.contrib.auth import login
+    from django.contrib.auth.models import User
+    from django.http import HttpRequest
+
+    from enrollments.models import Program, SchoolYear, Student
+
+    programs = [
+        Program.objects.create(
+            code=f'STRESS-{run_id}-{index}', name=f'Stress test {run_id} #{index}', program_type='undergraduate',
+            description='Created by stress_enrollments.', duration_years=4, tuition_fee=Decimal('1000.00'),
+        )
+        for index in range(PROGRAMS)
+    ]
+    # Far in the future, so it never collides with a real term
+    year = 2100 + random.randrange(800)
+    school_year = SchoolYear.objects.create(
+        year_start=year, year_end=year + 1, semester='1st', is_active=True,
+        enrollment_start=date(year, 1, 1), enrollment_end=date(year, 12, 31),
+    )
+
+    engine = import_module(settings.SESSION_ENGINE)
+    backend = settings.AUTHENTICATION_BACKENDS[0]
+
+    def session_cookies(user):
+        # What the login view leaves behind, without paying for password hashing per user
+        request = HttpRequest()
+        request.session = engine.SessionStore()
+        login(request, user, backend)
+        request.session.save()
+        return {settings.SESSION_COOKIE_NAME: request.session.session_key, settings.CSRF_COOKIE_NAME: secrets.token_hex(16)}
+
+    sessions = []
+    for client in range(clients):
+        staff = User.objects.create_user(f'stress-{run_id}-staff{client}', is_staff=True)
+        students = []
+        for index in range(students_per_client):
+            user = User.objects.create_user(f'stress-{run_id}-c{client}s{index}')
+            Student.objects.create(
+                user=user, student_id=f'S{run_id}-{client}-{index}', first_name='Stress', last_name=f'Test {index}',
+                date_of_birth=date(2005, 1, 1), gender='O', contact_number='0000', email=f'{user.username}@example.com',
+                address='-', guardian_name='-', guardian_contact='0000',
+            )
+            students.append(session_cookies(user))
+        sessions.append({'staff': session_cookies(staff), 'students': students})
+
+    return {
+        'run_id': run_id, 'program_ids': [p.pk for p in programs], 'school_year_id': school_year.pk,
+        'sessions': sessions,
+    }
+
+
+def _delete_fixtures(fixtures):
+    from importlib import import_module
+
+    from django.contrib.auth.models import User
+
+    from enrollments.models import OutboundEmail, Program, SchoolYear
+
+    OutboundEmail.objects.filter(recipient__startswith=f"stress-{fixtures['run_id']}-").delete()
+    Program.objects.filter(pk__in=fixtures['program_ids']).delete()
+    SchoolYear.objects.filter(pk=fixtures['school_year_id']).delete()
+    User.objects.filter(username__startswith=f"stress-{fixtures['run_id']}-").delete()
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    for client in fixtures['sessions']:
+        for cookies in [client['staff'], *client['students']]:
+            store.delete(cookies[settings.SESSION_COOKIE_NAME])
+
+
+def _feed(feed, program_ids, stop):
+    """Publish recent pending / live test enrollments for the clients to pick targets from."""
+    from enrollments.models import Enrollment
+
+    try:
+        enrollments = Enrollment.objects.filter(program_id__in=program_ids).order_by('-pk')
+        while not stop.is_set():
+            feed.pending = list(enrollments.filter(status='pending').values_list('pk', flat=True)[:FEED_SIZE])
+            feed.live = list(enrollments.values_list('pk', flat=True)[:FEED_SIZE])
+            stop.wait(FEED_INTERVAL)
+    finally:
+        connections.close_all()
+
+
+def _swap_connection(db):
+    connections[DEFAULT_DB_ALIAS].close()
+    settings.DATABASES[DEFAULT_DB_ALIAS] = db
+    connections.settings[DEFAULT_DB_ALIAS] = db
+    del connections[DEFAULT_DB_ALIAS]
+
+
+# ============================================
+# SERVER (in this process, so lock waits can be timed)
+# ============================================
+
+class _LockTimer:
+    """Execute wrapper summing the time of statements slow enough to have waited for a lock."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.statements = self.slow = 0
+        self.waited = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.statements += 1
+                if elapsed >= self.threshold:
+                    self.slow += 1
+                    self.waited += elapsed
+
+    def install(self):
+        from django.db.backends.signals import connection_created
+
+        connection_created.connect(self._add, dispatch_uid='stress-lock-timer')
+
+    def uninstall(self):
+        from django.db.backends.signals import connection_created
+
+        connection_created.disconnect(dispatch_uid='stress-lock-timer')
+
+    def _add(self, sender, connection, **kwargs):
+        # The feeder's reads are not part of the load
+        if threading.current_thread().name != 'stress-feeder' and self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def _start_server(lock_timer):
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadedWSGIServer):
+        request_queue_size = 256
+
+    lock_timer.install()
+    server = Server(('127.0.0.1', 0), QuietHandler, allow_reuse_address=True)
+    server.set_app(get_wsgi_application())
+    # After django.setup() (re)configured logging. The failures are counted and sampled
+    # by the clients; no tracebacks all over the report
+    logging.getLogger('django.request').disabled = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='stress-server').start()
+    return server
+
+
+# ============================================
+# CLIENTS (spawned processes; plain HTTP, no Django)
+# ============================================
+
+class _HttpSession:
+    def __init__(self, host, port, cookies, cookie_names):
+        self.host, self.port = host, port
+        self.cookies = dict(cookies)
+        # Only the session and CSRF cookies: the messages cookie would grow forever,
+        # since these clients never load a page that shows the messages
+        self.cookie_names = cookie_names
+
+    def get(self, path):
+        return self._request('GET', path, None, {})
+
+    def post(self, path, fields):
+        fields = dict(fields, csrfmiddlewaretoken=self.cookies[self.cookie_names[1]])
+        return self._request('POST', path, urlencode(fields), {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def _request(self, method, path, body, headers):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            body = response.read()
+            for header in response.headers.get_all('Set-Cookie') or []:
+                for name, morsel in SimpleCookie(header).items():
+                    if name in self.cookie_names and morsel.value:
+                        self.cookies[name] = morsel.value
+            return response.status, body
+        finally:
+            connection.close()
+
+
+def _client_process(spec):
+    threads = []
+    results = [None] * len(spec['sessions'])
+    for index, sessions in enumerate(spec['sessions']):
+        thread = threading.Thread(target=_client_thread, args=(spec, sessions, spec['seed'] * 1000 + index, results, index))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _client_thread(spec, sessions, seed, results, index):
+    rng = random.Random(seed)
+    staff = _HttpSession(spec['host'], spec['port'], sessions['staff'], spec['cookie_names'])
+    students = [_HttpSession(spec['host'], spec['port'], s, spec['cookie_names']) for s in sessions['students']]
+    operations = {name: {'ok': 0, 'conflict': 0, 'error': 0, 'latencies': []} for name in OPERATIONS}
+    decisions, errors = [], Counter()
+    names, weights = zip(*spec['mix'].items())
+    pending, live, refreshed = [], [], 0.0
+
+    deadline = time.monotonic() + spec['duration']
+    while time.monotonic() < deadline:
+        if time.monotonic() - refreshed > FEED_INTERVAL:
+            pending, live, refreshed = spec['feed'].pending, spec['feed'].live, time.monotonic()
+        name = rng.choices(names, weights)[0]
+        targets = pending if name in ('approve', 'reject') else live
+        if name in ('approve', 'reject', 'delete') and not targets:
+            name = 'create'
+
+        if name == 'browse':
+            session, pk, path, fields = staff, None, '/enrollments/', None
+        elif name == 'create':
+            session, pk = rng.choice(students), None
+            path, fields = '/enrollments/create/', {
+                'program': rng.choice(spec['programs']), 'school_year': spec['school_year'], 'year_level': '1',
+                'idempotency_key': secrets.token_urlsafe(24),
+            }
+        else:
+            # Picked from the same short list as every other client: contention on purpose
+            session, pk = staff, rng.choice(targets)
+            path = f'/enrollments/{pk}/{name}/'
+            fields = {'admin_notes': f'stress {name}'} if name != 'delete' else {}
+
+        started = time.perf_counter()
+        try:
+            status, body = session.get(path) if fields is None else session.post(path, fields)
+        except OSError as exc:
+            status, body = None, repr(exc).encode()
+        stats = operations[name]
+        stats['latencies'].append(time.perf_counter() - started)
+        if status == (200 if name == 'browse' else 302):
+            stats['ok'] += 1
+            if name in ('approve', 'reject'):
+                decisions.append(pk)
+        elif name != 'browse' and status in (200, 404, 409):
+            # The form came back (already enrolled), or the enrollment was no longer pending (409) / there
+            stats['conflict'] += 1
+        else:
+            stats['error'] += 1
+            errors[f'{name}: {status} {_error_summary(body)}'] += 1
+
+    results[index] = {'operations': operations, 'decisions': decisions, 'errors': errors}
+
+
+def _error_summary(body):
+    # Django's debug page puts the exception in the <title>
+    text = body.decode(errors='replace')
+    start = text.find('<title>')
+    if start >= 0:
+        text = text[start + 7:text.find('</title>', start)]
+    # Grouped by kind, not by enrollment
+    return re.sub(r'/\d+/', '/<pk>/', ' '.join(text.split()))[:150]
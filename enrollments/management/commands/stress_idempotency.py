@@ -0,0 +1,151 @@
+import secrets
+import statistics
+import threading
+import time
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from enrollments import idempotency
+from enrollments.models import Enrollment, Program, SchoolYear, Student
+
+USERNAME_PREFIX = 'idem-stress-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Submit the enrollment and registration forms many times at once with the same '
+        'idempotency token (double clicks, retries) and check each token had exactly one effect.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=10, help='Tokens per form (default: %(default)s).')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Simultaneous submissions of each token (default: %(default)s).')
+        parser.add_argument('--keep', action='store_true', help="Don't delete the users and enrollments created.")
+
+    def handle(self, *args, **options):
+        program = Program.objects.filter(is_active=True).first()
+        school_year = SchoolYear.objects.filter(is_active=True).first()
+        if program is None or school_year is None:
+            raise CommandError('Needs an active program and an active school year.')
+        self.rounds, self.concurrency = options['rounds'], options['concurrency']
+        run_id = secrets.token_hex(3)
+
+        try:
+            failures = self._enrollments(run_id, program, school_year)
+            failures += self._registrations(run_id, program)
+        finally:
+            if not options['keep']:
+                User.objects.filter(username__startswith=f'{USERNAME_PREFIX}{run_id}-').delete()
+        if failures:
+            raise CommandError(f'{failures} token(s) did not have exactly one effect.')
+        self.stdout.write(self.style.SUCCESS('Every token had exactly one effect.'))
+
+    # ============================================
+    # SCENARIOS
+    # ============================================
+
+    def _enrollments(self, run_id, program, school_year):
+        failures = 0
+        results = []
+        for round_number in range(self.rounds):
+            user = User.objects.create_user(f'{USERNAME_PREFIX}{run_id}-e{round_number}', password=None)
+            student = Student.objects.create(user=user, **self._profile(f'E{run_id}{round_number:04d}'))
+            data = {
+                'program': program.pk, 'school_year': school_year.pk, 'year_level': '1',
+                idempotency.FIELD_NAME: idempotency.new_token(),
+            }
+            round_results = self._submit(reverse('enrollment_create'), data, login_as=user)
+            created = Enrollment.objects.filter(student=student).count()
+            failures += self._check(round_results, created)
+            results += round_results
+        self._report('enrollment_create', results)
+        return failures
+
+    def _registrations(self, run_id, program):
+        failures = 0
+        results = []
+        for round_number in range(self.rounds):
+            username = f'{USERNAME_PREFIX}{run_id}-r{round_number}'
+            password = secrets.token_urlsafe(16)
+            data = {
+                'username': username, 'email': f'{username}@example.com',
+                'password1': password, 'password2': password,
+                idempotency.FIELD_NAME: idempotency.new_token(),
+                **self._profile(''),
+            }
+            # One browser clicking repeatedly: every request carries the same CSRF cookie
+            round_results = self._submit(reverse('register'), data, csrf_cookie=secrets.token_hex(16))
+            created = User.objects.filter(username=username).count()
+            failures += self._check(round_results, created)
+            results += round_results
+        self._report('register', results)
+        return failures
+
+    def _profile(self, student_id):
+        profile = {
+            'first_name': 'Stress', 'last_name': 'Test', 'date_of_birth': date(2005, 1, 1), 'gender': 'O',
+            'contact_number': '0000', 'email': 'stress@example.com', 'address': '-',
+            'guardian_name': '-', 'guardian_contact': '0000',
+        }
+        if student_id:
+            profile['student_id'] = student_id
+        return profile
+
+    # ============================================
+    # SUBMITTING
+    # ============================================
+
+    def _submit(self, path, data, login_as=None, csrf_cookie=None):
+        """POST `data` from `concurrency` threads at once; [(status, location, replayed, seconds)]."""
+        barrier = threading.Barrier(self.concurrency)
+        results = [None] * self.concurrency
+
+        def submit(index):
+            try:
+                client = Client(HTTP_HOST='localhost')
+                if login_as is not None:
+                    client.force_login(login_as)
+                if csrf_cookie is not None:
+                    client.cookies['csrftoken'] = csrf_cookie
+                barrier.wait()
+                started = time.perf_counter()
+                response = client.post(path, data)
+                results[index] = (
+                    response.status_code, response.get('Location'),
+                    response.get(idempotency.REPLAY_HEADER) == 'true', time.perf_counter() - started,
+                )
+            except Exception as exc:
+                results[index] = (repr(exc), None, False, 0.0)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=submit, args=(index,)) for index in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _check(self, results, created):
+        statuses = {status for status, _, _, _ in results}
+        locations = {location for _, location, _, _ in results}
+        if created == 1 and statuses == {302} and len(locations) == 1:
+            return 0
+        self.stdout.write(self.style.ERROR(
+            f'  {created} row(s) created; statuses {sorted(map(str, statuses))}; locations {sorted(map(str, locations))}'
+        ))
+        return 1
+
+    def _report(self, name, results):
+        seconds = sorted(elapsed for _, _, _, elapsed in results)
+        replays = sum(1 for _, _, replayed, _ in results if replayed)
+        self.stdout.write(
+            f'{name}: {self.rounds} token(s) x {self.concurrency} submissions, {replays} replayed; '
+            f'p50 {statistics.median(seconds) * 1000:.0f} ms, max {seconds[-1] * 1000:.0f} ms'
+        )
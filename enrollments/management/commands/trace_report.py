@@ -0,0 +1,79 @@
+import json
+import math
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarize the traces written by enrollments/tracing.py: per view, the request time '
+        'and where it went (SQL, templates, forms, view code), then the queries that repeat '
+        'most within a request (likely N+1s) with where they were run from.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Traces file (default: settings.TRACING_EXPORT_PATH).')
+        parser.add_argument('--view', help='Only this view name, e.g. enrollment_list.')
+        parser.add_argument('--top', type=int, default=10, help='Repeated queries to list (default: %(default)s).')
+        parser.add_argument('--repeat-threshold', type=int, default=5,
+                            help='Times a query must run from one place in one request to be listed.')
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'TRACING_EXPORT_PATH', 'traces.jsonl')
+        try:
+            with open(path, encoding='utf-8') as traces_file:
+                traces = [json.loads(line) for line in traces_file if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f'No traces at {path}; set TRACING_ENABLED=True and load some pages.')
+        if options['view']:
+            traces = [t for t in traces if t['view'] == options['view']]
+        if not traces:
+            raise CommandError('No matching traces.')
+
+        by_view = {}
+        for trace in traces:
+            by_view.setdefault(trace['view'] or trace['path'], []).append(trace)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{len(traces)} trace(s) from {path}'))
+        self.stdout.write(
+            f"  {'view':<28} {'n':>5} {'p50 ms':>8} {'p95 ms':>8}   {'sql':>6} {'tmpl':>6} {'form':>6} {'view':>6}"
+            f" {'queries':>8} {'dupes':>6}"
+        )
+        rows = sorted(by_view.items(), key=lambda item: -sum(t['duration_ms'] for t in item[1]))
+        for view, view_traces in rows:
+            durations = sorted(t['duration_ms'] for t in view_traces)
+            p95 = durations[math.ceil(len(durations) * 0.95) - 1]
+            share = {
+                kind: sum(t['breakdown_ms'][kind] for t in view_traces) / max(sum(durations), 1e-9) * 100
+                for kind in ('sql', 'template', 'form', 'view')
+            }
+            self.stdout.write(
+                f'  {view[:28]:<28} {len(view_traces):>5} {statistics.median(durations):>8.1f} {p95:>8.1f}   '
+                f"{share['sql']:>5.0f}% {share['template']:>5.0f}% {share['form']:>5.0f}% {share['view']:>5.0f}% "
+                f"{statistics.mean(t['query_count'] for t in view_traces):>8.1f} "
+                f"{statistics.mean(t['duplicate_queries'] for t in view_traces):>6.1f}"
+            )
+
+        # The same query from the same place, many times in one request
+        repeated = {}
+        for trace in traces:
+            for query in trace['queries']:
+                if query['count'] < options['repeat_threshold']:
+                    continue
+                key = (trace['view'], query['sql'], query['callsite'], query['template'])
+                entry = repeated.setdefault(key, {'traces': 0, 'count': 0, 'total_ms': 0.0})
+                entry['traces'] += 1
+                entry['count'] += query['count']
+                entry['total_ms'] += query['total_ms']
+        if not repeated:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING('\nRepeated queries (per request)'))
+        top = sorted(repeated.items(), key=lambda item: -item[1]['total_ms'])[:options['top']]
+        for (view, sql, callsite, template), entry in top:
+            self.stdout.write(
+                f"  {entry['count'] / entry['traces']:.0f}x per request, {entry['total_ms'] / entry['traces']:.1f} ms "
+                f"in {view}: {callsite or '-'}{f' (in {template})' if template else ''}"
+            )
+            self.stdout.write(f'      {sql[:160]}')
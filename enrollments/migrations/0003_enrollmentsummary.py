@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_summaries(apps, schema_editor):
+    Enrollment = apps.get_model('enrollments', 'Enrollment')
+    EnrollmentSummary = apps.get_model('enrollments', 'EnrollmentSummary')
+    rows = (
+        Enrollment.objects.order_by()
+        .values('program_id', 'school_year_id', 'status', 'year_level')
+        .annotate(count=Count('pk'), fee=Sum('total_fee'))
+    )
+    EnrollmentSummary.objects.bulk_create([
+        EnrollmentSummary(
+            program_id=row['program_id'],
+            school_year_id=row['school_year_id'],
+            status=row['status'],
+            year_level=row['year_level'],
+            enrollment_count=row['count'],
+            total_fee_sum=row['fee'] or 0,
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0002_alter_enrollment_admin_notes_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending Approval'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('enrolled', 'Enrolled'), ('dropped', 'Dropped')], max_length=20)),
+                ('year_level', models.CharField(choices=[('1', '1st Year'), ('2', '2nd Year'), ('3', '3rd Year'), ('4', '4th Year'), ('5', '5th Year')], max_length=1)),
+                ('enrollment_count', models.IntegerField(default=0)),
+                ('total_fee_sum', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_summaries', to='enrollments.program')),
+                ('school_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_summaries', to='enrollments.schoolyear')),
+            ],
+            options={
+                'verbose_name_plural': 'enrollment summaries',
+                'ordering': ['program', 'school_year', 'status', 'year_level'],
+                'unique_together': {('program', 'school_year', 'status', 'year_level')},
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:03
+
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+
+
+def populate_review_time(apps, schema_editor):
+    Enrollment = apps.get_model('enrollments', 'Enrollment')
+    EnrollmentSummary = apps.get_model('enrollments', 'EnrollmentSummary')
+    rows = (
+        Enrollment.objects.filter(reviewed_at__isnull=False)
+        .order_by()
+        .values('program_id', 'school_year_id', 'status', 'year_level')
+        .annotate(
+            reviewed=Count('pk'),
+            review_time=Sum(ExpressionWrapper(F('reviewed_at') - F('created_at'), output_field=DurationField())),
+        )
+    )
+    for row in rows:
+        EnrollmentSummary.objects.filter(
+            program_id=row['program_id'],
+            school_year_id=row['school_year_id'],
+            status=row['status'],
+            year_level=row['year_level'],
+        ).update(
+            reviewed_count=row['reviewed'],
+            review_seconds_sum=int(row['review_time'].total_seconds()) if row['review_time'] else 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0003_enrollmentsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollmentsummary',
+            name='review_seconds_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrollmentsummary',
+            name='reviewed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_review_time, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_students(apps, schema_editor):
+    from enrollments import search
+
+    search.rebuild(apps.get_model('enrollments', 'Student'), apps.get_model('enrollments', 'StudentSearchToken'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0007_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='search_text',
+            field=models.CharField(blank=True, editable=False, max_length=400),
+        ),
+        migrations.CreateModel(
+            name='StudentSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('phonetic', models.CharField(max_length=100)),
+                ('field', models.CharField(choices=[('l', 'Last name'), ('f', 'First name'), ('m', 'Middle name'), ('i', 'Student ID'), ('e', 'E-mail')], max_length=1)),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='enrollments.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'student'], name='student_search_token_idx'), models.Index(fields=['phonetic', 'student'], name='student_search_phonetic_idx'), models.Index(fields=['student', 'token', 'phonetic'], name='student_search_student_idx')],
+            },
+        ),
+        migrations.RunPython(index_students, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0010_jobs_and_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Section',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20)),
+                ('year_level', models.CharField(blank=True, choices=[('1', '1st Year'), ('2', '2nd Year'), ('3', '3rd Year'), ('4', '4th Year'), ('5', '5th Year')], max_length=1)),
+                ('program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='enrollments.program')),
+                ('school_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sections', to='enrollments.schoolyear')),
+            ],
+            options={
+                'ordering': ['code'],
+                'unique_together': {('program', 'school_year', 'code')},
+            },
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='sections',
+            field=models.ManyToManyField(blank=True, related_name='enrollments', to='enrollments.section'),
+        ),
+        migrations.CreateModel(
+            name='Meeting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('room', models.CharField(blank=True, max_length=50)),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meetings', to='enrollments.section')),
+            ],
+            options={
+                'ordering': ['day', 'start_time'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end_time__gt', models.F('start_time'))), name='meeting_ends_after_start')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:33
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0013_enrollment_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('notes', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('published_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('school_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fee_schedules', to='enrollments.schoolyear')),
+            ],
+            options={
+                'ordering': ['school_year', '-version'],
+                'unique_together': {('school_year', 'version')},
+            },
+        ),
+        migrations.CreateModel(
+            name='FeeInstallment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=50)),
+                ('due_date', models.DateField()),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='enrollments.feeschedule')),
+            ],
+            options={
+                'ordering': ['due_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FeeRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('multiplier', 'Tuition multiplier'), ('discount', 'Discount'), ('scholarship', 'Scholarship'), ('misc', 'Miscellaneous fee')], max_length=20)),
+                ('name', models.CharField(max_length=100)),
+                ('program_type', models.CharField(blank=True, choices=[('undergraduate', 'Undergraduate'), ('graduate', 'Graduate'), ('vocational', 'Vocational')], max_length=20)),
+                ('year_level', models.CharField(blank=True, choices=[('1', '1st Year'), ('2', '2nd Year'), ('3', '3rd Year'), ('4', '4th Year'), ('5', '5th Year')], max_length=1)),
+                ('multiplier', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True)),
+                ('percent', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('program', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='enrollments.program')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fee_rules', to='enrollments.student')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='enrollments.feeschedule')),
+            ],
+            options={
+                'ordering': ['kind', 'name'],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('kind', 'multiplier'), ('multiplier__gt', 0), ('multiplier__isnull', False), ('student__isnull', True)), models.Q(('kind', 'discount'), ('percent__gt', 0), ('percent__isnull', False), ('percent__lte', 100), ('student__isnull', True)), models.Q(('kind', 'scholarship'), ('percent__gt', 0), ('percent__isnull', False), ('percent__lte', 100), ('student__isnull', False)), models.Q(('amount__gt', 0), ('amount__isnull', False), ('kind', 'scholarship'), ('student__isnull', False)), models.Q(('amount__gt', 0), ('amount__isnull', False), ('kind', 'misc'), ('student__isnull', True)), _connector='OR'), name='fee_rule_has_value')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0014_fee_schedules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedenrollment',
+            name='sections',
+            field=models.ManyToManyField(blank=True, related_name='archived_enrollments', to='enrollments.section'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # The table of the DatabaseCache in settings.CACHES (a no-op for other backends)
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0015_archived_enrollment_sections'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
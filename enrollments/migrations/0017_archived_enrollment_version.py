@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0016_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedenrollment',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
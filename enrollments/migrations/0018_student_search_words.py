@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:06
+
+from django.db import migrations, models
+
+
+def index_words(apps, schema_editor):
+    from enrollments import search
+
+    search.rebuild_words(
+        apps.get_model('enrollments', 'StudentSearchToken'), apps.get_model('enrollments', 'StudentSearchWord'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enrollments', '0017_archived_enrollment_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=100, unique=True)),
+                ('length', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['length', 'word'], name='student_search_word_idx')],
+            },
+        ),
+        migrations.RunPython(index_words, migrations.RunPython.noop),
+    ]
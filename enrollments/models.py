@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.db import transaction # Added for safe ID generation
@@ -24,6 +25,8 @@ class Student(models.Model):
     guardian_name = models.CharField(max_length=200)
     guardian_contact = models.CharField(max_length=20)
     profile_picture = models.ImageField(upload_to='students/', blank=True, null=True)
+    # Normalized, accent-folded "last first middle id email" (search.py keeps it in sync)
+    search_text = models.CharField(max_length=400, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -76,6 +79,8 @@ class SchoolYear(models.Model):
     enrollment_start = models.DateField()
     enrollment_end = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set once the term's enrollments were moved to the archive tables (archive.py)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     class Meta:
         ordering = ['-year_start', '-year_end']
@@ -115,8 +120,16 @@ class Enrollment(models.Model):
     
     total_fee = models.DecimalField(max_digits=10, decimal_places=2, blank=True) # Allowed blank so it can auto-populate
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Class sections taken this term (meeting times must not overlap, see schedules.py)
+    sections = models.ManyToManyField('Section', blank=True, related_name='enrollments')
+    
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Goes up on every write; status changes (transitions.py) only apply to the version they read
+    version = models.PositiveIntegerField(default=0, editable=False)
+    
+    # Archived copies live in ArchivedEnrollment (templates check this flag)
+    is_archived = False
     
     class Meta:
         ordering = ['-created_at']
@@ -127,29 +140,50 @@ class Enrollment(models.Model):
         return f"{self.enrollment_id} - {self.student.get_full_name()} - {self.program.code}"
     
     def save(self, *args, **kwargs):
-        # Auto-set tuition fee from program if not provided
-        if not self.total_fee and self.program:
-            self.total_fee = self.program.tuition_fee
-            
-        if not self.enrollment_id:
-            with transaction.atomic(): # Ensure thread safety
-                year = timezone.now().year
-                # Get the highest current count for this year to avoid collisions
-                last_enrollment = Enrollment.objects.filter(
-                    enrollment_id__startswith=f'ENR-{year}'
-                ).order_by('enrollment_id').last()
-                
-                if last_enrollment:
-                    last_id_parts = last_enrollment.enrollment_id.split('-')
-                    new_count = int(last_id_parts[2]) + 1
-                else:
-                    new_count = 1
-                    
-                self.enrollment_id = f'ENR-{year}-{new_count:05d}'
-                super().save(*args, **kwargs)
-        else:
+        # Assess the fee from the term's fee schedule if not provided
+        # (fees.py imports the models, hence the import here)
+        if not self.total_fee and self.program_id:
+            from .fees import assess
+            self.total_fee = assess(self)
+        
+        # Always save inside a transaction so the summary signals (see signals.py)
+        # commit or roll back together with the enrollment row itself
+        with transaction.atomic(): # Ensure thread safety
+            if not self.enrollment_id:
+                self.enrollment_id = Enrollment.allocate_ids(1)[0]
+            if not self._state.adding:
+                self.version += 1
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
             super().save(*args, **kwargs)
 
+    @staticmethod
+    def allocate_ids(count):
+        """
+        `count` consecutive enrollment IDs following the highest one issued this year.
+        Bulk inserts (rollover.py) take a whole block with one lookup.
+        """
+        year = timezone.now().year
+        # Get the highest current count for this year to avoid collisions
+        # (archived enrollments keep their IDs, so look there too). Past
+        # 99999 the counts get wider and 'ENR-2026-99999' still sorts last,
+        # so the newest row's ID is checked as well
+        last_ids = []
+        for model in (Enrollment, ArchivedEnrollment):
+            this_year = model.objects.filter(enrollment_id__startswith=f'ENR-{year}-')
+            last_ids += [
+                this_year.order_by('enrollment_id').values_list('enrollment_id', flat=True).last(),
+                this_year.order_by('pk').values_list('enrollment_id', flat=True).last(),
+            ]
+        last_ids = [last_id for last_id in last_ids if last_id]
+        
+        if last_ids:
+            first_count = max(int(last_id.split('-')[2]) for last_id in last_ids) + 1
+        else:
+            first_count = 1
+            
+        return [f'ENR-{year}-{n:05d}' for n in range(first_count, first_count + count)]
+
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
@@ -158,15 +192,424 @@ class Notification(models.Model):
         ('enrollment_confirmed', 'Enrollment Confirmed'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollment_notifications')
+    # Indexed by the inbox indexes below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='enrollment_notifications', db_index=False)
     notification_type = models.CharField(max_length=30, choices=NOTIFICATION_TYPES)
     enrollment = models.ForeignKey(Enrollment, on_delete=models.CASCADE, related_name='notifications')
     message = models.TextField()
+    # Only part of the story: see NotificationReadState and inbox.py
     is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        # The inbox pages each user's notifications newest-id first: unread
+        # ones through the first index, all of them through the second
+        indexes = [
+            models.Index(fields=['user', 'is_read', 'id'], name='notification_inbox_unread_idx'),
+            models.Index(fields=['user', 'id'], name='notification_inbox_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.notification_type}"
+
+
+class NotificationReadState(models.Model):
+    """Per-user watermark: notifications with id <= read_up_to count as read."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_read_state')
+    read_up_to = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.user.username} - read up to {self.read_up_to}"
+
+
+class EnrollmentSummary(models.Model):
+    """Pre-aggregated enrollment counts and fees, kept in sync by signals.py."""
+    program = models.ForeignKey(Program, on_delete=models.CASCADE, related_name='enrollment_summaries')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='enrollment_summaries')
+    status = models.CharField(max_length=20, choices=Enrollment.STATUS_CHOICES)
+    year_level = models.CharField(max_length=1, choices=Enrollment.YEAR_LEVEL_CHOICES)
+    
+    enrollment_count = models.IntegerField(default=0)
+    total_fee_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Review turnaround (reviewed_at - created_at) for the analytics funnel
+    reviewed_count = models.IntegerField(default=0)
+    review_seconds_sum = models.BigIntegerField(default=0)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['program', 'school_year', 'status', 'year_level']
+        unique_together = ['program', 'school_year', 'status', 'year_level']
+        verbose_name_plural = 'enrollment summaries'
+    
+    def __str__(self):
+        return f"{self.program.code} / {self.school_year} / {self.status} / {self.year_level}: {self.enrollment_count}"
+
+
+class ChangeLogEntry(models.Model):
+    """Append-only log of row changes for downstream sync (see changefeed.py)."""
+    ACTION_CHOICES = [
+        ('insert', 'Insert'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+    
+    # The auto-increment id doubles as the feed's sequence number / cursor
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=100)
+    object_pk = models.CharField(max_length=64)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    data = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'change log entries'
+    
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model} {self.object_pk}"
+
+
+# ============================================
+# ARCHIVE (closed school years, see archive.py)
+# ============================================
+
+class ArchivedEnrollment(models.Model):
+    """Enrollment of an archived school year; same columns and ids as Enrollment."""
+    id = models.BigIntegerField(primary_key=True)
+    enrollment_id = models.CharField(max_length=20, unique=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='archived_enrollments')
+    program = models.ForeignKey(Program, on_delete=models.CASCADE, related_name='archived_enrollments')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='archived_enrollments')
+    year_level = models.CharField(max_length=1, choices=Enrollment.YEAR_LEVEL_CHOICES)
+    status = models.CharField(max_length=20, choices=Enrollment.STATUS_CHOICES)
+    
+    reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+    admin_notes = models.TextField(blank=True, null=True)
+    
+    total_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    sections = models.ManyToManyField('Section', blank=True, related_name='archived_enrollments')
+    
+    created_at = models.DateTimeField(db_index=True)
+    updated_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=0, editable=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+    
+    is_archived = True
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.enrollment_id} - {self.student.get_full_name()} - {self.program.code} (archived)"
+
+
+class ArchivedNotification(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_enrollment_notifications')
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    enrollment = models.ForeignKey(ArchivedEnrollment, on_delete=models.CASCADE, related_name='notifications')
+    message = models.TextField()
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.user.username} - {self.notification_type}"
\ No newline at end of file
+        return f"{self.user.username} - {self.notification_type} (archived)"
+
+
+class StudentSearchToken(models.Model):
+    """One word of a student's search_text, with its phonetic key (see search.py)."""
+    FIELD_CHOICES = [
+        ('l', 'Last name'),
+        ('f', 'First name'),
+        ('m', 'Middle name'),
+        ('i', 'Student ID'),
+        ('e', 'E-mail'),
+    ]
+    
+    # Indexed by student_search_student_idx below
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='search_tokens', db_index=False)
+    token = models.CharField(max_length=100)
+    phonetic = models.CharField(max_length=100)
+    field = models.CharField(max_length=1, choices=FIELD_CHOICES)
+    
+    class Meta:
+        # Prefix lookups are range scans on the first two, and checking a
+        # candidate's other words reads only the third: none of them has to
+        # touch the table
+        indexes = [
+            models.Index(fields=['token', 'student'], name='student_search_token_idx'),
+            models.Index(fields=['phonetic', 'student'], name='student_search_phonetic_idx'),
+            models.Index(fields=['student', 'token', 'phonetic'], name='student_search_student_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student_id}: {self.token}"
+
+
+class StudentSearchWord(models.Model):
+    """A distinct search token, or beginning of one, that typos are corrected to (see search.py)."""
+    word = models.CharField(max_length=100, unique=True)
+    length = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        # Typo correction reads the words of a few lengths in one letter's range
+        indexes = [
+            models.Index(fields=['length', 'word'], name='student_search_word_idx'),
+        ]
+    
+    def __str__(self):
+        return self.word
+
+
+# ============================================
+# BACKGROUND JOBS (see jobs.py)
+# ============================================
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs worker command."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    # Dotted path of a function decorated with @jobs.task
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict, blank=True)
+    # At most one queued job per key, so repeated enqueues coalesce
+    key = models.CharField(max_length=200, null=True, blank=True)
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    
+    # Set by the worker holding the job; the claim lapses at locked_until
+    # (the visibility timeout) unless the job reports progress
+    claim_token = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    
+    progress = models.JSONField(null=True, blank=True)
+    result = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-id']
+        # Workers walk the first one in claim order; the queue page counts
+        # recent throughput with the second
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status='queued'), name='job_queued_key_unique'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.id} {self.name} ({self.status})"
+
+
+# ============================================
+# OUTBOUND E-MAIL (see mail.py)
+# ============================================
+
+class OutboundEmail(models.Model):
+    """An e-mail waiting for (or done with) batched delivery."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    kind = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    recipient = models.EmailField()
+    # e.g. 'enrollment_approved:42'; each recipient gets a given message once
+    dedupe_key = models.CharField(max_length=100)
+    enrollment = models.ForeignKey(Enrollment, on_delete=models.SET_NULL, null=True, blank=True, related_name='emails')
+    
+    # Rendered when sent
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'dedupe_key'], name='outbound_email_dedupe'),
+        ]
+    
+    def __str__(self):
+        return f"{self.recipient} - {self.kind} ({self.status})"
+
+
+# ============================================
+# SECTIONS AND MEETING TIMES (see schedules.py)
+# ============================================
+
+class Section(models.Model):
+    """A class section of a program in one term."""
+    program = models.ForeignKey(Program, on_delete=models.CASCADE, related_name='sections')
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='sections')
+    code = models.CharField(max_length=20)  # e.g. BSCS-1A
+    year_level = models.CharField(max_length=1, choices=Enrollment.YEAR_LEVEL_CHOICES, blank=True)
+    
+    class Meta:
+        ordering = ['code']
+        unique_together = ['program', 'school_year', 'code']
+    
+    def __str__(self):
+        return f"{self.code} ({self.school_year})"
+    
+    def schedule_display(self):
+        """e.g. 'Mon 08:00-09:30, Wed 08:00-09:30' (prefetch meetings when listing many)."""
+        return ', '.join(str(meeting) for meeting in self.meetings.all()) or 'No meetings'
+
+
+class Meeting(models.Model):
+    DAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+    
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='meetings')
+    day = models.PositiveSmallIntegerField(choices=DAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    room = models.CharField(max_length=50, blank=True)
+    
+    class Meta:
+        ordering = ['day', 'start_time']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end_time__gt=models.F('start_time')), name='meeting_ends_after_start'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_day_display()[:3]} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+
+# ============================================
+# IDEMPOTENCY KEYS (see idempotency.py)
+# ============================================
+
+class IdempotencyKey(models.Model):
+    """A form submission's token and the response its first submission produced."""
+    # sha256 of the scope, the submitter and the token
+    key = models.CharField(max_length=64, unique=True)
+    scope = models.CharField(max_length=50)
+    # {'location': ..., 'messages': [[level, message, extra_tags], ...],
+    #  'login': user_pk or None, 'login_until': epoch seconds or None}
+    result = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.scope} {self.key[:12]}"
+
+
+# ============================================
+# FEE SCHEDULES (see fees.py)
+# ============================================
+
+class FeeSchedule(models.Model):
+    """One version of a school year's fee rules; the newest published one is in effect."""
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, related_name='fee_schedules')
+    version = models.PositiveIntegerField()
+    notes = models.CharField(max_length=200, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Published versions are frozen; changes go into a new version (fees.new_version)
+    published_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    class Meta:
+        ordering = ['school_year', '-version']
+        unique_together = ['school_year', 'version']
+    
+    def __str__(self):
+        draft = '' if self.published_at else ' (draft)'
+        return f"{self.school_year} fees v{self.version}{draft}"
+
+
+class FeeRule(models.Model):
+    KIND_CHOICES = [
+        ('multiplier', 'Tuition multiplier'),   # tuition x multiplier (the most specific one)
+        ('discount', 'Discount'),               # percent off tuition
+        ('scholarship', 'Scholarship'),         # percent and/or amount off, for one student
+        ('misc', 'Miscellaneous fee'),          # amount added
+    ]
+    
+    schedule = models.ForeignKey(FeeSchedule, on_delete=models.CASCADE, related_name='rules')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    name = models.CharField(max_length=100)
+    # Applies to enrollments matching every one of these that is set
+    program = models.ForeignKey(Program, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    program_type = models.CharField(max_length=20, choices=Program.PROGRAM_TYPES, blank=True)
+    year_level = models.CharField(max_length=1, choices=Enrollment.YEAR_LEVEL_CHOICES, blank=True)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, null=True, blank=True, related_name='fee_rules')
+    multiplier = models.DecimalField(max_digits=5, decimal_places=3, null=True, blank=True)
+    percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    
+    class Meta:
+        ordering = ['kind', 'name']
+        constraints = [
+            # Each kind has its own value; only scholarships (and all of them) name a student
+            models.CheckConstraint(
+                condition=(
+                    # (isnull: a comparison with NULL would let the CHECK pass)
+                    models.Q(kind='multiplier', multiplier__isnull=False, multiplier__gt=0, student__isnull=True)
+                    | models.Q(kind='discount', percent__isnull=False, percent__gt=0, percent__lte=100, student__isnull=True)
+                    | models.Q(kind='scholarship', percent__isnull=False, percent__gt=0, percent__lte=100, student__isnull=False)
+                    | models.Q(kind='scholarship', amount__isnull=False, amount__gt=0, student__isnull=False)
+                    | models.Q(kind='misc', amount__isnull=False, amount__gt=0, student__isnull=True)
+                ),
+                name='fee_rule_has_value',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+
+
+class FeeInstallment(models.Model):
+    """A payment due date; the shares of a schedule's installments add up to 100%."""
+    schedule = models.ForeignKey(FeeSchedule, on_delete=models.CASCADE, related_name='installments')
+    label = models.CharField(max_length=50)  # e.g. Downpayment, Prelims
+    due_date = models.DateField()
+    percent = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(0), MaxValueValidator(100)])
+    
+    class Meta:
+        ordering = ['due_date']
+    
+    def __str__(self):
+        return f"{self.label} ({self.percent}% due {self.due_date})"
@@ -0,0 +1,122 @@
+"""
+Pagination that doesn't COUNT(*) big tables on every page view.
+
+ApproximateCountPaginator only counts exactly when the result is small.
+Above APPROXIMATE_COUNT_THRESHOLD rows:
+
+  * on PostgreSQL it uses the planner's row estimate for the query
+    (EXPLAIN), which costs about as much as planning it;
+  * elsewhere (SQLite) it counts once and keeps the count in the cache for
+    APPROXIMATE_COUNT_CACHE_SECONDS, keyed by the query.
+
+Either way the total may be a little off, so `is_approximate` is set, the
+last page is not cut short at the estimated count, and a full page always
+offers the next one, past the estimate if need be.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ApproximatePage(Page):
+    # Whether rows follow this page, when the count is only an estimate
+    has_more = None
+
+    def has_next(self):
+        if self.has_more is not None:
+            return self.has_more
+        return super().has_next()
+
+
+class ApproximateCountPaginator(Paginator):
+    is_approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+
+        threshold = _setting('APPROXIMATE_COUNT_THRESHOLD', 10000)
+        # Ordering doesn't change the count; leave it out of the plan / cache key
+        queryset = queryset.order_by()
+        connection = connections[queryset.db]
+
+        if connection.vendor == 'postgresql':
+            estimate = self._planner_estimate(queryset, connection)
+            if estimate is not None and estimate > threshold:
+                self.is_approximate = True
+                return estimate
+            return queryset.count()
+
+        key = self._cache_key(queryset)
+        cached = cache.get(key)
+        if cached is not None:
+            self.is_approximate = True
+            return cached
+        exact = queryset.count()
+        if exact > threshold:
+            cache.set(key, exact, _setting('APPROXIMATE_COUNT_CACHE_SECONDS', 60))
+        return exact
+
+    @staticmethod
+    def _planner_estimate(queryset, connection):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        try:
+            return int(plan[0]['Plan']['Plan Rows'])
+        except (IndexError, KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _cache_key(queryset):
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.md5(f'{queryset.db}|{sql}|{params!r}'.encode(), usedforsecurity=False).hexdigest()
+        return f'enrollments:count:{digest}'
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)  # decides is_approximate
+        except EmptyPage:
+            if not self.is_approximate or int(number) < 1:
+                raise
+            # Past the estimate; page() finds out whether there are rows there
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.is_approximate:
+            return super().page(number)
+        # Don't trust the estimate to say where the last page ends: read one
+        # row more than the page to know whether another one follows
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > self.num_pages:
+            raise EmptyPage(self.error_messages['no_results'])
+        page = self._get_page(rows[:self.per_page], number, self)
+        page.has_more = len(rows) > self.per_page
+        return page
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # Past the estimate, and past the rows too
+            return self.page(self.num_pages)
+
+    def _get_page(self, *args, **kwargs):
+        return ApproximatePage(*args, **kwargs)
@@ -0,0 +1,110 @@
+"""
+Reference data: the active programs and school years.
+
+They change a handful of times per term but are read by every enrollment
+form and dashboard, so each process keeps them in memory, tagged with the
+REFERENCE_DATA version from the shared cache. Saving or deleting a Program
+or SchoolYear bumps that version (signals.py, through bump()).
+
+Reads cost no queries: the process only re-reads the shared version every
+REFERENCE_DATA_CHECK_SECONDS, so other processes pick up a change within
+that time, and the process making it at once. A copy is also reloaded once
+it is REFERENCE_DATA_MAX_AGE seconds old (at most LOCAL_CACHE_SECONDS
+without a shared cache), in case a bump is missed.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Program, SchoolYear
+from . import versioning
+
+
+def _load_programs():
+    return list(Program.objects.using(DEFAULT_DB_ALIAS).filter(is_active=True))
+
+
+def _load_school_years():
+    return list(SchoolYear.objects.using(DEFAULT_DB_ALIAS).filter(is_active=True))
+
+
+# Loaded from the primary: the version is bumped when the primary commits,
+# and a lagging replica would get its old rows cached under the new version
+LOADERS = {
+    'programs': _load_programs,
+    'school_years': _load_school_years,
+}
+
+_loaded = {}    # name -> (version, objects, {pk: object}, loaded at)
+_stamp = None   # (shared version, when it was read)
+_lock = threading.Lock()
+
+
+def _max_age():
+    return versioning.cache_timeout(getattr(settings, 'REFERENCE_DATA_MAX_AGE', 600))
+
+
+def _check_interval():
+    return getattr(settings, 'REFERENCE_DATA_CHECK_SECONDS', 5)
+
+
+def version():
+    """The REFERENCE_DATA version, read from the shared cache at most every REFERENCE_DATA_CHECK_SECONDS."""
+    global _stamp
+    stamp = _stamp
+    if stamp is None or time.monotonic() - stamp[1] > _check_interval():
+        # Timed from before the read, so a bump during it is not missed for longer
+        now = time.monotonic()
+        stamp = _stamp = (versioning.get_version(versioning.REFERENCE_DATA), now)
+    return stamp[0]
+
+
+def bump():
+    """Bump REFERENCE_DATA after a change; this process sees it at once, the others on their next check."""
+    global _stamp
+    _stamp = (versioning.bump_version(versioning.REFERENCE_DATA), time.monotonic())
+
+
+def _stale(entry, current):
+    return entry is None or entry[0] != current or time.monotonic() - entry[3] > _max_age()
+
+
+def _get(name):
+    # Read the version before loading, so a bump during the load is not missed
+    current = version()
+    entry = _loaded.get(name)
+    if _stale(entry, current):
+        with _lock:
+            entry = _loaded.get(name)
+            if _stale(entry, current):
+                loaded_at = time.monotonic()
+                objects = tuple(LOADERS[name]())
+                entry = _loaded[name] = (current, objects, {obj.pk: obj for obj in objects}, loaded_at)
+    return entry
+
+
+# ============================================
+# READ API
+# ============================================
+# The objects are shared by every request in the process; don't modify
+# them. The *_by_pk helpers hand out copies, for assigning to new rows.
+
+def active_programs():
+    return _get('programs')[1]
+
+
+def active_school_years():
+    return _get('school_years')[1]
+
+
+def active_program(pk):
+    obj = _get('programs')[2].get(pk)
+    return copy.copy(obj) if obj is not None else None
+
+
+def active_school_year(pk):
+    obj = _get('school_years')[2].get(pk)
+    return copy.copy(obj) if obj is not None else None
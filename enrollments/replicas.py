@@ -0,0 +1,236 @@
+"""
+Read-replica routing.
+
+Any database alias other than 'default' is treated as a read replica of it
+(settings.py builds them from DATABASE_REPLICA_URLS). Reads go to a replica
+when either:
+
+  * the view is marked with @replica_reads (lists, dashboard, reports), or
+  * the model is listed in settings.REPLICA_READ_MODELS.
+
+Everything else, every write, and every read inside a transaction stays on
+the primary. After a request writes, the user is pinned to the primary for
+sticky_seconds() (via a cookie) so they always see their own changes.
+Replicas that fail a health probe or fall more than REPLICA_MAX_LAG_SECONDS
+behind are skipped until the next probe, so the pin lasts at least that lag
+plus one REPLICA_HEALTH_CHECK_INTERVAL, whatever REPLICA_STICKY_SECONDS says.
+
+Locally this can be tried with two SQLite files and the replicate_sqlite
+command, which copies the primary into the replica every few seconds.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_pin'
+
+# Sessions are read on every request right after being written; keep them on the primary.
+# So is the database cache (settings.CACHES), which holds the data versions
+ALWAYS_PRIMARY_APPS = ('sessions', 'django_cache')
+# Writes that are not the user's data and don't pin them to the primary
+UNPINNED_WRITE_APPS = ('django_cache',)
+
+
+class _RouteState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+
+
+_route_state = contextvars.ContextVar('replica_route_state', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+# ============================================
+# HEALTH
+# ============================================
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def _replication_lag(alias):
+    """Seconds the replica is behind the primary, or None if unknown."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+            )
+            row = cursor.fetchone()
+            return float(row[0]) if row and row[0] is not None else None
+        cursor.execute('SELECT 1')
+
+    # Elsewhere use the newest change-feed entry as a replication heartbeat
+    from .models import ChangeLogEntry
+
+    def newest(using):
+        return ChangeLogEntry.objects.using(using).order_by('-id').values_list('changed_at', flat=True).first()
+
+    primary, replica = newest(DEFAULT_DB_ALIAS), newest(alias)
+    if primary is None:
+        return 0.0
+    if replica is None:
+        return None
+    return max((primary - replica).total_seconds(), 0.0)
+
+
+def _probe(alias):
+    try:
+        lag = _replication_lag(alias)
+    except DatabaseError:
+        logger.warning('Replica %s failed its health check; reading from primary.', alias, exc_info=True)
+        connections[alias].close()
+        return False
+    max_lag = _setting('REPLICA_MAX_LAG_SECONDS', 30)
+    if max_lag is not None and (lag is None or lag > max_lag):
+        logger.warning('Replica %s is %s seconds behind; reading from primary.', alias, lag)
+        return False
+    return True
+
+
+def healthy_replicas():
+    interval = _setting('REPLICA_HEALTH_CHECK_INTERVAL', 10)
+    now = time.monotonic()
+    healthy = []
+    for alias in replica_aliases():
+        with _health_lock:
+            state = _health.get(alias)
+        if state is None or now - state[1] >= interval:
+            state = (_probe(alias), now)
+            with _health_lock:
+                _health[alias] = state
+        if state[0]:
+            healthy.append(alias)
+    return healthy
+
+
+def sticky_seconds():
+    """How long a writer reads from the primary: long enough for any replica still in rotation to catch up."""
+    sticky = _setting('REPLICA_STICKY_SECONDS', 10)
+    max_lag = _setting('REPLICA_MAX_LAG_SECONDS', 30)
+    if max_lag is None:
+        return sticky
+    # A replica within max_lag at its last probe may fall further behind until the next one
+    return max(sticky, max_lag + _setting('REPLICA_HEALTH_CHECK_INTERVAL', 10))
+
+
+def mark_unhealthy(alias):
+    """Take a replica out of rotation until its next health probe."""
+    with _health_lock:
+        _health[alias] = (False, time.monotonic())
+
+
+# ============================================
+# ROUTER
+# ============================================
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in ALWAYS_PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction must see its own writes
+            return DEFAULT_DB_ALIAS
+
+        state = _route_state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+
+        wants_replica = (state is not None and state.replica_reads) or (
+            model._meta.label_lower in _setting('REPLICA_READ_MODELS', ())
+        )
+        if not wants_replica:
+            return DEFAULT_DB_ALIAS
+
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _route_state.get()
+        if state is not None and model._meta.app_label not in UNPINNED_WRITE_APPS:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication
+        return db == DEFAULT_DB_ALIAS
+
+
+# ============================================
+# VIEWS / MIDDLEWARE
+# ============================================
+
+def replica_reads(view_func):
+    """Mark a read-heavy view whose queries may be served by a replica."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        state = _route_state.get()
+        if state is not None and request.method in ('GET', 'HEAD'):
+            state.replica_reads = True
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, whatever the view allows. For
+    results cached under the current data version: built from a lagging
+    replica, they would keep serving old rows under the new version.
+    """
+    outer = _route_state.get()
+    state = _RouteState(pinned=True)
+    token = _route_state.set(state)
+    try:
+        yield
+    finally:
+        _route_state.reset(token)
+        if outer is not None and state.wrote:
+            outer.wrote = True
+
+
+class ReplicaMiddleware:
+    """Tracks writes per request and pins writers to the primary for a while."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        state = _RouteState(pinned=time.time() < pinned_until)
+        token = _route_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _route_state.reset(token)
+
+        if state.wrote and replica_aliases():
+            sticky = sticky_seconds()
+            response.set_cookie(PIN_COOKIE, str(time.time() + sticky), max_age=sticky,
+                                httponly=True, samesite='Lax')
+        return response
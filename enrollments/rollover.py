@@ -0,0 +1,201 @@
+"""
+Term rollover: enroll continuing students in the next school year.
+
+Every enrollment of the source term that is approved or enrolled, in a
+program that is still active, gets a pending copy in the target term: same
+student and program, the next year level (or the same one, between
+semesters of one school year), and the fee assessed by the target term's
+fee schedule (fees.py). Students past the program's duration_years have
+completed it and are left out.
+
+Students who already have an enrollment for that program in the target
+term are skipped by a NOT EXISTS anti-join in the query that reads the
+source rows, so nothing relies on catching IntegrityError per row. The new
+rows are written with bulk_create, DEFAULT_BATCH_SIZE per transaction, with
+a block of enrollment IDs taken by one lookup (Enrollment.allocate_ids).
+bulk_create sends no signals, so each batch updates the summaries, the
+change feed and the dashboard versions itself.
+
+Running it again only creates whatever is still missing, so an interrupted
+rollover is finished by re-running it. If a batch hits a duplicate anyway
+(someone enrolled a student, or took an ID, meanwhile), it is re-checked
+and retried. `manage.py rollover_term` runs it directly; the staff page
+queues run_job() for the workers.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+
+from . import archive, changefeed, dashboards, fees, jobs, summaries, versioning
+from .models import Enrollment, SchoolYear
+
+ELIGIBLE_STATUSES = ('approved', 'enrolled')
+DEFAULT_BATCH_SIZE = 5000
+MAX_ATTEMPTS = 3
+
+YEAR_LEVELS = [level for level, _ in Enrollment.YEAR_LEVEL_CHOICES]
+
+
+class RolloverError(Exception):
+    pass
+
+
+def check_terms(source, target):
+    if source.pk == target.pk:
+        raise RolloverError('The source and target school years are the same.')
+    if not target.is_active:
+        raise RolloverError(f'{target} is not active.')
+    if (target.year_start, target.year_end) < (source.year_start, source.year_end):
+        raise RolloverError(f'{target} comes before {source}.')
+
+
+def advances_year_level(source, target):
+    """Students move up a year level when the target term is in a later school year."""
+    return target.year_start > source.year_start
+
+
+def next_year_level(year_level, duration_years, advance):
+    """The year level to enroll at, or None once the program is completed."""
+    level = int(year_level) + (1 if advance else 0)
+    if level > duration_years or str(level) not in YEAR_LEVELS:
+        return None
+    return str(level)
+
+
+def _eligible(source, target):
+    already_enrolled = Enrollment.objects.filter(
+        student=OuterRef('student_id'), program=OuterRef('program_id'), school_year=target,
+    )
+    # Archived terms are read from the archive table (archive.py)
+    return (
+        archive.enrollments_for_school_year(source)
+        .filter(status__in=ELIGIBLE_STATUSES, program__is_active=True)
+        .annotate(already_enrolled=Exists(already_enrolled))
+    )
+
+
+def preview(source, target):
+    """How many enrollments a rollover would create, skip as existing, and leave out as completed."""
+    check_terms(source, target)
+    advance = advances_year_level(source, target)
+    counts = {'eligible': 0, 'to_create': 0, 'already_enrolled': 0, 'completed': 0}
+    rows = _eligible(source, target).values_list('year_level', 'program__duration_years', 'already_enrolled')
+    for year_level, duration_years, already_enrolled in rows.iterator(chunk_size=DEFAULT_BATCH_SIZE):
+        counts['eligible'] += 1
+        if already_enrolled:
+            counts['already_enrolled'] += 1
+        elif next_year_level(year_level, duration_years, advance) is None:
+            counts['completed'] += 1
+        else:
+            counts['to_create'] += 1
+    return counts
+
+
+# ============================================
+# RUNNING
+# ============================================
+
+def roll_over(source, target, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Create the target term's pending enrollments. Returns the counts.
+    `progress(done, total)` is called after each batch; returning False stops early.
+    """
+    check_terms(source, target)
+    advance = advances_year_level(source, target)
+    candidates = _eligible(source, target).filter(already_enrolled=False)
+    total = candidates.count()
+    counts = {'created': 0, 'completed': 0, 'finished': False}
+    rules = fees.Rules.for_school_year(target)
+
+    last_pk = 0
+    while True:
+        rows = list(
+            candidates.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', 'student_id', 'student__user_id', 'program_id', 'year_level',
+                'program__duration_years',
+            )[:batch_size]
+        )
+        if not rows:
+            counts['finished'] = True
+            break
+        last_pk = rows[-1][0]
+
+        plan = []
+        for _, student_id, user_id, program_id, year_level, duration_years in rows:
+            level = next_year_level(year_level, duration_years, advance)
+            if level is None:
+                counts['completed'] += 1
+            else:
+                plan.append((student_id, user_id, program_id, level, rules.total(program_id, level, student_id)))
+        counts['created'] += _create_batch(plan, target)
+
+        if progress and progress(counts['created'] + counts['completed'], total) is False:
+            break
+    return counts
+
+
+def _create_batch(plan, target):
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                return _insert(plan, target)
+        except IntegrityError:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            plan = _still_missing(plan, target)
+    return 0
+
+
+def _still_missing(plan, target):
+    enrolled = set(
+        Enrollment.objects.filter(school_year=target, student_id__in={row[0] for row in plan})
+        .values_list('student_id', 'program_id')
+    )
+    return [row for row in plan if (row[0], row[2]) not in enrolled]
+
+
+def _insert(plan, target):
+    if not plan:
+        return 0
+    enrollment_ids = Enrollment.allocate_ids(len(plan))
+    enrollments = [
+        Enrollment(
+            enrollment_id=enrollment_id, student_id=student_id, program_id=program_id,
+            school_year=target, year_level=level, status='pending', total_fee=total_fee,
+        )
+        for enrollment_id, (student_id, _, program_id, level, total_fee) in zip(enrollment_ids, plan)
+    ]
+    Enrollment.objects.bulk_create(enrollments, batch_size=500)
+
+    # What the Enrollment signals would have done, once per batch
+    deltas = defaultdict(lambda: [0, Decimal('0')])
+    for enrollment in enrollments:
+        delta = deltas[summaries.summary_key(enrollment.program_id, target.pk, 'pending', enrollment.year_level)]
+        delta[0] += 1
+        delta[1] += enrollment.total_fee or Decimal('0')
+    for key, (count, fee) in deltas.items():
+        summaries.apply_delta(key, count, fee)
+    changefeed.record_many(enrollments, 'insert')
+    dashboards.invalidate_users(row[1] for row in plan)
+    transaction.on_commit(lambda: versioning.bump_version(versioning.ENROLLMENT_DATA))
+    return len(enrollments)
+
+
+@jobs.task
+def run_job(job, source, target, batch_size=DEFAULT_BATCH_SIZE):
+    """The staff page's rollover, in the background."""
+    source, target = SchoolYear.objects.get(pk=source), SchoolYear.objects.get(pk=target)
+    counts = roll_over(
+        source, target, batch_size=batch_size,
+        progress=lambda done, total: jobs.progress(job, done, total) and not job.stopping(),
+    )
+    if not counts['finished']:
+        # The worker is shutting down (or lost the job); a new run picks up the rest
+        jobs.enqueue(run_job, {'source': source.pk, 'target': target.pk}, key=job_key(source, target))
+    return counts
+
+
+def job_key(source, target):
+    return f'rollover:{source.pk}:{target.pk}'
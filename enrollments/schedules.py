@@ -0,0 +1,151 @@
+"""
+Section meeting times and schedule conflicts.
+
+A meeting becomes an interval on the week, in minutes from Monday 00:00,
+so two meetings conflict when a.start < b.end and b.start < a.end
+(back-to-back classes are fine). Conflicts are found two ways:
+
+  * ScheduleIndex holds one student's meetings in a term, sorted by start,
+    with the running maximum of their ends. A new meeting is only compared
+    with meetings that start before it ends, scanning back while that
+    running maximum still reaches past its start. That touches a few
+    entries, not every meeting the student has. EnrollmentForm checks the
+    picked sections against it, and against each other.
+  * term_conflicts() reads every active enrollment's meetings in a term,
+    sorted by (student, start) by the database. It then sweeps each
+    student's list once, keeping a heap of the meetings still in progress.
+    That is O(n log n) for n meetings plus the conflicts found, instead of
+    comparing every pair. `manage.py check_schedule_conflicts` runs it.
+"""
+import heapq
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import accumulate, groupby
+
+from .models import Meeting
+
+MINUTES_PER_DAY = 24 * 60
+DAY_NAMES = [name[:3] for _, name in Meeting.DAY_CHOICES]
+
+# Enrollments that hold their sections' seats and times
+ACTIVE_STATUSES = ('pending', 'approved', 'enrolled')
+
+Slot = namedtuple('Slot', 'start end section_id section_code enrollment_id')
+Conflict = namedtuple('Conflict', 'student_id first second')
+
+
+def week_minutes(day, time):
+    return day * MINUTES_PER_DAY + time.hour * 60 + time.minute
+
+
+def slot_display(slot):
+    day, start = divmod(slot.start, MINUTES_PER_DAY)
+    end = slot.end - day * MINUTES_PER_DAY
+    return f'{slot.section_code} {DAY_NAMES[day]} {start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}'
+
+
+def conflict_display(first, second):
+    return f'{slot_display(first)} overlaps {slot_display(second)}'
+
+
+def section_slots(section, enrollment_id=None):
+    """A section's meetings as slots (uses prefetched meetings)."""
+    return [
+        Slot(week_minutes(m.day, m.start_time), week_minutes(m.day, m.end_time), section.pk, section.code, enrollment_id)
+        for m in section.meetings.all()
+    ]
+
+
+# ============================================
+# PER-STUDENT INDEX
+# ============================================
+
+class ScheduleIndex:
+    """Static interval index over one student's slots."""
+
+    def __init__(self, slots):
+        self.slots = sorted(slots)
+        self.starts = [slot.start for slot in self.slots]
+        self.max_ends = list(accumulate((slot.end for slot in self.slots), max))
+
+    def overlapping(self, start, end):
+        """Slots overlapping [start, end)."""
+        found = []
+        i = bisect_left(self.starts, end) - 1
+        # Nothing at or before i ends after `start` once the running max doesn't
+        while i >= 0 and self.max_ends[i] > start:
+            if self.slots[i].end > start:
+                found.append(self.slots[i])
+            i -= 1
+        return found
+
+
+def _meeting_rows(**filters):
+    # One row per (enrollment, section, meeting), ordered by student, then week time
+    return (
+        Meeting.objects.filter(section__enrollments__status__in=ACTIVE_STATUSES, **{
+            f'section__enrollments__{name}': value for name, value in filters.items()
+        })
+        .order_by('section__enrollments__student_id', 'day', 'start_time', 'end_time')
+        .values_list(
+            'section__enrollments__student_id', 'section__enrollments__id',
+            'section_id', 'section__code', 'day', 'start_time', 'end_time',
+        )
+    )
+
+
+def _slot(row):
+    _, enrollment_id, section_id, code, day, start_time, end_time = row
+    return Slot(week_minutes(day, start_time), week_minutes(day, end_time), section_id, code, enrollment_id)
+
+
+def student_index(student, school_year, exclude_enrollment=None):
+    """The student's active meetings in the term, minus one enrollment's (the one being edited)."""
+    rows = _meeting_rows(student=student, school_year=school_year)
+    return ScheduleIndex(_slot(row) for row in rows if row[1] != exclude_enrollment)
+
+
+def section_conflicts(sections, student=None, school_year=None, exclude_enrollment=None):
+    """(first, second) slot pairs that overlap among `sections`, or with the student's other enrollments."""
+    chosen = sorted(slot for section in sections for slot in section_slots(section))
+    pairs = [(a, b) for a, b in _sweep(chosen) if a.section_id != b.section_id]
+    if student is not None and student.pk and chosen:
+        index = student_index(student, school_year, exclude_enrollment)
+        for slot in chosen:
+            pairs.extend((other, slot) for other in index.overlapping(slot.start, slot.end))
+
+    # A clash between two sections is reported once, however it was found
+    conflicts = {}
+    for first, second in pairs:
+        key = tuple(sorted([(first.start, first.section_id), (second.start, second.section_id)]))
+        conflicts.setdefault(key, (first, second) if key[0] == (first.start, first.section_id) else (second, first))
+    return list(conflicts.values())
+
+
+# ============================================
+# WHOLE TERM (batch validator)
+# ============================================
+
+def _sweep(slots):
+    """Overlapping pairs among `slots`, which must be sorted by start."""
+    in_progress = []  # heap of (end, n, slot)
+    for n, slot in enumerate(slots):
+        while in_progress and in_progress[0][0] <= slot.start:
+            heapq.heappop(in_progress)
+        for _, _, other in in_progress:
+            yield other, slot
+        heapq.heappush(in_progress, (slot.end, n, slot))
+
+
+def find_conflicts(rows):
+    """Conflicts in (student_id, enrollment_id, section_id, code, day, start, end) rows sorted by student and time."""
+    for student_id, student_rows in groupby(rows, key=lambda row: row[0]):
+        for first, second in _sweep([_slot(row) for row in student_rows]):
+            # A section's own meetings, within one enrollment, are not a student conflict
+            if (first.section_id, first.enrollment_id) != (second.section_id, second.enrollment_id):
+                yield Conflict(student_id, first, second)
+
+
+def term_conflicts(school_year):
+    """Every schedule conflict among the term's active enrollments."""
+    return find_conflicts(_meeting_rows(school_year=school_year).iterator(chunk_size=5000))
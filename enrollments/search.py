@@ -0,0 +1,538 @@
+"""
+Student search that forgives accents and misspellings and runs off indexes.
+
+Each student's names, ID and e-mail are normalized (lowercased, accents
+folded, punctuation dropped) into Student.search_text, and every word of it
+is stored as a StudentSearchToken row along with a phonetic key. The key
+smooths over the usual misspellings of Filipino names: Jhon/John,
+Felipe/Pelipe, Dela Cruz/Dela Kruz, Rodriguez/Rodrigues, Niño/Ninyo and the
+o/u and e/i swaps.
+
+Lookups are prefix range scans on the (token, student) and
+(phonetic, student) indexes. They work the same way on SQLite and
+PostgreSQL, and their cost depends on how many rows match, not on the size
+of the table.
+
+Typos the phonetic key can't explain (Jsoe for Jose, Mraia for Maria) are
+left to typeahead(): when a query word matches nothing, it is corrected to
+the closest indexed word with the same first letter (edit distance, a swap
+of two letters counting as one edit), and the search runs again, ranking
+those matches below the exact ones. The words to correct to are kept once
+each, with every beginning of them, in StudentSearchWord, so a correction
+only reads the words about as long as the typed one.
+
+  * typeahead() ranks its candidates by match quality. It serves the
+    students/search.json endpoint.
+  * filter_students() narrows a queryset, e.g. for the admin search box.
+
+signals.py keeps the tokens in sync when a student is saved. Run
+`manage.py rebuild_student_search` after bulk loads that skip signals (it
+also drops the words no student has any more).
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from .models import Student, StudentSearchToken, StudentSearchWord
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_WORDS = 5
+# Students scored per typeahead query; all of them match every word, so
+# this only has to leave room for ranking a dropdown's worth
+CANDIDATE_LIMIT = 50
+# Matching tokens counted per word when picking which word to scan
+SELECTIVITY_CAP = 200
+
+MAX_TOKEN_LENGTH = StudentSearchToken._meta.get_field('token').max_length
+SEARCH_TEXT_LENGTH = Student._meta.get_field('search_text').max_length
+SOURCE_FIELDS = ('last_name', 'first_name', 'middle_name', 'student_id', 'email')
+
+# Score of a query word against the best student word it matches.
+# Ties keep index order, which is alphabetical.
+EXACT, PREFIX, SOUNDS_LIKE, SOUNDS_LIKE_PREFIX = 4, 3, 2, 1
+FIELD_BONUS = {'l': 0.3, 'i': 0.3, 'f': 0.2, 'm': 0.1, 'e': 0}
+# Typo correction: shorter words are too easy to correct into another name
+TYPO_MIN_LENGTH = 4
+TYPO_LONG_WORD = 8          # from here on two edits are allowed, one below
+TYPO_SCAN_LIMIT = 5000      # indexed words compared per query word
+# Shortest word worth keeping for corrections: one edit off the shortest corrected word
+CORRECTION_MIN_LENGTH = TYPO_MIN_LENGTH - 1
+TYPO_WEIGHT = 0.5           # score factor of a corrected word's matches
+
+
+# ============================================
+# NORMALIZING
+# ============================================
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+# Applied in order to each word. Spanish-era spellings and the vowel swaps
+# are where Filipino names are most often misspelled.
+_PHONETIC_RULES = [(re.compile(pattern), replacement) for pattern, replacement in (
+    (r'ph', 'f'),
+    (r'gu(?=[eiy])', 'g'),      # Miguel / Migel
+    (r'c(?=[eiy])', 's'),       # Cecilia / Sesilia
+    (r'qu|ck|c|q', 'k'),        # Enrique / Enrike, Carlo / Karlo
+    (r'x', 'ks'),
+    (r'z', 's'),                # Rodriguez / Rodrigues
+    (r'v', 'b'),                # Vicente / Bicente
+    (r'f', 'p'),                # Felipe / Pelipe
+    (r'(?<=n)y(?=[aeiou])', ''),  # Ninyo (from Niño) / Nino
+    (r'y', 'i'),
+    (r'o', 'u'),
+    (r'e', 'i'),
+    (r'(?<=.)h', ''),           # Jhon, Rhea, Thomas
+    (r'(.)\1+', r'\1'),         # Jonnathan, Allan
+)]
+
+
+def normalize(text):
+    """'Ma. Niña DELA CRUZ' -> 'ma nina dela cruz'"""
+    folded = unicodedata.normalize('NFKD', text or '')
+    folded = ''.join(c for c in folded if not unicodedata.combining(c)).lower()
+    return ' '.join(word for word in _NON_WORD.split(folded) if word)
+
+
+def phonetic(word):
+    """Sound-alike key of a normalized word; words with digits are left alone."""
+    if not word.isalpha():
+        return word
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def query_words(query):
+    return [word[:MAX_TOKEN_LENGTH] for word in normalize(query).split()[:MAX_QUERY_WORDS]]
+
+
+def student_tokens(student):
+    """[(word, field code), ...] for a student, in search_text order."""
+    sources = (
+        ('l', student.last_name),
+        ('f', student.first_name),
+        ('m', student.middle_name),
+        ('i', student.student_id),
+        ('e', (student.email or '').split('@')[0]),
+    )
+    tokens, seen = [], set()
+    for field, value in sources:
+        words = normalize(value).split()
+        # "Dela Cruz" is also typed "delacruz", "2024-0001" as "20240001"
+        if field in ('l', 'i') and len(words) > 1:
+            words.append(''.join(words))
+        for word in words:
+            word = word[:MAX_TOKEN_LENGTH]
+            if word not in seen:
+                seen.add(word)
+                tokens.append((word, field))
+    return tokens
+
+
+def search_text(tokens):
+    return ' '.join(word for word, _ in tokens)[:SEARCH_TEXT_LENGTH]
+
+
+def _prefix_range(prefix):
+    """
+    (low, high) with low <= word < high exactly when word starts with prefix.
+
+    Words only contain [0-9a-z] (see normalize()), which sort the same way
+    under the C collation and the usual locale collations. So a range on a
+    plain B-tree index works on every backend, whatever its LIKE rules.
+    High is None when no upper bound is needed ('zz' -> anything after it).
+    """
+    stem = prefix.rstrip('z')
+    if not stem:
+        return prefix, None
+    last = stem[-1]
+    return prefix, stem[:-1] + ('a' if last == '9' else chr(ord(last) + 1))
+
+
+def _range_filter(column, prefix):
+    low, high = _prefix_range(prefix)
+    lookups = {f'{column}__gte': low}
+    if high is not None:
+        lookups[f'{column}__lt'] = high
+    return lookups
+
+
+# ============================================
+# INDEXING
+# ============================================
+
+def _token_rows(token_model, student_id, tokens):
+    return [
+        token_model(student_id=student_id, token=word, phonetic=phonetic(word)[:MAX_TOKEN_LENGTH], field=field)
+        for word, field in tokens
+    ]
+
+
+def correction_words(token):
+    """The token and its beginnings that a typo may be corrected to."""
+    return [token[:length] for length in range(CORRECTION_MIN_LENGTH, len(token) + 1)]
+
+
+def _word_rows(word_model, tokens):
+    words = {word for token in tokens for word in correction_words(token)}
+    return [word_model(word=word, length=len(word)) for word in sorted(words)]
+
+
+def index_student(student):
+    """Rewrite one student's tokens (search_text is set by the pre_save signal)."""
+    tokens = student_tokens(student)
+    with transaction.atomic():
+        StudentSearchToken.objects.filter(student_id=student.pk).delete()
+        StudentSearchToken.objects.bulk_create(_token_rows(StudentSearchToken, student.pk, tokens))
+        # Words other students share are already there; ones nobody has any
+        # more stay until the next rebuild_words() and are skipped meanwhile
+        StudentSearchWord.objects.bulk_create(_word_rows(StudentSearchWord, [word for word, _ in tokens]),
+                                              ignore_conflicts=True)
+
+
+def rebuild(student_model=Student, token_model=StudentSearchToken, batch_size=1000):
+    """
+    Recompute search_text and the tokens of every student, in pk batches.
+    Takes the models so the migration can run it with historical ones.
+    Returns the number of students indexed.
+    """
+    total, last_pk = 0, 0
+    while True:
+        batch = list(
+            student_model.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('search_text', *SOURCE_FIELDS)[:batch_size]
+        )
+        if not batch:
+            return total
+
+        rows, changed = [], []
+        for student in batch:
+            tokens = student_tokens(student)
+            text = search_text(tokens)
+            if student.search_text != text:
+                student.search_text = text
+                changed.append(student)
+            rows.extend(_token_rows(token_model, student.pk, tokens))
+
+        with transaction.atomic():
+            if changed:
+                student_model.objects.bulk_update(changed, ['search_text'], batch_size=200)
+            token_model.objects.filter(student_id__gte=batch[0].pk, student_id__lte=batch[-1].pk).delete()
+            token_model.objects.bulk_create(rows, batch_size=batch_size)
+
+        last_pk = batch[-1].pk
+        total += len(batch)
+
+
+def rebuild_words(token_model=StudentSearchToken, word_model=StudentSearchWord, batch_size=1000):
+    """
+    Recompute StudentSearchWord from the tokens, dropping the words no
+    student has any more. Takes the models so the migration can run it with
+    historical ones. Returns the number of words.
+    """
+    tokens = token_model.objects.order_by('token').values_list('token', flat=True).distinct()
+    with transaction.atomic():
+        word_model.objects.all().delete()
+        batch = []
+        for token in tokens.iterator(chunk_size=batch_size):
+            batch.append(token)
+            if len(batch) >= batch_size:
+                # Beginnings shared across batches are left to ignore_conflicts
+                word_model.objects.bulk_create(_word_rows(word_model, batch), ignore_conflicts=True)
+                batch = []
+        word_model.objects.bulk_create(_word_rows(word_model, batch), ignore_conflicts=True)
+    return word_model.objects.count()
+
+
+# ============================================
+# SEARCHING
+# ============================================
+
+def _word_filter(word):
+    """Q for a student word matching a query word by prefix or sound-alike prefix."""
+    return Q(**_range_filter('token', word)) | Q(**_range_filter('phonetic', phonetic(word)))
+
+
+def filter_students(queryset, query, field='pk'):
+    """
+    Narrow a queryset to students matching every word of the query (by
+    prefix or sound-alike prefix). `field` is the path to the student's pk,
+    e.g. 'student' on an Enrollment queryset.
+    """
+    for word in query_words(query):
+        matches = StudentSearchToken.objects.filter(_word_filter(word)).values('student_id')
+        queryset = queryset.filter(**{f'{field}__in': matches})
+    return queryset
+
+
+# typeahead() runs on every keystroke, so it talks SQL directly: building
+# these querysets through the ORM costs more than SQLite takes to run them.
+# The statements only use plain comparisons, EXISTS and LIMIT, so they run
+# unchanged on every backend.
+
+def _range_sql(column, prefix):
+    low, high = _prefix_range(prefix)
+    if high is None:
+        return f'{column} >= %s', [low]
+    return f'{column} >= %s AND {column} < %s', [low, high]
+
+
+def _word_sql(alias, word):
+    token_sql, token_params = _range_sql(f'{alias}.token', word)
+    phonetic_sql, phonetic_params = _range_sql(f'{alias}.phonetic', phonetic(word))
+    return f'(({token_sql}) OR ({phonetic_sql}))', token_params + phonetic_params
+
+
+def _most_selective(cursor, table, words):
+    """
+    The query word with the fewest matching tokens, counted up to
+    SELECTIVITY_CAP (ties go to the longest), or None if a word matches
+    nothing. Scanning the rarest word and checking the others per row keeps
+    "Juan Dimaculangan" from walking every Juan.
+    """
+    if len(words) == 1:
+        return words[0]
+    words = sorted(words, key=len, reverse=True)
+    counts, params = [], []
+    for word in words:
+        condition, condition_params = _word_sql(table, word)
+        counts.append(f'(SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {condition} LIMIT %s) capped)')
+        params += condition_params + [SELECTIVITY_CAP]
+    cursor.execute(f'SELECT {", ".join(counts)}', params)
+    counts = cursor.fetchone()
+    if not all(counts):
+        return None
+    return min(zip(words, counts), key=lambda c: c[1])[0]
+
+
+def _candidates(cursor, table, anchor, others):
+    """
+    Ids of students matching every query word, best kind of match on the
+    anchor word first: the anchor's word-prefix range in index order (so an
+    exact word comes before longer ones, then alphabetical), then its
+    sound-alike range the same way. The other words are checked per row
+    through the student's own handful of tokens.
+    """
+    also_sql, also_params = '', []
+    for word in others:
+        condition, params = _word_sql('other', word)
+        also_sql += (f' AND EXISTS (SELECT 1 FROM {table} other '
+                     f'WHERE other.student_id = anchor.student_id AND {condition})')
+        also_params += params
+
+    steps = [('token', anchor)]
+    if anchor.isalpha():
+        # Words with digits are their own phonetic key; nothing more to find
+        steps.append(('phonetic', phonetic(anchor)))
+
+    found = {}
+    for column, prefix in steps:
+        if len(found) >= CANDIDATE_LIMIT:
+            break
+        condition, params = _range_sql(f'anchor.{column}', prefix)
+        cursor.execute(
+            f'SELECT anchor.student_id FROM {table} anchor WHERE {condition}{also_sql} '
+            f'ORDER BY anchor.{column} LIMIT %s',
+            params + also_params + [CANDIDATE_LIMIT],
+        )
+        for (student_id,) in cursor.fetchall():
+            found.setdefault(student_id, None)
+    return list(found)[:CANDIDATE_LIMIT]
+
+
+def _candidate_words(cursor, table, candidates):
+    words_by_student = defaultdict(list)
+    cursor.execute(
+        f'SELECT student_id, token, phonetic, field FROM {table} '
+        f'WHERE student_id IN ({", ".join(["%s"] * len(candidates))})',
+        candidates,
+    )
+    for student_id, word, key, field in cursor.fetchall():
+        words_by_student[student_id].append((word, key, field))
+    return words_by_student
+
+
+def _score(keys, words):
+    """
+    Sum of each query word's best match against the student's words, times
+    the word's weight (see _corrections()); 0 if one doesn't match.
+    """
+    total = 0
+    for query_word, query_key, weight in keys:
+        best = 0
+        for word, key, field in words:
+            if word == query_word:
+                score = EXACT
+            elif word.startswith(query_word):
+                score = PREFIX
+            elif key == query_key:
+                score = SOUNDS_LIKE
+            elif key.startswith(query_key):
+                score = SOUNDS_LIKE_PREFIX
+            else:
+                continue
+            best = max(best, score + FIELD_BONUS[field])
+        if not best:
+            return 0
+        total += best * weight
+    return total
+
+
+def _match(cursor, table, words):
+    """Candidate ids of students matching every word (see _candidates())."""
+    anchor = _most_selective(cursor, table, words)
+    if anchor is None:
+        return []
+    return _candidates(cursor, table, anchor, [word for word in words if word is not anchor])
+
+
+def typeahead(query, limit=DEFAULT_LIMIT):
+    """Best matches for a (partial) query, as dicts for the JSON endpoint."""
+    words = query_words(query)
+    if len(''.join(words)) < MIN_QUERY_LENGTH:
+        return []
+
+    connection = connections[router.db_for_read(StudentSearchToken)]
+    table = connection.ops.quote_name(StudentSearchToken._meta.db_table)
+    with connection.cursor() as cursor:
+        searched = words
+        candidates = _match(cursor, table, words)
+        if not candidates:
+            # Nothing found: try again with the typos corrected
+            searched = _corrections(cursor, table, words)
+            if searched is None:
+                return []
+            candidates = _match(cursor, table, searched)
+            if not candidates:
+                return []
+        words_by_student = _candidate_words(cursor, table, candidates)
+    keys = [
+        (word, phonetic(word), 1 if word == typed else TYPO_WEIGHT)
+        for word, typed in zip(searched, words)
+    ]
+
+    scored = []
+    for student_id in candidates:
+        score = _score(keys, words_by_student[student_id])
+        if score:
+            scored.append((score, student_id))
+    scored.sort(key=lambda s: -s[0])  # stable, so ties stay in candidate order
+    scored = scored[:limit]
+
+    students = Student.objects.only(
+        'student_id', 'first_name', 'middle_name', 'last_name', 'email'
+    ).in_bulk([student_id for _, student_id in scored])
+    return [
+        {
+            'id': student_id,
+            'student_id': students[student_id].student_id,
+            'name': students[student_id].get_full_name(),
+            'email': students[student_id].email,
+            'score': round(score, 2),
+        }
+        for score, student_id in scored
+        if student_id in students
+    ]
+
+
+# ============================================
+# TYPOS
+# ============================================
+
+def _edit_distance(a, b, limit):
+    """
+    Damerau-Levenshtein distance between a and b (optimal string alignment:
+    swapping two neighbouring letters is one edit), or limit + 1 once it is
+    known to be over `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+def _max_edits(word):
+    if len(word) < TYPO_MIN_LENGTH or not word.isalpha():
+        return 0
+    return 2 if len(word) >= TYPO_LONG_WORD else 1
+
+
+def _matches_anything(cursor, table, word):
+    condition, params = _word_sql(table, word)
+    cursor.execute(f'SELECT 1 FROM {table} WHERE {condition} LIMIT 1', params)
+    return cursor.fetchone() is not None
+
+
+def _closest(cursor, table, word):
+    """
+    The indexed word, or word beginning (the query may be a partial word),
+    closest to `word`: fewest edits, then most students. None if there is
+    none within _max_edits(). Only words sharing the first letter and
+    within that many letters of its length are compared: one range scan of
+    the StudentSearchWord index per length.
+    """
+    limit = _max_edits(word)
+    if not limit:
+        return None
+    words_table = cursor.db.ops.quote_name(StudentSearchWord._meta.db_table)
+    lengths = list(range(len(word) - limit, len(word) + limit + 1))
+    condition, params = _range_sql('word', word[0])
+    cursor.execute(
+        f'SELECT word FROM {words_table} WHERE length IN ({", ".join(["%s"] * len(lengths))}) AND {condition} '
+        f'LIMIT %s',
+        lengths + params + [TYPO_SCAN_LIMIT],
+    )
+    found = defaultdict(list)  # edits -> corrected words
+    for (candidate,) in cursor.fetchall():
+        edits = _edit_distance(word, candidate, limit)
+        if edits <= limit:
+            found[edits].append(candidate)
+    for edits in sorted(found):
+        # Ties go to the word most students have; words nobody has any more have none
+        counts = _token_counts(cursor, table, sorted(found[edits]))
+        best = max(counts, key=lambda candidate: counts[candidate])
+        if counts[best]:
+            return best
+    return None
+
+
+def _token_counts(cursor, table, prefixes):
+    """{prefix: tokens starting with it}, each counted up to SELECTIVITY_CAP."""
+    counts, params = [], []
+    for prefix in prefixes:
+        condition, condition_params = _range_sql('token', prefix)
+        counts.append(f'(SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {condition} LIMIT %s) capped)')
+        params += condition_params + [SELECTIVITY_CAP]
+    cursor.execute(f'SELECT {", ".join(counts)}', params)
+    return dict(zip(prefixes, cursor.fetchone()))
+
+
+def _corrections(cursor, table, words):
+    """
+    The query words with each one that matches nothing replaced by its
+    closest indexed word, or None if one can't be corrected (or none needed it).
+    """
+    corrected = []
+    for word in words:
+        if _matches_anything(cursor, table, word):
+            corrected.append(word)
+            continue
+        closest = _closest(cursor, table, word)
+        if closest is None:
+            return None
+        corrected.append(closest)
+    return corrected if corrected != words else None
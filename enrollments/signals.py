@@ -0,0 +1,174 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Student, Program, SchoolYear, Enrollment, Notification, ArchivedEnrollment
+from . import changefeed, dashboards, mail, reference, search, summaries, transitions, versioning
+
+
+# ============================================
+# ENROLLMENT SUMMARIES
+# ============================================
+
+@receiver(pre_save, sender=Enrollment)
+def remember_enrollment_summary_key(sender, instance, raw=False, **kwargs):
+    # Read the row as it is in the database (not as this instance last saw it)
+    # so the right summary row gets decremented
+    instance._summary_previous = None
+    if raw or instance.pk is None:
+        return
+    previous = (
+        Enrollment.objects.select_for_update()
+        .filter(pk=instance.pk)
+        .values_list(*summaries.MEASURE_FIELDS)
+        .first()
+    )
+    if previous:
+        instance._summary_previous = summaries.measure(*previous)
+
+
+@receiver(post_save, sender=Enrollment)
+def update_enrollment_summary_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_summary_previous', None)
+    summaries.record_change(previous, summaries.enrollment_measure(instance))
+
+
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_delete, sender=ArchivedEnrollment)
+def update_enrollment_summary_on_delete(sender, instance, **kwargs):
+    summaries.record_change(summaries.enrollment_measure(instance), None)
+
+
+# ============================================
+# STUDENT SEARCH
+# ============================================
+
+@receiver(pre_save, sender=Student)
+def update_student_search_text(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    text = search.search_text(search.student_tokens(instance))
+    # Only rewrite the token rows when something searchable changed
+    instance._search_tokens_stale = instance.pk is None or text != instance.search_text
+    instance.search_text = text
+
+
+@receiver(post_save, sender=Student)
+def update_student_search_tokens(sender, instance, created, raw=False, **kwargs):
+    if raw or not (created or getattr(instance, '_search_tokens_stale', True)):
+        return
+    search.index_student(instance)
+
+
+# ============================================
+# DATA VERSIONS (cache invalidation)
+# ============================================
+
+def _bump_enrollment_data(**kwargs):
+    # Only after commit, otherwise a reader could cache the old data
+    # again under the new version
+    transaction.on_commit(lambda: versioning.bump_version(versioning.ENROLLMENT_DATA))
+
+
+for _model in (Program, SchoolYear, Enrollment):
+    post_save.connect(_bump_enrollment_data, sender=_model, dispatch_uid=f'bump-enrollment-data-save-{_model.__name__}')
+    post_delete.connect(_bump_enrollment_data, sender=_model, dispatch_uid=f'bump-enrollment-data-delete-{_model.__name__}')
+
+
+def _bump_reference_data(**kwargs):
+    transaction.on_commit(reference.bump)
+
+
+for _model in (Program, SchoolYear):
+    post_save.connect(_bump_reference_data, sender=_model, dispatch_uid=f'bump-reference-data-save-{_model.__name__}')
+    post_delete.connect(_bump_reference_data, sender=_model, dispatch_uid=f'bump-reference-data-delete-{_model.__name__}')
+
+
+def _bump_student_data(**kwargs):
+    transaction.on_commit(lambda: versioning.bump_version(versioning.STUDENT_DATA))
+
+
+post_save.connect(_bump_student_data, sender=Student, dispatch_uid='bump-student-data-save')
+post_delete.connect(_bump_student_data, sender=Student, dispatch_uid='bump-student-data-delete')
+
+
+# ============================================
+# DASHBOARD SNAPSHOTS (per user)
+# ============================================
+
+def _enrollment_user_id(enrollment):
+    student_field = Enrollment._meta.get_field('student')
+    if student_field.is_cached(enrollment):
+        return enrollment.student.user_id
+    return Student.objects.filter(pk=enrollment.student_id).values_list('user_id', flat=True).first()
+
+
+def _invalidate_enrollment_owner(sender, instance, **kwargs):
+    dashboards.invalidate_user(_enrollment_user_id(instance))
+
+
+def _invalidate_user(sender, instance, **kwargs):
+    dashboards.invalidate_user(instance.user_id)
+
+
+post_save.connect(_invalidate_enrollment_owner, sender=Enrollment, dispatch_uid='dashboard-enrollment-save')
+post_delete.connect(_invalidate_enrollment_owner, sender=Enrollment, dispatch_uid='dashboard-enrollment-delete')
+for _model in (Notification, Student):
+    post_save.connect(_invalidate_user, sender=_model, dispatch_uid=f'dashboard-save-{_model.__name__}')
+    post_delete.connect(_invalidate_user, sender=_model, dispatch_uid=f'dashboard-delete-{_model.__name__}')
+
+
+# ============================================
+# CHANGE FEED
+# ============================================
+
+def _record_save(sender, instance, created, **kwargs):
+    changefeed.record(instance, 'insert' if created else 'update')
+
+
+def _record_delete(sender, instance, **kwargs):
+    changefeed.record(instance, 'delete')
+
+
+for _model in changefeed.TRACKED_MODELS:
+    post_save.connect(_record_save, sender=_model, dispatch_uid=f'changefeed-save-{_model.__name__}')
+    post_delete.connect(_record_delete, sender=_model, dispatch_uid=f'changefeed-delete-{_model.__name__}')
+
+
+# ============================================
+# STATUS TRANSITIONS (conditional UPDATEs, see transitions.py)
+# ============================================
+
+NOTIFICATION_MESSAGES = {
+    'approve': ('enrollment_approved', 'Your enrollment for {program} has been approved!'),
+    'reject': ('enrollment_rejected', 'Your enrollment for {program} has been rejected.'),
+    'enroll': ('enrollment_confirmed', 'You are now enrolled in {program}.'),
+}
+
+
+@receiver(transitions.enrollment_transitioned)
+def update_after_transition(sender, transition, enrollments, previous, **kwargs):
+    # What the post_save handlers above do for a save()
+    summaries.record_changes((previous[e.pk], summaries.enrollment_measure(e)) for e in enrollments)
+    changefeed.record_many(enrollments, 'update')
+    dashboards.invalidate_users(e.student.user_id for e in enrollments)
+    transaction.on_commit(lambda: versioning.bump_version(versioning.ENROLLMENT_DATA))
+
+
+@receiver(transitions.enrollment_transitioned)
+def notify_after_transition(sender, transition, enrollments, notes=None, **kwargs):
+    if transition.name not in NOTIFICATION_MESSAGES:
+        return
+    notification_type, template = NOTIFICATION_MESSAGES[transition.name]
+    reason = f' Reason: {notes}' if transition.name == 'reject' and notes else ''
+    Notification.objects.bulk_create([
+        Notification(
+            user_id=e.student.user_id, notification_type=notification_type, enrollment=e,
+            message=template.format(program=e.program.name) + reason,
+        )
+        for e in enrollments
+    ])
+    for enrollment in enrollments:
+        mail.queue_decision_email(enrollment)
@@ -0,0 +1,423 @@
+"""
+Columnar snapshots of closed school years, for institutional research.
+
+A closed term (an inactive SchoolYear) doesn't change any more, so its
+enrollments can be written once, joined with their student and program,
+into a read-only file that analyses scan instead of the database.
+write_snapshot() streams the term's rows (from the archive tables if it
+was archived) into one column per field:
+
+  * 'dict' columns (status, program code, ...) are dictionary-encoded:
+    the distinct values go in the header and each row stores a 1, 2 or
+    4-byte code, whichever is enough. Only for the few-valued columns.
+  * 'str' columns (the ENR-... and student IDs, one value per row) store
+    8-byte end offsets, row i ending where row i + 1 starts, and then the
+    UTF-8 text of every row in one block. Values can't be NULL.
+  * 'int' columns (ids, fees in cents, unix timestamps) store 8-byte
+    integers; NULL is INT_NULL.
+
+File layout: MAGIC, a 4-byte little-endian header length, the JSON header
+(term, row count, column offsets and dictionaries), then the columns, each
+block aligned to 8 bytes. Columns are in the writer's native byte order,
+which the header records.
+
+Snapshot(path) memory-maps a file and hands out the columns as
+memoryviews over the map. Opening parses only the header, whose size
+depends on the number of distinct values of the dict columns, not on the
+number of rows. Nothing else is read until a column is used, and then
+only that column. mask() and group_by() work on the codes: a filter on a
+dict column is tested once per distinct value, not once per row, and
+grouping counts tuples of small ints. No database query, no model
+instances. group_by_terms() runs the same group_by over many snapshots
+and adds the results up.
+"""
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+
+from . import archive
+
+MAGIC = b'ENRSNAP1'
+FORMAT_VERSION = 2
+ALIGNMENT = 8
+INT_NULL = -2 ** 63
+READ_CHUNK_SIZE = 5000
+
+# name, kind, values() lookup, conversion to what's stored
+COLUMNS = [
+    ('enrollment_pk', 'int', 'id', None),
+    ('enrollment_id', 'str', 'enrollment_id', None),
+    ('status', 'dict', 'status', None),
+    ('year_level', 'dict', 'year_level', None),
+    ('total_fee_cents', 'int', 'total_fee', lambda fee: int(fee * 100)),
+    ('created_at', 'int', 'created_at', lambda value: int(value.timestamp())),
+    ('reviewed_at', 'int', 'reviewed_at', lambda value: int(value.timestamp())),
+    ('student_pk', 'int', 'student_id', None),
+    ('student_id', 'str', 'student__student_id', None),
+    ('gender', 'dict', 'student__gender', None),
+    ('birth_year', 'dict', 'student__date_of_birth', lambda value: value.year),
+    ('program_pk', 'int', 'program_id', None),
+    ('program_code', 'dict', 'program__code', None),
+    ('program_name', 'dict', 'program__name', None),
+    ('program_type', 'dict', 'program__program_type', None),
+    ('program_duration', 'dict', 'program__duration_years', None),
+]
+# Not stored: the same for every row of a snapshot, taken from the header
+TERM_COLUMN = 'term'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'SNAPSHOT_DIR', settings.BASE_DIR / 'snapshots'))
+
+
+def snapshot_path(school_year, directory=None):
+    return Path(directory or snapshot_dir()) / f'sy{school_year.year_start}-{school_year.year_end}-{school_year.semester}.ensnap'
+
+
+def term_label(year_start, year_end, semester):
+    return f'{year_start}-{year_end} {semester}'
+
+
+# ============================================
+# WRITING
+# ============================================
+
+class _DictColumn:
+    def __init__(self):
+        self.codes = array('I')
+        self.index = {}
+
+    def append(self, value):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.index)
+        self.codes.append(code)
+
+    def finish(self):
+        """The blocks to write and the header entries that describe them."""
+        size = len(self.index)
+        typecode = 'B' if size <= 0xFF else 'H' if size <= 0xFFFF else 'I'
+        return [array(typecode, self.codes)], {'dictionary': list(self.index)}
+
+
+class _StrColumn:
+    def __init__(self):
+        self.ends = array('Q', [0])
+        self.text = array('B')
+
+    def append(self, value):
+        self.text.frombytes(value.encode())
+        self.ends.append(len(self.text))
+
+    def finish(self):
+        return [self.ends, self.text], {}
+
+
+class _IntColumn:
+    def __init__(self):
+        self.values = array('q')
+
+    def append(self, value):
+        self.values.append(INT_NULL if value is None else value)
+
+    def finish(self):
+        return [self.values], {}
+
+
+COLUMN_TYPES = {'dict': _DictColumn, 'str': _StrColumn, 'int': _IntColumn}
+# Header keys of each block's position, in the order finish() returns the blocks
+BLOCK_KEYS = ('offset', 'text_offset')
+
+
+def write_snapshot(school_year, path=None):
+    """Write `school_year`'s enrollments to a snapshot file; (path, rows)."""
+    if school_year.is_active:
+        raise SnapshotError(f'{school_year} is still active; only closed terms can be snapshotted.')
+    path = Path(path or snapshot_path(school_year))
+
+    columns = [COLUMN_TYPES[kind]() for _, kind, _, _ in COLUMNS]
+    converters = [convert for _, _, _, convert in COLUMNS]
+    rows = (
+        archive.enrollments_for_school_year(school_year)
+        .order_by('pk')
+        .values_list(*(lookup for _, _, lookup, _ in COLUMNS))
+        .iterator(chunk_size=READ_CHUNK_SIZE)
+    )
+    count = 0
+    for row in rows:
+        for column, convert, value in zip(columns, converters, row):
+            column.append(convert(value) if convert is not None and value is not None else value)
+        count += 1
+
+    header = {
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'term': {
+            'id': school_year.pk, 'year_start': school_year.year_start, 'year_end': school_year.year_end,
+            'semester': school_year.semester,
+        },
+        'rows': count,
+        'created_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'columns': [],
+    }
+    blocks = []  # (header entry, key of its offset, array)
+    for (name, kind, _, _), column in zip(COLUMNS, columns):
+        data, extra = column.finish()
+        entry = {'name': name, 'kind': kind, 'typecode': data[0].typecode, **extra}
+        header['columns'].append(entry)
+        blocks.extend((entry, key, block) for key, block in zip(BLOCK_KEYS, data))
+
+    _write_file(path, header, blocks)
+    return path, count
+
+
+def _write_file(path, header, blocks):
+    # Offsets depend on the header's length, which depends on the offsets: fix the
+    # header's size first with placeholder offsets of the final width
+    for entry, key, _ in blocks:
+        entry[key] = 10 ** 15
+    header_size = _aligned(len(MAGIC) + 4 + len(_dump_header(header)))
+    offset = header_size
+    for entry, key, block in blocks:
+        entry[key] = offset
+        offset = _aligned(offset + len(block) * block.itemsize)
+    encoded = _dump_header(header).ljust(header_size - len(MAGIC) - 4)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the target and renamed, so readers never see half a file
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+            for entry, key, block in blocks:
+                fh.write(b'\0' * (entry[key] - fh.tell()))
+                block.tofile(fh)
+        # mkstemp() makes it private to us
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _dump_header(header):
+    return json.dumps(header, separators=(',', ':')).encode()
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# ============================================
+# READING
+# ============================================
+
+class Snapshot:
+    """A memory-mapped snapshot file. Use as a context manager, or close() it."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                raise SnapshotError(f'{self.path} is not an enrollment snapshot.')
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        header_length, = struct.unpack_from('<I', self._mmap, len(MAGIC))
+        self.header = json.loads(bytes(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_length]))
+        if self.header['version'] != FORMAT_VERSION or self.header['byteorder'] != sys.byteorder:
+            self.close()
+            raise SnapshotError(f'{self.path} was written by an incompatible version or machine.')
+        self.rows = self.header['rows']
+        self.columns = {column['name']: column for column in self.header['columns']}
+        term = self.header['term']
+        self.term = term_label(term['year_start'], term['year_end'], term['semester'])
+        self._views = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # The map can't close while memoryviews over it are alive
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise SnapshotError(f"No column {name!r}; there are {', '.join([TERM_COLUMN, *self.columns])}.")
+
+    def raw(self, name):
+        """
+        The stored column: codes for dict columns, the rows + 1 text offsets
+        for str columns, integers otherwise. No copy.
+        """
+        view = self._views.get(name)
+        if view is None:
+            column = self._column(name)
+            size = struct.calcsize(column['typecode'])
+            count = self.rows + 1 if column['kind'] == 'str' else self.rows
+            view = memoryview(self._mmap)[column['offset']:column['offset'] + count * size]
+            view = self._views[name] = view.cast(column['typecode'])
+        return view
+
+    def _strings(self, name):
+        """A str column's values, decoded one by one from the map."""
+        ends = self.raw(name)
+        text = self._views.get((name, 'text'))
+        if text is None:
+            start = self.columns[name]['text_offset']
+            text = self._views[(name, 'text')] = memoryview(self._mmap)[start:start + ends[-1]]
+        return (str(text[start:end], 'utf-8') for start, end in zip(ends, ends[1:]))
+
+    def values(self, name, mask=None):
+        """Decoded values of one column, optionally only the rows in `mask`."""
+        if name == TERM_COLUMN:
+            return [self.term] * (self.rows if mask is None else mask.count(1))
+        column = self._column(name)
+        data = self._strings(name) if column['kind'] == 'str' else self.raw(name)
+        if mask is not None:
+            data = itertools.compress(data, mask)
+        if column['kind'] == 'dict':
+            dictionary = column['dictionary']
+            return [dictionary[code] for code in data]
+        if column['kind'] == 'str':
+            return list(data)
+        return [None if value == INT_NULL else value for value in data]
+
+    # ============================================
+    # FILTERING AND GROUPING
+    # ============================================
+
+    def mask(self, **conditions):
+        """A bytes mask (1 per matching row) for all of `conditions`, or None for none.
+
+        Each condition is a value, a list / tuple / set of values, or a
+        predicate called with the (decoded) value.
+        """
+        mask = None
+        for name, condition in conditions.items():
+            test = _predicate(condition)
+            if name == TERM_COLUMN:
+                column_mask = (b'\1' if test(self.term) else b'\0') * self.rows
+            elif self._column(name)['kind'] == 'dict':
+                column_mask = self._dict_mask(name, test)
+            elif self.columns[name]['kind'] == 'str':
+                column_mask = bytes(test(value) for value in self._strings(name))
+            else:
+                column_mask = bytes(test(None if value == INT_NULL else value) for value in self.raw(name))
+            mask = column_mask if mask is None else _and(mask, column_mask)
+        return mask
+
+    def _dict_mask(self, name, test):
+        wanted = {code for code, value in enumerate(self.columns[name]['dictionary']) if test(value)}
+        codes = self.raw(name)
+        if codes.format == 'B':
+            # One C-level pass: map every possible code to 1 or 0
+            return codes.tobytes().translate(bytes(code in wanted for code in range(256)))
+        return bytes(code in wanted for code in codes)
+
+    def group_by(self, by, where=None, sums=()):
+        """{key tuple: {'count': n, <column>: total, ...}} over the rows matching `where`."""
+        mask = self.mask(**where) if where else None
+        keys, decoders = [], []
+        for name in by:
+            if name == TERM_COLUMN:
+                keys.append(itertools.repeat(0, self.rows))
+                decoders.append([self.term])
+            elif self._column(name)['kind'] == 'str':
+                keys.append(self._strings(name))
+                decoders.append(None)
+            else:
+                keys.append(self.raw(name))
+                column = self.columns[name]
+                decoders.append(column['dictionary'] if column['kind'] == 'dict' else None)
+        if mask is not None:
+            keys = [itertools.compress(key, mask) for key in keys]
+        # Group on the stored codes; decode once per group
+        key_rows = zip(*keys) if keys else itertools.repeat((), self.rows if mask is None else mask.count(1))
+
+        if not sums:
+            groups = {key: {'count': count} for key, count in Counter(key_rows).items()}
+        else:
+            for name in sums:
+                if self._column(name)['kind'] != 'int':
+                    raise SnapshotError(f'Only int columns can be summed, not {name!r}.')
+            measures = [self.raw(name) for name in sums]
+            if mask is not None:
+                measures = [itertools.compress(measure, mask) for measure in measures]
+            totals = defaultdict(lambda: [0] * (len(sums) + 1))
+            for key, values in zip(key_rows, zip(*measures)):
+                total = totals[key]
+                total[0] += 1
+                for index, value in enumerate(values, start=1):
+                    if value != INT_NULL:
+                        total[index] += value
+            groups = {key: {'count': total[0], **dict(zip(sums, total[1:]))} for key, total in totals.items()}
+
+        return {
+            tuple(code if decoder is None else decoder[code] for code, decoder in zip(key, decoders)): measures
+            for key, measures in groups.items()
+        }
+
+
+def _predicate(condition):
+    if callable(condition):
+        return condition
+    if isinstance(condition, (list, tuple, set, frozenset)):
+        allowed = set(condition)
+        return lambda value: value in allowed
+    return lambda value: value == condition
+
+
+def _and(left, right):
+    size = len(left)
+    return (int.from_bytes(left, 'little') & int.from_bytes(right, 'little')).to_bytes(size, 'little')
+
+
+# ============================================
+# MANY TERMS
+# ============================================
+
+def snapshot_files(directory=None):
+    return sorted(Path(directory or snapshot_dir()).glob('*.ensnap'))
+
+
+def group_by_terms(paths, by, where=None, sums=()):
+    """Snapshot.group_by() over every file in `paths`, added up."""
+    merged = {}
+    for path in paths:
+        with Snapshot(path) as snapshot:
+            for key, measures in snapshot.group_by(by, where=where, sums=sums).items():
+                total = merged.setdefault(key, dict.fromkeys(measures, 0))
+                for name, value in measures.items():
+                    total[name] += value
+    return merged
+
+
+def cents(value):
+    return Decimal(value) / 100
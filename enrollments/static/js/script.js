@@ -43,4 +43,23 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // 3. Enrollment form: reload with the chosen program and school year,
+    // so the page lists the sections of that term
+    const enrollmentForm = document.querySelector('form[data-section-choices]');
+    if (enrollmentForm) {
+        enrollmentForm.addEventListener('change', function(event) {
+            if (event.target.name !== 'program' && event.target.name !== 'school_year') {
+                return;
+            }
+            const params = new URLSearchParams();
+            ['program', 'school_year', 'year_level'].forEach(function(name) {
+                const field = enrollmentForm.elements[name];
+                if (field && field.value) {
+                    params.set(name, field.value);
+                }
+            });
+            window.location.search = params.toString();
+        });
+    }
+
 });
\ No newline at end of file
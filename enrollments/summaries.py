@@ -0,0 +1,224 @@
+"""
+Materialized enrollment counts per (program, school_year, status, year_level).
+
+The rows in EnrollmentSummary are adjusted incrementally by the Enrollment
+signals in signals.py, so pages that only need totals never have to
+aggregate the live Enrollment table. `rebuild()` recomputes them from
+scratch (see the rebuild_enrollment_summaries command).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Enrollment, EnrollmentSummary, Program, ArchivedEnrollment
+
+
+def summary_key(program_id, school_year_id, status, year_level):
+    return (program_id, school_year_id, status, year_level)
+
+
+# Enrollment columns, in measure() argument order
+MEASURE_FIELDS = ('program_id', 'school_year_id', 'status', 'year_level',
+                  'total_fee', 'created_at', 'reviewed_at')
+
+
+def measure(program_id, school_year_id, status, year_level, total_fee, created_at, reviewed_at):
+    """What one enrollment contributes to its summary row: (key, fee, review_seconds)."""
+    review_seconds = None
+    if created_at and reviewed_at:
+        review_seconds = int((reviewed_at - created_at).total_seconds())
+    fee = Decimal(str(total_fee)) if total_fee else Decimal('0')
+    return (summary_key(program_id, school_year_id, status, year_level), fee, review_seconds)
+
+
+def enrollment_measure(enrollment):
+    return measure(enrollment.program_id, enrollment.school_year_id, enrollment.status,
+                   enrollment.year_level, enrollment.total_fee,
+                   enrollment.created_at, enrollment.reviewed_at)
+
+
+def _key_filter(key):
+    program_id, school_year_id, status, year_level = key
+    return {
+        'program_id': program_id,
+        'school_year_id': school_year_id,
+        'status': status,
+        'year_level': year_level,
+    }
+
+
+# ============================================
+# INCREMENTAL MAINTENANCE
+# ============================================
+
+def apply_delta(key, count, fee, reviewed=0, review_seconds=0):
+    """Add `count` enrollments and `fee` pesos to the summary row for `key`."""
+    fee = fee or Decimal('0')
+    if not count and not fee and not reviewed:
+        return
+
+    rows = EnrollmentSummary.objects.filter(**_key_filter(key))
+    changes = {
+        'enrollment_count': F('enrollment_count') + count,
+        'total_fee_sum': F('total_fee_sum') + fee,
+        'reviewed_count': F('reviewed_count') + reviewed,
+        'review_seconds_sum': F('review_seconds_sum') + review_seconds,
+        'updated_at': timezone.now(),
+    }
+    if rows.update(**changes) or count <= 0:
+        # Decrements never create rows: during a cascade delete the summary
+        # row (and its program/school year) may already be gone.
+        return
+
+    # First enrollment for this key. Another writer may be racing us here,
+    # so insert an empty row, ignore the conflict, and apply the delta again.
+    EnrollmentSummary.objects.bulk_create(
+        [EnrollmentSummary(**_key_filter(key))], ignore_conflicts=True
+    )
+    rows.update(**changes)
+
+
+def record_change(old, new):
+    """
+    Move one enrollment between summary rows.
+    `old` and `new` are measure() tuples, or None for inserts/deletes.
+    """
+    if old == new:
+        return
+    if old:
+        key, fee, review_seconds = old
+        reviewed = review_seconds is not None
+        apply_delta(key, -1, -fee, -int(reviewed), -(review_seconds or 0))
+    if new:
+        key, fee, review_seconds = new
+        reviewed = review_seconds is not None
+        apply_delta(key, 1, fee, int(reviewed), review_seconds or 0)
+
+
+def record_changes(changes):
+    """record_change() for many (old, new) pairs, with one UPDATE per summary row touched."""
+    deltas = defaultdict(lambda: [0, Decimal('0'), 0, 0])
+    for old, new in changes:
+        if old == new:
+            continue
+        for measured, sign in ((old, -1), (new, 1)):
+            if measured:
+                key, fee, review_seconds = measured
+                delta = deltas[key]
+                delta[0] += sign
+                delta[1] += sign * fee
+                delta[2] += sign * int(review_seconds is not None)
+                delta[3] += sign * (review_seconds or 0)
+    # Decrements first, as record_change() does
+    for key, (count, fee, reviewed, review_seconds) in sorted(deltas.items(), key=lambda item: item[1][0]):
+        apply_delta(key, count, fee, reviewed, review_seconds)
+
+
+# ============================================
+# FULL REBUILD
+# ============================================
+
+TOTAL_FIELDS = ['enrollment_count', 'total_fee_sum', 'reviewed_count', 'review_seconds_sum', 'updated_at']
+
+REVIEW_TIME = ExpressionWrapper(F('reviewed_at') - F('created_at'), output_field=DurationField())
+
+
+def rebuild(program_ids=None):
+    """
+    Recompute summary rows from the Enrollment (and archive) tables, one program at a
+    time so writers are only ever blocked on a single program's rows.
+    Returns the number of programs rebuilt.
+    """
+    if program_ids is None:
+        program_ids = Program.objects.values_list('pk', flat=True)
+
+    rebuilt = 0
+    for program_id in list(program_ids):
+        _rebuild_program(program_id)
+        rebuilt += 1
+    return rebuilt
+
+
+def _rebuild_program(program_id):
+    with transaction.atomic():
+        # Lock the current rows first: incremental updates from concurrent
+        # enrollment writes wait for us and then apply on top of our totals.
+        existing = {
+            summary_key(row.program_id, row.school_year_id, row.status, row.year_level): row
+            for row in EnrollmentSummary.objects.select_for_update().filter(program_id=program_id)
+        }
+
+        # Archived terms still count (archiving moves rows, it doesn't delete them)
+        live = {}
+        for model in (Enrollment, ArchivedEnrollment):
+            rows = (
+                model.objects.filter(program_id=program_id)
+                .order_by()
+                .values('school_year_id', 'status', 'year_level')
+                .annotate(
+                    count=Count('pk'),
+                    fee=Coalesce(Sum('total_fee'), Decimal('0')),
+                    reviewed=Count('reviewed_at'),
+                    review_time=Sum(REVIEW_TIME),
+                )
+            )
+            for row in rows:
+                key = summary_key(program_id, row['school_year_id'], row['status'], row['year_level'])
+                totals = live.setdefault(key, {
+                    'enrollment_count': 0, 'total_fee_sum': Decimal('0'),
+                    'reviewed_count': 0, 'review_seconds_sum': 0,
+                })
+                totals['enrollment_count'] += row['count']
+                totals['total_fee_sum'] += row['fee']
+                totals['reviewed_count'] += row['reviewed']
+                totals['review_seconds_sum'] += int(row['review_time'].total_seconds()) if row['review_time'] else 0
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for key, values in live.items():
+            summary = existing.pop(key, None)
+            if summary is None:
+                to_create.append(EnrollmentSummary(**values, **_key_filter(key), updated_at=now))
+            elif any(getattr(summary, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(summary, field, value)
+                summary.updated_at = now
+                to_update.append(summary)
+
+        # Whatever is left over no longer has any live enrollments behind it
+        if existing:
+            EnrollmentSummary.objects.filter(pk__in=[s.pk for s in existing.values()]).delete()
+        EnrollmentSummary.objects.bulk_update(to_update, TOTAL_FIELDS)
+        # A first enrollment may have created one of these rows since we locked:
+        # overwrite it with the rebuilt totals rather than keep its partial ones.
+        EnrollmentSummary.objects.bulk_create(
+            to_create, update_conflicts=True,
+            unique_fields=['program', 'school_year', 'status', 'year_level'],
+            update_fields=TOTAL_FIELDS,
+        )
+
+
+# ============================================
+# READ HELPERS
+# ============================================
+
+def enrollment_count(**filters):
+    """Total enrollments matching `filters` (any EnrollmentSummary field lookups)."""
+    return EnrollmentSummary.objects.filter(**filters).aggregate(
+        total=Coalesce(Sum('enrollment_count'), 0)
+    )['total']
+
+
+def status_counts(**filters):
+    """{status: count} over the summary rows matching `filters`."""
+    rows = (
+        EnrollmentSummary.objects.filter(**filters)
+        .order_by()
+        .values('status')
+        .annotate(total=Sum('enrollment_count'))
+    )
+    return {row['status']: row['total'] for row in rows}
@@ -0,0 +1,58 @@
+"""
+Fast path for per-row markup in listings.
+
+{% row_url 'enrollment_approve' enrollment.pk %} is a drop-in for
+{% url %} with a single integer argument. The pattern is reversed once per
+render with a placeholder pk; every row after that is a string splice, not a
+walk of the URL resolver.
+
+{% enrollment_card enrollment %} / {% program_card program %} render the
+atomic molecules from the compiled template fetched once per render,
+instead of an {% include %} per loop iteration.
+"""
+from django import template
+from django.urls import reverse
+
+register = template.Library()
+
+# Never a real pk; only used to find where the pk goes in the reversed URL
+PK_PLACEHOLDER = 9876543210123
+
+
+def _render_cache(context):
+    # The RenderContext is shared by the whole top-level render, includes
+    # and all, and thrown away with it, so nothing outlives the request's
+    # script prefix or urlconf
+    render_context = context.render_context
+    cache = getattr(render_context, '_row_cache', None)
+    if cache is None:
+        cache = render_context._row_cache = {}
+    return cache
+
+
+@register.simple_tag(takes_context=True)
+def row_url(context, view_name, pk):
+    cache = _render_cache(context)
+    parts = cache.get(('url', view_name))
+    if parts is None:
+        parts = cache[('url', view_name)] = reverse(view_name, args=[PK_PLACEHOLDER]).split(str(PK_PLACEHOLDER), 1)
+    return f'{parts[0]}{int(pk)}{parts[1]}'
+
+
+def _render_card(context, template_name, **values):
+    cache = _render_cache(context)
+    card = cache.get(('template', template_name))
+    if card is None:
+        card = cache[('template', template_name)] = context.template.engine.get_template(template_name)
+    with context.push(**values):
+        return card.render(context)
+
+
+@register.simple_tag(takes_context=True)
+def enrollment_card(context, enrollment):
+    return _render_card(context, 'atomic/molecules/enrollment_card.html', enrollment=enrollment)
+
+
+@register.simple_tag(takes_context=True)
+def program_card(context, program):
+    return _render_card(context, 'atomic/molecules/program_card.html', program=program)
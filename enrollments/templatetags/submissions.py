@@ -0,0 +1,17 @@
+"""
+{% idempotency_field %} puts a form's idempotency token in a hidden input,
+next to {% csrf_token %}. Views decorated with @idempotent (idempotency.py)
+then handle each submission of the form once.
+"""
+from django import template
+from django.utils.html import format_html
+
+from enrollments import idempotency
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def idempotency_field(context):
+    token = idempotency.token_for_form(context['request'])
+    return format_html('<input type="hidden" name="{}" value="{}">', idempotency.FIELD_NAME, token)
@@ -1,3 +1,1569 @@
-from django.test import TestCase
+import json
+import smtplib
+import sqlite3
+import tempfile
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail as sent_mail
+from django.core import serializers
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.paginator import EmptyPage
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import get_script_prefix, reverse, set_script_prefix
+from django.utils import timezone
+
+from . import (
+    analytics, archive, changefeed, coldstart, dashboards, dumps, fees, idempotency, inbox, jobs, mail, reference,
+    replicas, rollover, search, snapshots, summaries, tracing, transitions, versioning,
+)
+from .db import pool, sqlite_profile
+from .forms import EnrollmentForm
+from .management.commands import stress_enrollments
+from .pagination import ApproximateCountPaginator
+from .models import (
+    ArchivedEnrollment, ArchivedNotification, ChangeLogEntry, Enrollment, EnrollmentSummary, FeeInstallment, FeeRule,
+    Job, Meeting, Notification, NotificationReadState, OutboundEmail, Program, SchoolYear, Section, Student,
+    StudentSearchWord,
+)
+
+
+@jobs.task
+def succeed(job, value=None):
+    return {'value': value}
+
+
+@jobs.task
+def explode(job):
+    raise RuntimeError('boom')
+
+
+class EnrollmentTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        today = timezone.localdate()
+        cls.staff = User.objects.create_user('registrar', password='pw', is_staff=True)
+        cls.program = Program.objects.create(
+            code='BSCS', name='Computer Science', program_type='undergraduate', description='-',
+            duration_years=4, tuition_fee=Decimal('20000.00'),
+        )
+        cls.school_year = SchoolYear.objects.create(
+            year_start=2030, year_end=2031, semester='1st',
+            enrollment_start=today, enrollment_end=today + timedelta(days=30),
+        )
+        cls.student = cls.make_student('ana')
+
+    @classmethod
+    def make_student(cls, username, first_name=None, last_name='Cruz'):
+        user = User.objects.create_user(username, password='pw')
+        return Student.objects.create(
+            user=user, student_id=f'S-{username}', first_name=first_name or username.title(), last_name=last_name,
+            date_of_birth=date(2005, 1, 1), gender='F', contact_number='-', email=f'{username}@example.edu',
+            address='-', guardian_name='-', guardian_contact='-',
+        )
+
+    def setUp(self):
+        # The registry's copies outlive each test's transaction
+        reference._loaded.clear()
+        reference._stamp = None
+
+    def enroll(self, student=None, school_year=None):
+        return Enrollment.objects.create(
+            student=student or self.student, program=self.program,
+            school_year=school_year or self.school_year, year_level='1',
+        )
+
+
+# ============================================
+# JOBS
+# ============================================
+
+class JobQueueTests(TestCase):
+    def expire(self, job):
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_keyed_enqueue_returns_the_queued_job(self):
+        later = jobs.enqueue(succeed, key='k', delay=60)
+        sooner = jobs.enqueue(succeed, key='k')
+        self.assertEqual(sooner.pk, later.pk)
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertLessEqual(Job.objects.get().run_at, timezone.now())
+
+    def test_claim_takes_ready_jobs_by_priority(self):
+        low = jobs.enqueue(succeed, priority=0)
+        high = jobs.enqueue(succeed, priority=5)
+        jobs.enqueue(succeed, delay=60)
+        claimed = jobs.claim(limit=5)
+        self.assertEqual([job.pk for job in claimed], [high.pk, low.pk])
+        self.assertTrue(all(job.status == jobs.RUNNING and job.attempts == 1 for job in claimed))
+        self.assertEqual(jobs.claim(limit=5), [])
+
+    def test_expired_claim_is_requeued(self):
+        job = jobs.enqueue(succeed)
+        jobs.claim()
+        self.expire(job)
+        with self.assertLogs('enrollments.jobs', 'WARNING'):
+            self.assertEqual(jobs.requeue_expired(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.claim_token), (jobs.QUEUED, ''))
+
+    def test_expired_claim_without_attempts_left_fails(self):
+        job = jobs.enqueue(succeed, max_attempts=1)
+        jobs.claim()
+        self.expire(job)
+        with self.assertLogs('enrollments.jobs', 'WARNING'):
+            jobs.requeue_expired()
+        job.refresh_from_db()
+        self.assertEqual(job.status, jobs.FAILED)
+
+    def test_expired_keyed_claim_folds_into_its_queued_twin(self):
+        running = jobs.enqueue(succeed, key='k')
+        jobs.claim()
+        twin = jobs.enqueue(succeed, key='k', delay=60)
+        self.assertNotEqual(twin.pk, running.pk)
+        self.expire(running)
+
+        with self.assertLogs('enrollments.jobs', 'WARNING'):
+            self.assertEqual(jobs.requeue_expired(), 1)
+        running.refresh_from_db()
+        twin.refresh_from_db()
+        self.assertEqual(running.status, jobs.DONE)
+        self.assertEqual(running.result, {'merged_into': twin.pk})
+        self.assertEqual(twin.status, jobs.QUEUED)
+        self.assertLessEqual(twin.run_at, timezone.now())
+
+    def test_run_records_the_result(self):
+        jobs.enqueue(succeed, {'value': 3})
+        job, = jobs.claim()
+        self.assertTrue(jobs.run(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (jobs.DONE, {'value': 3}))
+
+    def test_failing_job_is_retried_then_failed(self):
+        job = jobs.enqueue(explode, max_attempts=2)
+        claimed, = jobs.claim()
+        with self.assertLogs('enrollments.jobs', 'ERROR'):
+            self.assertFalse(jobs.run(claimed))
+        job.refresh_from_db()
+        self.assertEqual(job.status, jobs.QUEUED)
+        self.assertIn('boom', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        claimed, = jobs.claim()
+        with self.assertLogs('enrollments.jobs', 'ERROR'):
+            self.assertFalse(jobs.run(claimed))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (jobs.FAILED, 2))
+
+    def test_failing_keyed_job_folds_its_retry_into_a_queued_twin(self):
+        jobs.enqueue(explode, key='k')
+        claimed, = jobs.claim()
+        twin = jobs.enqueue(explode, key='k', delay=3600)
+        with self.assertLogs('enrollments.jobs', 'ERROR'):
+            jobs.run(claimed)
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.status, jobs.DONE)
+        self.assertEqual(Job.objects.filter(key='k', status=jobs.QUEUED).get().pk, twin.pk)
+
+    def test_release_gives_the_attempt_back(self):
+        job = jobs.enqueue(succeed, key='k')
+        claimed, = jobs.claim()
+        jobs.release(claimed)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (jobs.QUEUED, 0))
+
+
+# ============================================
+# E-MAIL DELIVERY
+# ============================================
+
+class DeliveryTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enrollment = self.enroll()
+        transitions.transition(self.enrollment, 'approve', by=self.staff)
+        self.email = OutboundEmail.objects.get(enrollment=self.enrollment)
+
+    def deliver(self):
+        job = Job.objects.get(key=mail.DELIVERY_JOB_KEY, status=jobs.QUEUED)
+        job.stopping = lambda: False
+        return mail.deliver(job)
+
+    def test_decision_queues_one_email_and_one_delivery_run(self):
+        transitions.transition(self.enroll(student=self.make_student('ben')), 'reject', by=self.staff)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+        self.assertEqual(Job.objects.filter(key=mail.DELIVERY_JOB_KEY, status=jobs.QUEUED).count(), 1)
+
+    def test_delivery_sends_due_emails(self):
+        self.assertEqual(self.deliver(), {'sent': 1, 'retrying': 0, 'failed': 0})
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, mail.SENT)
+        self.assertEqual([message.to for message in sent_mail.outbox], [[self.student.email]])
+
+    def test_dropped_connection_is_retried_later(self):
+        with mock.patch('enrollments.mail.EmailMessage.send', side_effect=smtplib.SMTPServerDisconnected('gone')):
+            self.assertEqual(self.deliver(), {'sent': 0, 'retrying': 1, 'failed': 0})
+        self.email.refresh_from_db()
+        self.assertEqual((self.email.status, self.email.attempts), (mail.PENDING, 1))
+        self.assertGreater(self.email.next_attempt_at, timezone.now())
+        # The retry gets a delivery run of its own
+        self.assertTrue(Job.objects.filter(key=mail.DELIVERY_JOB_KEY, status=jobs.QUEUED).exists())
+
+    def test_refused_recipient_fails_for_good(self):
+        refused = smtplib.SMTPRecipientsRefused({self.student.email: (550, b'No such user')})
+        with mock.patch('enrollments.mail.EmailMessage.send', side_effect=refused):
+            self.assertEqual(self.deliver(), {'sent': 0, 'retrying': 0, 'failed': 1})
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, mail.FAILED)
+
+    def test_last_attempt_fails(self):
+        OutboundEmail.objects.filter(pk=self.email.pk).update(attempts=4)
+        with self.settings(EMAIL_MAX_ATTEMPTS=5), \
+                mock.patch('enrollments.mail.EmailMessage.send', side_effect=smtplib.SMTPServerDisconnected('gone')):
+            self.assertEqual(self.deliver(), {'sent': 0, 'retrying': 0, 'failed': 1})
+
+    def test_render_error_is_retried_later(self):
+        with mock.patch.object(mail, 'render', side_effect=ValueError('bad template')):
+            self.assertEqual(self.deliver(), {'sent': 0, 'retrying': 1, 'failed': 0})
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, mail.PENDING)
+        self.assertIn('bad template', self.email.last_error)
+
+    def test_sent_rows_are_recorded_when_the_batch_breaks(self):
+        transitions.transition(self.enroll(student=self.make_student('ben')), 'approve', by=self.staff)
+        sends = [None, KeyboardInterrupt()]
+        with mock.patch('enrollments.mail.EmailMessage.send', side_effect=sends), \
+                self.assertRaises(KeyboardInterrupt):
+            self.deliver()
+        statuses = dict(OutboundEmail.objects.values_list('status').annotate(n=Count('pk')))
+        self.assertEqual(statuses, {mail.SENT: 1, mail.SENDING: 1})
+
+    def test_stuck_rows_fail_after_the_last_attempt(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        OutboundEmail.objects.filter(pk=self.email.pk).update(status=mail.SENDING, locked_until=expired, attempts=5)
+        with self.settings(EMAIL_MAX_ATTEMPTS=5):
+            self.assertEqual(self.deliver(), {'sent': 0, 'retrying': 0, 'failed': 0})
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, mail.FAILED)
+        self.assertEqual(sent_mail.outbox, [])
+
+
+# ============================================
+# ARCHIVING
+# ============================================
+
+class ArchiveTests(EnrollmentTestCase):
+    def close_term(self):
+        SchoolYear.objects.filter(pk=self.school_year.pk).update(is_active=False)
+        self.school_year.refresh_from_db()
+
+    def test_reviewed_term_with_sections_and_emails(self):
+        enrollment = self.enroll()
+        section = Section.objects.create(program=self.program, school_year=self.school_year, code='BSCS-1A')
+        enrollment.sections.add(section)
+        transitions.transition(enrollment, 'approve', by=self.staff)
+        email = OutboundEmail.objects.get(enrollment=enrollment)
+        self.close_term()
+
+        self.assertEqual(archive.archive_school_year(self.school_year), 1)
+
+        self.assertFalse(Enrollment.objects.filter(pk=enrollment.pk).exists())
+        self.assertFalse(Notification.objects.filter(enrollment_id=enrollment.pk).exists())
+        archived = ArchivedEnrollment.objects.get(pk=enrollment.pk)
+        self.assertEqual((archived.status, archived.version), ('approved', enrollment.version))
+        self.assertEqual(list(archived.sections.all()), [section])
+        self.assertTrue(ArchivedNotification.objects.filter(enrollment_id=enrollment.pk).exists())
+        # The e-mail is kept, detached from the archived enrollment
+        email.refresh_from_db()
+        self.assertIsNone(email.enrollment_id)
+
+    def test_active_term_is_not_archived(self):
+        with self.assertRaises(archive.ArchiveError):
+            archive.archive_school_year(self.school_year)
+
+    def test_archived_enrollments_are_still_found(self):
+        enrollment = self.enroll()
+        self.close_term()
+        archive.archive_school_year(self.school_year)
+        self.school_year.refresh_from_db()
+
+        self.assertTrue(archive.is_archived(self.school_year))
+        self.assertEqual(archive.enrollments_for_school_year(self.school_year).model, ArchivedEnrollment)
+        self.assertEqual(archive.find_enrollment(enrollment.enrollment_id).pk, enrollment.pk)
+        self.assertEqual([e.pk for e in archive.student_enrollment_history(self.student)], [enrollment.pk])
+        # Moved rows still count in the summaries
+        self.assertEqual(summaries.enrollment_count(school_year=self.school_year), 1)
+
+    def test_rerun_after_a_partial_copy(self):
+        enrollments = [self.enroll(student=self.make_student(f'student{i}')) for i in range(3)]
+        self.close_term()
+        # A crashed run copied the first row but never removed it from the hot table
+        first = Enrollment.objects.filter(pk=enrollments[0].pk).values(*archive.ENROLLMENT_COLUMNS).get()
+        ArchivedEnrollment.objects.create(archived_at=timezone.now(), **first)
+
+        self.assertEqual(archive.archive_school_year(self.school_year, batch_size=2), 3)
+        self.assertFalse(Enrollment.objects.filter(school_year=self.school_year).exists())
+        self.assertEqual(ArchivedEnrollment.objects.filter(school_year=self.school_year).count(), 3)
+
+
+# ============================================
+# TRANSITIONS
+# ============================================
+
+class TransitionTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enrollment = self.enroll()
+
+    def test_stale_version_conflicts(self):
+        with self.assertRaises(transitions.TransitionConflict):
+            transitions.transition(self.enrollment, 'approve', expected_version=self.enrollment.version + 1)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, 'pending')
+
+    def test_second_review_of_a_stale_copy_conflicts(self):
+        stale = Enrollment.objects.get(pk=self.enrollment.pk)
+        transitions.transition(self.enrollment, 'approve', by=self.staff)
+        with self.assertRaises(transitions.TransitionConflict):
+            transitions.transition(stale, 'reject', by=self.staff)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, 'approved')
+        self.assertEqual(OutboundEmail.objects.filter(enrollment=self.enrollment).count(), 1)
+
+    def test_transition_from_the_wrong_status_is_refused(self):
+        transitions.transition(self.enrollment, 'reject', by=self.staff)
+        with self.assertRaises(transitions.TransitionError):
+            transitions.transition(self.enrollment, 'reject', by=self.staff)
+
+    def test_review_view_answers_a_conflict_with_409(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            reverse('enrollment_approve', args=[self.enrollment.pk]), {'version': self.enrollment.version + 1},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([m.level_tag for m in get_messages(response.wsgi_request)], ['warning'])
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, 'pending')
+
+    def test_review_view_approves_the_version_it_showed(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            reverse('enrollment_approve', args=[self.enrollment.pk]), {'version': self.enrollment.version},
+        )
+        self.assertRedirects(response, reverse('enrollment_list'), fetch_redirect_response=False)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.status, 'approved')
+
+    def test_queryset_transition_in_batches(self):
+        others = [self.enroll(student=self.make_student(f'student{i}')) for i in range(3)]
+        transitions.transition(others[0], 'reject', by=self.staff)
+
+        changed = transitions.transition_queryset(Enrollment.objects.all(), 'approve', by=self.staff, batch_size=2)
+        self.assertEqual(changed, 3)
+        self.assertEqual(
+            dict(Enrollment.objects.values_list('status').annotate(n=Count('pk'))), {'approved': 3, 'rejected': 1},
+        )
+        self.assertEqual(summaries.status_counts(program=self.program), {'pending': 0, 'approved': 3, 'rejected': 1})
+        self.assertEqual(OutboundEmail.objects.filter(kind='enrollment_approved').count(), 3)
+        self.assertFalse(Enrollment.objects.filter(status='approved').exclude(reviewed_by=self.staff).exists())
+
+    def test_admin_action_reports_skipped_rows(self):
+        transitions.transition(self.enroll(student=self.make_student('ben')), 'reject', by=self.staff)
+        User.objects.filter(pk=self.staff.pk).update(is_superuser=True)
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('admin:enrollments_enrollment_changelist'), {
+            'action': 'approve_selected', '_selected_action': list(Enrollment.objects.values_list('pk', flat=True)),
+        }, follow=True)
+        self.assertEqual(
+            [str(m) for m in response.context['messages']], ['1 enrollment(s) now approved; 1 skipped (not pending)'],
+        )
+
+
+# ============================================
+# SEARCH
+# ============================================
+
+class TypeaheadTests(EnrollmentTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.jose = cls.make_student('jose', 'José', 'Rizal')
+        cls.josefina = cls.make_student('josefina', 'Josefina', 'Rizal')
+        cls.maria = cls.make_student('maria', 'Maria Clara', 'Santos')
+
+    def ids(self, query):
+        return [match['id'] for match in search.typeahead(query)]
+
+    def test_prefix_and_sound_alike(self):
+        self.assertEqual(self.ids('jose'), [self.jose.pk, self.josefina.pk])
+        self.assertEqual(self.ids('jusephina'), [self.josefina.pk])
+
+    def test_typo_is_corrected(self):
+        self.assertEqual(self.ids('jsoe'), [self.jose.pk, self.josefina.pk])
+        self.assertEqual(self.ids('mraia santos'), [self.maria.pk])
+        self.assertEqual(self.ids('jose riazl'), [self.jose.pk, self.josefina.pk])
+
+    def test_corrected_matches_rank_below_exact_ones(self):
+        exact, = search.typeahead('rizal jose')[:1]
+        typo, = search.typeahead('rizal jsoe')[:1]
+        self.assertEqual(exact['id'], typo['id'])
+        self.assertLess(typo['score'], exact['score'])
+
+    def test_short_or_distant_words_are_not_corrected(self):
+        self.assertEqual(self.ids('jso'), [])
+        self.assertEqual(self.ids('jxyz'), [])
+
+    def test_correction_reads_only_words_of_nearby_length(self):
+        compared = []
+        real_distance = search._edit_distance
+
+        def distance(a, b, limit):
+            compared.append(b)
+            return real_distance(a, b, limit)
+
+        with mock.patch.object(search, '_edit_distance', side_effect=distance):
+            self.assertEqual(self.ids('jsoe'), [self.jose.pk, self.josefina.pk])
+        self.assertTrue(compared)
+        self.assertTrue(all(3 <= len(word) <= 5 and word[0] == 'j' for word in compared))
+
+    def test_words_nobody_has_are_skipped_until_rebuilt(self):
+        Student.objects.filter(pk=self.maria.pk).delete()
+        self.assertTrue(StudentSearchWord.objects.filter(word='maria').exists())
+        self.assertEqual(self.ids('mraia'), [])
+
+        search.rebuild_words(batch_size=2)
+        self.assertFalse(StudentSearchWord.objects.filter(word='maria').exists())
+        self.assertEqual(StudentSearchWord.objects.filter(word__in=['jos', 'jose', 'josef', 'josefina']).count(), 4)
+
+
+# ============================================
+# REFERENCE DATA
+# ============================================
+
+class ReferenceDataTests(EnrollmentTestCase):
+    def test_reads_are_query_free_once_loaded(self):
+        self.assertEqual(list(reference.active_programs()), [self.program])
+        with self.assertNumQueries(0):
+            reference.active_programs()
+            self.assertEqual(reference.active_program(self.program.pk), self.program)
+            self.assertIsNone(reference.active_program(self.program.pk + 1))
+
+    def test_own_change_is_seen_at_once(self):
+        reference.active_programs()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.program.is_active = False
+            self.program.save()
+        self.assertEqual(reference.active_programs(), ())
+
+    def test_other_process_change_is_seen_after_the_check_interval(self):
+        reference.active_programs()
+        Program.objects.filter(pk=self.program.pk).update(is_active=False)
+        versioning.bump_version(versioning.REFERENCE_DATA)
+        self.assertEqual(list(reference.active_programs()), [self.program])
+        with override_settings(REFERENCE_DATA_CHECK_SECONDS=0):
+            self.assertEqual(reference.active_programs(), ())
+
+    def test_enrollment_form_choices_come_from_the_registry(self):
+        reference.active_programs(), reference.active_school_years()
+        form = EnrollmentForm(data={'program': self.program.pk, 'school_year': self.school_year.pk, 'year_level': '1'})
+        with self.assertNumQueries(0):
+            self.assertEqual(form['program'].field.clean(str(self.program.pk)), self.program)
+
+
+# ============================================
+# DASHBOARD SNAPSHOTS
+# ============================================
+
+class DashboardTests(EnrollmentTestCase):
+    def counts(self, user):
+        context = dashboards.dashboard_context(user)
+        return context['pending_count'], context['approved_count']
+
+    def test_snapshot_is_served_from_the_cache(self):
+        self.enroll()
+        self.counts(self.student.user)
+        with self.assertNumQueries(2):
+            # The user's data version and the cached snapshot, both cache-table reads
+            self.assertEqual(self.counts(self.student.user), (1, 0))
+
+    def test_review_invalidates_the_students_snapshot(self):
+        enrollment = self.enroll()
+        self.assertEqual(self.counts(self.student.user), (1, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            transitions.transition(enrollment, 'approve', by=self.staff)
+        self.assertEqual(self.counts(self.student.user), (0, 1))
+
+    def test_other_users_snapshots_are_kept(self):
+        other = self.make_student('ben')
+        self.counts(other.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enroll()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.counts(other.user), (0, 0))
+
+    def test_snapshot_is_built_from_the_primary_in_a_replica_view(self):
+        router = replicas.ReplicaRouter()
+        state = replicas._RouteState()
+        state.replica_reads = True
+        token = replicas._route_state.set(state)
+        try:
+            # Outside the test's transaction, which keeps every read on the primary
+            with mock.patch.object(replicas, 'connections', {'default': mock.Mock(in_atomic_block=False)}), \
+                    mock.patch.object(replicas, 'healthy_replicas', return_value=['replica']):
+                self.assertEqual(router.db_for_read(Enrollment), 'replica')
+                with mock.patch.object(dashboards, '_build_user_snapshot',
+                                       side_effect=lambda user: {'db': router.db_for_read(Enrollment)}):
+                    self.assertEqual(dashboards.dashboard_context(self.student.user)['db'], 'default')
+        finally:
+            replicas._route_state.reset(token)
+
+
+# ============================================
+# ANALYTICS
+# ============================================
+
+class AnalyticsTests(EnrollmentTestCase):
+    def test_report_totals_come_from_the_summaries(self):
+        approved = self.enroll()
+        self.enroll(student=self.make_student('ben'))
+        transitions.transition(approved, 'approve', by=self.staff)
+        totals = analytics.build_report()['totals']
+        self.assertEqual((totals['enrollments'], totals['paying_enrollments']), (2, 1))
+        self.assertEqual(totals['revenue'], approved.total_fee)
+
+    def test_cached_report_follows_the_enrollment_data_version(self):
+        self.enroll()
+        self.assertEqual(analytics.get_report()['totals']['enrollments'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.enroll(student=self.make_student('ben'))
+        self.assertEqual(analytics.get_report()['totals']['enrollments'], 2)
+
+    def test_evicted_version_is_not_reused(self):
+        old = versioning.get_version(versioning.ENROLLMENT_DATA)
+        versioning.cache.delete(versioning._cache_key(versioning.ENROLLMENT_DATA))
+        self.assertNotIn(versioning.bump_version(versioning.ENROLLMENT_DATA), (old, old + 1, 2))
+
+    def test_report_is_built_from_the_primary(self):
+        with mock.patch.object(analytics, 'build_report', side_effect=lambda **kwargs: {
+            'pinned': replicas._route_state.get().pinned,
+        }):
+            self.assertEqual(analytics.get_report(), {'pinned': True})
+
+
+# ============================================
+# REPLICA ROUTING
+# ============================================
+
+@override_settings(REPLICA_READ_MODELS=())
+class ReplicaRoutingTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.router = replicas.ReplicaRouter()
+        patches = [
+            # TestCase wraps every test in a transaction, which keeps reads on the primary
+            mock.patch.object(replicas, 'connections', {'default': mock.Mock(in_atomic_block=False)}),
+            mock.patch.object(replicas, 'healthy_replicas', return_value=['replica']),
+            mock.patch.object(replicas, 'replica_aliases', return_value=['replica']),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def route(self, state):
+        token = replicas._route_state.set(state)
+        self.addCleanup(replicas._route_state.reset, token)
+        return state
+
+    def test_replica_views_read_from_a_replica(self):
+        state = self.route(replicas._RouteState())
+        self.assertEqual(self.router.db_for_read(Enrollment), 'default')
+        state.replica_reads = True
+        self.assertEqual(self.router.db_for_read(Enrollment), 'replica')
+
+    def test_writers_and_transactions_read_from_the_primary(self):
+        state = self.route(replicas._RouteState())
+        state.replica_reads = True
+        with mock.patch.object(replicas, 'connections', {'default': mock.Mock(in_atomic_block=True)}):
+            self.assertEqual(self.router.db_for_read(Enrollment), 'default')
+        self.router.db_for_write(Enrollment)
+        self.assertEqual(self.router.db_for_read(Enrollment), 'default')
+
+    def test_cache_writes_do_not_pin(self):
+        state = self.route(replicas._RouteState())
+        self.router.db_for_write(mock.Mock(_meta=mock.Mock(app_label='django_cache')))
+        self.assertFalse(state.wrote)
+
+    def test_primary_reads_pins_the_block(self):
+        state = self.route(replicas._RouteState())
+        state.replica_reads = True
+        with replicas.primary_reads():
+            self.assertEqual(self.router.db_for_read(Enrollment), 'default')
+        self.assertEqual(self.router.db_for_read(Enrollment), 'replica')
+
+    @override_settings(REPLICA_STICKY_SECONDS=10, REPLICA_MAX_LAG_SECONDS=30, REPLICA_HEALTH_CHECK_INTERVAL=10)
+    def test_pin_outlasts_the_replica_lag_allowance(self):
+        def view(request):
+            self.router.db_for_write(Enrollment)
+            return HttpResponse()
+
+        response = replicas.ReplicaMiddleware(view)(RequestFactory().post('/'))
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['max-age'], 40)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[replicas.PIN_COOKIE] = response.cookies[replicas.PIN_COOKIE].value
+        seen = []
+
+        def read_view(request):
+            seen.append(replicas._route_state.get().pinned)
+            return HttpResponse()
+
+        replicas.ReplicaMiddleware(read_view)(request)
+        self.assertEqual(seen, [True])
+
+
+# ============================================
+# ENROLLMENT SUMMARIES
+# ============================================
+
+class SummaryTests(EnrollmentTestCase):
+    def summary(self, status):
+        return EnrollmentSummary.objects.get(program=self.program, school_year=self.school_year, status=status)
+
+    def test_writes_move_enrollments_between_rows(self):
+        enrollment = self.enroll()
+        self.enroll(student=self.make_student('ben'))
+        self.assertEqual(self.summary('pending').enrollment_count, 2)
+
+        transitions.transition(enrollment, 'approve', by=self.staff)
+        self.assertEqual(self.summary('pending').enrollment_count, 1)
+        approved = self.summary('approved')
+        self.assertEqual((approved.enrollment_count, approved.total_fee_sum), (1, enrollment.total_fee))
+        self.assertEqual(approved.reviewed_count, 1)
+
+        enrollment.delete()
+        self.assertEqual(self.summary('approved').enrollment_count, 0)
+        self.assertEqual(summaries.enrollment_count(program=self.program), 1)
+
+    def test_rebuild_corrects_drift(self):
+        self.enroll()
+        EnrollmentSummary.objects.update(enrollment_count=7, total_fee_sum=0)
+        EnrollmentSummary.objects.create(program=self.program, school_year=self.school_year,
+                                         status='rejected', year_level='1', enrollment_count=3)
+
+        self.assertEqual(summaries.rebuild(), 1)
+        self.assertEqual(summaries.status_counts(program=self.program), {'pending': 1})
+        self.assertEqual(self.summary('pending').total_fee_sum, Enrollment.objects.get().total_fee)
+
+    def test_rebuild_overwrites_rows_created_after_its_lock(self):
+        self.enroll()
+        self.enroll(student=self.make_student('ben'))
+        EnrollmentSummary.objects.update(enrollment_count=1)
+        # As if a concurrent first enrollment inserted the row once the existing ones were locked
+        with mock.patch.object(EnrollmentSummary.objects, 'select_for_update',
+                               return_value=EnrollmentSummary.objects.none()):
+            summaries.rebuild([self.program.pk])
+        self.assertEqual(self.summary('pending').enrollment_count, 2)
+
+
+# ============================================
+# CHANGE FEED
+# ============================================
+
+class ChangeFeedTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = ChangeLogEntry.objects.aggregate(start=Coalesce(Max('id'), 0))['start']
+        for i in range(2):
+            self.enroll(student=self.make_student(f'student{i}'))
+        self.seqs = list(ChangeLogEntry.objects.filter(id__gt=self.start).values_list('id', flat=True))
+
+    def fetch(self, **kwargs):
+        return [entry.id for entry in changefeed.fetch(after=kwargs.pop('after', self.start), **kwargs)]
+
+    def feed(self, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('change_feed'), {'after': self.start, **params})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        return lines[:-1], lines[-1]
+
+    def test_cursor_resumes_after_the_last_entry(self):
+        self.assertEqual(self.fetch(limit=1), self.seqs[:1])
+        self.assertEqual(self.fetch(after=self.seqs[0]), self.seqs[1:])
+        self.assertEqual(self.fetch(after=self.seqs[-1]), [])
+
+    def test_model_filter(self):
+        entries = changefeed.fetch(after=self.start, models=['enrollments.Enrollment'])
+        self.assertEqual({entry.model for entry in entries}, {'enrollments.enrollment'})
+
+    def test_stops_at_a_number_that_may_still_commit(self):
+        # As if the transaction holding the second entry hadn't committed yet
+        missing = self.seqs[1]
+        ChangeLogEntry.objects.filter(id=missing).delete()
+        self.assertEqual(self.fetch(), self.seqs[:1])
+
+        # Once the entries after it are older than the settle window, it was rolled back
+        ChangeLogEntry.objects.filter(id__gt=missing).update(changed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.fetch(), self.seqs[:1] + self.seqs[2:])
+
+    def test_has_more_uses_the_clamped_limit(self):
+        entries, trailer = self.feed(limit=0)
+        self.assertEqual(trailer, {'cursor': self.seqs[0], 'count': 1, 'has_more': True})
+
+        entries, trailer = self.feed(after=self.seqs[-1], limit=0)
+        self.assertEqual(trailer, {'cursor': self.seqs[-1], 'count': 0, 'has_more': False})
+        entries, trailer = self.feed(limit=len(self.seqs) + 1)
+        self.assertEqual((len(entries), trailer['has_more']), (len(self.seqs), False))
+
+
+# ============================================
+# ENROLLMENT FORM / SCHEDULES
+# ============================================
+
+class EnrollmentFormTests(EnrollmentTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_program = Program.objects.create(
+            code='BSIT', name='Information Technology', program_type='undergraduate', description='-',
+            duration_years=4, tuition_fee=Decimal('18000.00'),
+        )
+        cls.morning = cls.make_section(cls.program, 'BSCS-1A', time(8), time(9, 30))
+        cls.late_morning = cls.make_section(cls.program, 'BSCS-1B', time(9), time(10, 30))
+        cls.afternoon = cls.make_section(cls.program, 'BSCS-1C', time(13), time(14, 30))
+        cls.other = cls.make_section(cls.other_program, 'BSIT-1A', time(8), time(9, 30))
+
+    @classmethod
+    def make_section(cls, program, code, start, end):
+        section = Section.objects.create(program=program, school_year=cls.school_year, code=code, year_level='1')
+        Meeting.objects.create(section=section, day=0, start_time=start, end_time=end)
+        return section
+
+    def form(self, *sections, program=None):
+        return EnrollmentForm(data={
+            'program': (program or self.program).pk, 'school_year': self.school_year.pk, 'year_level': '1',
+            'sections': [section.pk for section in sections],
+        }, student=self.student)
+
+    def test_sections_wait_for_a_term(self):
+        form = EnrollmentForm(student=self.student)
+        self.assertEqual(list(form.fields['sections'].queryset), [])
+        self.assertIn('Choose a program', form.fields['sections'].help_text)
+
+    def test_sections_of_the_chosen_term_only(self):
+        term = {'program': self.program.pk, 'school_year': self.school_year.pk}
+        form = EnrollmentForm(student=self.student, initial=term)
+        self.assertEqual(list(form.fields['sections'].queryset), [self.morning, self.late_morning, self.afternoon])
+
+        # The page reloads with the picked term
+        self.client.force_login(self.student.user)
+        response = self.client.get(reverse('enrollment_create'), {**term, 'program': self.other_program.pk})
+        self.assertEqual(list(response.context['form'].fields['sections'].queryset), [self.other])
+
+    def test_section_of_another_program_is_rejected(self):
+        form = self.form(self.other)
+        self.assertFalse(form.is_valid())
+        self.assertIn('sections', form.errors)
+
+    def test_overlapping_sections_conflict(self):
+        self.assertTrue(self.form(self.morning, self.afternoon).is_valid())
+        form = self.form(self.morning, self.late_morning)
+        self.assertFalse(form.is_valid())
+        self.assertIn('Schedule conflict', form.errors['sections'][0])
+
+    def test_conflict_with_another_enrollment_of_the_student(self):
+        enrollment = Enrollment.objects.create(
+            student=self.student, program=self.other_program, school_year=self.school_year, year_level='1',
+        )
+        enrollment.sections.add(self.other)
+        self.assertFalse(self.form(self.morning).is_valid())
+        self.assertTrue(self.form(self.afternoon).is_valid())
+
+
+# ============================================
+# IDEMPOTENT SUBMISSIONS
+# ============================================
+
+class IdempotencyTests(EnrollmentTestCase):
+    TOKEN = 'a' * 32
+    CSRF_SECRET = 'b' * 32
+
+    def submit_enrollment(self, **data):
+        return self.client.post(reverse('enrollment_create'), {
+            'program': self.program.pk, 'school_year': self.school_year.pk, 'year_level': '1',
+            idempotency.FIELD_NAME: self.TOKEN, **data,
+        })
+
+    def register(self):
+        # A browser that never got the first response's cookies: only the old CSRF one
+        client = self.client_class()
+        client.cookies['csrftoken'] = self.CSRF_SECRET
+        return client, client.post(reverse('register'), {
+            'username': 'newbie', 'email': 'newbie@example.edu',
+            'password1': 'S3cure-pass!', 'password2': 'S3cure-pass!',
+            'first_name': 'New', 'last_name': 'Bie', 'date_of_birth': '2005-01-01', 'gender': 'F',
+            'contact_number': '-', 'address': '-', 'guardian_name': '-', 'guardian_contact': '-',
+            idempotency.FIELD_NAME: self.TOKEN,
+        })
+
+    def test_repeated_submission_replays_the_redirect(self):
+        self.client.force_login(self.student.user)
+        first = self.submit_enrollment()
+        second = self.submit_enrollment()
+        self.assertEqual(Enrollment.objects.filter(student=self.student).count(), 1)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(second[idempotency.REPLAY_HEADER], 'true')
+        self.assertNotIn(idempotency.REPLAY_HEADER, first)
+
+    def test_token_of_a_rejected_form_can_be_sent_again(self):
+        self.client.force_login(self.student.user)
+        self.assertEqual(self.submit_enrollment(year_level='9').status_code, 200)
+        response = self.submit_enrollment()
+        self.assertNotIn(idempotency.REPLAY_HEADER, response)
+        self.assertTrue(Enrollment.objects.filter(student=self.student).exists())
+
+    def test_replayed_registration_logs_in_only_shortly_after(self):
+        client, first = self.register()
+        self.assertEqual(User.objects.filter(username='newbie').count(), 1)
+        client, replay = self.register()
+        self.assertEqual(replay[idempotency.REPLAY_HEADER], 'true')
+        self.assertEqual(client.session.get('_auth_user_id'), str(User.objects.get(username='newbie').pk))
+
+        later = idempotency.time.time() + idempotency.login_replay_seconds() + 1
+        with mock.patch('enrollments.idempotency.time.time', return_value=later):
+            client, replay = self.register()
+        self.assertEqual(replay[idempotency.REPLAY_HEADER], 'true')
+        self.assertNotIn('_auth_user_id', client.session)
+
+
+# ============================================
+# TERM SNAPSHOTS
+# ============================================
+
+class SnapshotTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        SchoolYear.objects.filter(pk=self.school_year.pk).update(is_active=False)
+        self.school_year.refresh_from_db()
+
+    def write(self, students):
+        Enrollment.objects.all().delete()
+        enrollments = [self.enroll(student=student) for student in students]
+        transitions.transition(enrollments[0], 'approve', by=self.staff)
+        path, rows = snapshots.write_snapshot(self.school_year, f'{self.directory.name}/{len(students)}.ensnap')
+        self.assertEqual(rows, len(students))
+        return path, [Enrollment.objects.get(pk=enrollment.pk) for enrollment in enrollments]
+
+    def test_columns_read_back(self):
+        students = [self.student] + [self.make_student(f'student{i}') for i in range(2)]
+        path, enrollments = self.write(students)
+        with snapshots.Snapshot(path) as snapshot:
+            self.assertEqual(snapshot.values('enrollment_id'), [e.enrollment_id for e in enrollments])
+            self.assertEqual(snapshot.values('student_id'), [s.student_id for s in students])
+            self.assertEqual(snapshot.values('status'), ['approved', 'pending', 'pending'])
+            self.assertEqual(snapshot.values('reviewed_at')[1:], [None, None])
+
+            mask = snapshot.mask(student_id=students[1].student_id)
+            self.assertEqual(snapshot.values('enrollment_id', mask), [enrollments[1].enrollment_id])
+            groups = snapshot.group_by(['status'], sums=['total_fee_cents'])
+            self.assertEqual(groups[('approved',)], {'count': 1, 'total_fee_cents': int(enrollments[0].total_fee * 100)})
+            with self.assertRaises(snapshots.SnapshotError):
+                snapshot.group_by(['status'], sums=['student_id'])
+
+    def test_header_does_not_grow_with_unique_columns(self):
+        students = [self.student] + [self.make_student(f'student{i}') for i in range(20)]
+        path, enrollments = self.write(students)
+        with snapshots.Snapshot(path) as snapshot:
+            header = json.dumps(snapshot.header)
+        for enrollment, student in zip(enrollments, students):
+            self.assertNotIn(enrollment.enrollment_id, header)
+            self.assertNotIn(student.student_id, header)
+
+    def test_group_by_terms_adds_up(self):
+        first, _ = self.write([self.student])
+        second, _ = self.write([self.make_student('ben'), self.make_student('cy')])
+        groups = snapshots.group_by_terms([first, second], ['program_code'])
+        self.assertEqual(groups, {('BSCS',): {'count': 3}})
+
+
+# ============================================
+# PAGINATION
+# ============================================
+
+@override_settings(APPROXIMATE_COUNT_THRESHOLD=2)
+class PaginationTests(EnrollmentTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for code in ('BSIT', 'BSN', 'BSA', 'BSBA', 'BSED', 'BSEE', 'BSME'):
+            Program.objects.create(code=code, name=code, program_type='undergraduate', description='-',
+                                   duration_years=4, tuition_fee=Decimal('1000.00'))
+
+    def paginator(self, estimate=None):
+        queryset = Program.objects.order_by('code')
+        if estimate is not None:
+            cache.set(ApproximateCountPaginator._cache_key(queryset.order_by()), estimate)
+        return ApproximateCountPaginator(queryset, 3)
+
+    def test_large_count_is_cached_and_approximate(self):
+        first = self.paginator()
+        self.assertEqual((first.count, first.is_approximate), (8, False))
+        second = self.paginator()
+        self.assertEqual((second.count, second.is_approximate), (8, True))
+
+    def test_full_pages_go_past_a_low_estimate(self):
+        paginator = self.paginator(estimate=3)
+        self.assertEqual(paginator.num_pages, 1)
+        page = paginator.page(1)
+        self.assertTrue(page.has_next())
+        self.assertEqual(page.next_page_number(), 2)
+        self.assertTrue(paginator.page(2).has_next())
+        last = paginator.page(3)
+        self.assertEqual((len(last), last.has_next()), (2, False))
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+
+    def test_last_page_is_not_cut_at_a_high_estimate(self):
+        paginator = self.paginator(estimate=30)
+        self.assertFalse(paginator.page(3).has_next())
+        # Within the estimate an empty page is still a page
+        self.assertEqual(len(paginator.page(5)), 0)
+        self.assertEqual(paginator.get_page(11).number, 10)
+        with self.assertRaises(EmptyPage):
+            paginator.page(0)
+
+    def test_exact_count_keeps_the_usual_bounds(self):
+        with self.settings(APPROXIMATE_COUNT_THRESHOLD=100):
+            paginator = self.paginator()
+            self.assertFalse(paginator.page(3).has_next())
+            with self.assertRaises(EmptyPage):
+                paginator.page(4)
+
+
+# ============================================
+# TRACING
+# ============================================
+
+class TracingTests(EnrollmentTestCase):
+    def run_request(self, user, sample_rate=0.0):
+        """(recording while the view ran, response, exported records)"""
+        recording = []
+
+        def view(request):
+            recording.append(tracing._current.get().recording)
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        request = RequestFactory().get('/', {tracing.TRACE_PARAM: '1'})
+        request.user = user
+        exported = []
+        with self.settings(TRACING_SAMPLE_RATE=sample_rate), \
+                mock.patch.object(tracing, 'exporter', return_value=mock.Mock(export=exported.append)):
+            middleware = tracing.TracingMiddleware(get_response)
+            response = middleware(request)
+        return recording[0], response, exported
+
+    def test_trace_param_is_ignored_for_students(self):
+        recording, response, exported = self.run_request(self.student.user)
+        self.assertFalse(recording)
+        self.assertEqual(exported, [])
+        self.assertNotIn('X-Trace-Id', response)
+
+    def test_staff_can_ask_for_a_trace(self):
+        recording, response, exported = self.run_request(self.staff)
+        self.assertTrue(recording)
+        self.assertEqual([record['trace_id'] for record in exported], [response['X-Trace-Id']])
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_sampled_requests_are_recorded_for_anyone(self):
+        recording, response, exported = self.run_request(self.student.user, sample_rate=1.0)
+        self.assertTrue(recording)
+        self.assertEqual(len(exported), 1)
+        self.assertNotIn('X-Trace-Id', response)
+
+
+# ============================================
+# DUMP RESTORE
+# ============================================
+
+class RestoreDumpTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def dump(self, objects, encoding='utf-16'):
+        path = f'{self.directory.name}/dump-{encoding}.json'
+        with open(path, 'w', encoding=encoding) as fh:
+            fh.write(serializers.serialize('json', objects, indent=2))
+        return path
+
+    def test_encoding_is_detected(self):
+        for encoding, detected in (('utf-16', 'utf-16'), ('utf-8-sig', 'utf-8-sig'), ('utf-8', 'utf-8'),
+                                   ('utf-16-le', 'utf-16-le')):
+            self.assertEqual(dumps.detect_encoding(self.dump([self.program], encoding)), detected)
+
+    def test_objects_are_streamed_across_chunks(self):
+        students = [self.student, self.make_student('ben')]
+        objects = list(dumps.iter_dump_objects(self.dump(students), chunk_size=16))
+        self.assertEqual([obj['pk'] for obj in objects], [student.pk for student in students])
+
+    def test_restore_keeps_timestamps_and_refreshes_derived_data(self):
+        enrollment = self.enroll()
+        created_at = (timezone.now() - timedelta(days=400)).replace(microsecond=0)
+        Enrollment.objects.filter(pk=enrollment.pk).update(created_at=created_at)
+        enrollment.refresh_from_db()
+        path = self.dump([self.student.user, self.student, enrollment])
+        Enrollment.objects.all().delete()
+        Student.objects.filter(pk=self.student.pk).update(last_name='Changed')
+
+        loaded = dumps.restore(path)
+
+        self.assertEqual(loaded['enrollments.enrollment'], 1)
+        restored = Enrollment.objects.get(pk=enrollment.pk)
+        self.assertEqual((restored.enrollment_id, restored.created_at), (enrollment.enrollment_id, created_at))
+        # Existing rows are overwritten, as loaddata would
+        self.assertEqual(Student.objects.get(pk=self.student.pk).last_name, 'Cruz')
+        self.assertEqual(summaries.enrollment_count(program=self.program), 1)
+        self.assertEqual([match['id'] for match in search.typeahead('cruz')], [self.student.pk])
+
+    def test_truncated_file_is_an_error(self):
+        path = f'{self.directory.name}/truncated.json'
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(serializers.serialize('json', [self.program])[:-10])
+        with self.assertRaises(ValueError):
+            dumps.restore(path)
+
+
+# ============================================
+# CONNECTION POOLING
+# ============================================
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def rollback(self):
+        if self.closed:
+            raise RuntimeError('connection is closed')
+
+    def close(self):
+        self.closed = True
+
+
+class PoolingTests(EnrollmentTestCase):
+    def make_pool(self, **overrides):
+        return pool.LocalPool('default', pool.pool_settings({'ENABLED': True, **overrides}))
+
+    def test_disabled_pooling_keeps_persistent_connections(self):
+        db = pool.configure_pooling({'ENGINE': 'django.db.backends.sqlite3'}, pool.pool_settings({'ENABLED': False}))
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertEqual(db['ENGINE'], 'django.db.backends.sqlite3')
+
+    def test_enabled_pooling_swaps_in_the_local_backend(self):
+        config = pool.pool_settings({'ENABLED': True, 'MAX_SIZE': 2})
+        db = pool.configure_pooling({'ENGINE': 'django.db.backends.sqlite3', 'CONN_MAX_AGE': 600}, config)
+        self.assertEqual(db['ENGINE'], 'enrollments.db.sqlite3')
+        self.assertEqual((db['CONN_MAX_AGE'], db['POOL']['MAX_SIZE']), (0, 2))
+
+    def test_environment_overrides_defaults(self):
+        with mock.patch.dict('os.environ', {'DB_POOL_ENABLED': 'yes', 'DB_POOL_MAX_SIZE': '9'}):
+            config = pool.pool_settings()
+        self.assertTrue(config['ENABLED'])
+        self.assertEqual(config['MAX_SIZE'], 9)
+
+    def test_released_connections_are_reused_last_in_first_out(self):
+        local = self.make_pool()
+        first, _ = local.acquire(FakeConnection)
+        second, _ = local.acquire(FakeConnection)
+        local.release(first)
+        local.release(second)
+
+        self.assertIs(local.acquire(FakeConnection)[0], second)
+        self.assertIs(local.acquire(FakeConnection)[0], first)
+        self.assertEqual(local.snapshot()['created'], 2)
+
+    def test_expired_connections_are_recycled(self):
+        local = self.make_pool(MAX_IDLE=-1)
+        connection, _ = local.acquire(FakeConnection)
+        local.release(connection)
+
+        replacement, _ = local.acquire(FakeConnection)
+
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(local.snapshot()['closed'], 1)
+
+    def test_idle_connections_are_health_checked(self):
+        local = self.make_pool(CHECK_INTERVAL=-1)
+        connection, needs_check = local.acquire(FakeConnection)
+        self.assertFalse(needs_check)
+        local.release(connection)
+        self.assertEqual(local.acquire(FakeConnection), (connection, True))
+
+    def test_full_pool_times_out(self):
+        local = self.make_pool(MAX_SIZE=1, TIMEOUT=0)
+        local.acquire(FakeConnection)
+        with self.assertRaises(pool.PoolTimeout):
+            local.acquire(FakeConnection)
+        self.assertEqual(local.snapshot()['timeouts'], 1)
+
+    def test_broken_connections_are_not_returned(self):
+        local = self.make_pool()
+        connection, _ = local.acquire(FakeConnection)
+        connection.close()
+        local.release(connection)
+        self.assertEqual((local.snapshot()['size'], local.snapshot()['idle']), (0, 0))
+
+    def test_stats_view_is_staff_only(self):
+        self.client.force_login(self.student.user)
+        self.assertEqual(self.client.get(reverse('db_pool_stats')).status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('db_pool_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('pools', response.json())
+
+
+# ============================================
+# COLD START
+# ============================================
+
+class ColdStartTests(EnrollmentTestCase):
+    def test_lazy_include_imports_its_urlconf_on_first_reverse(self):
+        resolver = coldstart.lazy_include('admin/', 'enrollment_system.admin_urls', 'admin')
+        # Populating the parent resolver (as the first {% url %} does) must not import it
+        resolver._populate()
+        self.assertNotIn('urlconf_module', resolver.__dict__)
+
+        self.assertEqual(resolver.reverse('index'), '')
+        self.assertIn('urlconf_module', resolver.__dict__)
+
+    def test_lazy_include_resolves_admin_urls(self):
+        resolver = coldstart.lazy_include('admin/', 'enrollment_system.admin_urls', 'admin')
+        match = resolver.resolve('admin/login/')
+        self.assertEqual((match.namespace, match.url_name), ('admin', 'login'))
+
+    def test_prewarm_compiles_templates_and_skips_missing_ones(self):
+        loader = coldstart.engines['django'].engine.template_loaders[0]
+        loader.reset()
+
+        with self.settings(COLD_START_PREWARM_TEMPLATES=['base.html', 'missing.html']):
+            with self.assertLogs('enrollments.coldstart', 'WARNING') as logs:
+                timings = coldstart.prewarm()
+
+        self.assertEqual(set(timings), {'urlconf', 'templates'})
+        self.assertIn('missing.html', logs.output[0])
+        self.assertIn('base.html', {key.split('-')[0] for key in loader.get_template_cache})
+
+
+# ============================================
+# CARD TAGS
+# ============================================
+
+class CardTagTests(EnrollmentTestCase):
+    def render(self, source, **context):
+        return Template('{% load cards %}' + source).render(Context(context))
+
+    def test_row_url_matches_url(self):
+        rendered = self.render("{% for pk in pks %}{% row_url 'enrollment_approve' pk %} {% endfor %}", pks=[1, 42, 1000])
+        self.assertEqual(rendered.split(), [reverse('enrollment_approve', args=[pk]) for pk in (1, 42, 1000)])
+
+    def test_row_url_follows_the_script_prefix(self):
+        prefix = get_script_prefix()
+        self.addCleanup(set_script_prefix, prefix)
+        set_script_prefix('/portal/')
+        self.assertEqual(self.render("{% row_url 'program_detail' 7 %}"), reverse('program_detail', args=[7]))
+        self.assertTrue(self.render("{% row_url 'program_detail' 7 %}").startswith('/portal/'))
+
+    def test_cards_render_like_includes(self):
+        enrollment = self.enroll()
+        for user in (self.staff, self.student.user):
+            context = {'enrollment': enrollment, 'program': self.program, 'user': user}
+            self.assertEqual(
+                self.render('{% enrollment_card enrollment %}{% program_card program %}', **context),
+                self.render(
+                    "{% include 'atomic/molecules/enrollment_card.html' %}"
+                    "{% include 'atomic/molecules/program_card.html' %}",
+                    **context,
+                ),
+            )
+
+    def test_dashboard_renders_cards(self):
+        enrollment = self.enroll()
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, reverse('enrollment_approve', args=[enrollment.pk]))
+        self.assertContains(response, enrollment.enrollment_id)
+
+
+# ============================================
+# NOTIFICATION INBOX
+# ============================================
+
+class InboxTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        enrollment = self.enroll()
+        self.notifications = [
+            Notification.objects.create(
+                user=self.student.user, notification_type='enrollment_approved', enrollment=enrollment,
+                message=f'Notification {number}',
+            )
+            for number in range(7)
+        ]
+
+    def walk(self, size=3):
+        seen, cursor = [], ''
+        while cursor is not None:
+            inbox_page = inbox.page(self.student.user, cursor, size=size)
+            seen.extend(inbox_page.notifications)
+            cursor = inbox_page.next_cursor
+        return seen
+
+    def test_pages_unread_first_without_gaps_or_repeats(self):
+        read = [self.notifications[5].pk, self.notifications[1].pk]
+        inbox.mark_read(self.student.user, read)
+
+        seen = self.walk()
+
+        unread = [n.pk for n in reversed(self.notifications) if n.pk not in read]
+        self.assertEqual([n.pk for n in seen], unread + read)
+        self.assertEqual([n.is_read for n in seen], [False] * 5 + [True] * 2)
+
+    def test_page_ending_on_the_last_unread_continues_with_read_ones(self):
+        inbox.mark_read(self.student.user, [n.pk for n in self.notifications[:4]])
+        first = inbox.page(self.student.user, size=3)
+        self.assertEqual(first.next_cursor, 'r')
+        self.assertEqual(len(self.walk()), 7)
+
+    def test_unreadable_cursor_starts_from_the_top(self):
+        self.assertEqual(inbox.page(self.student.user, 'garbage', size=3), inbox.page(self.student.user, size=3))
+
+    def test_mark_all_moves_the_watermark_without_touching_rows(self):
+        shown = self.notifications[4].pk
+        inbox.mark_all_read(self.student.user, up_to=shown)
+
+        self.assertEqual(inbox.watermark(self.student.user), shown)
+        self.assertEqual(inbox.unread_count(self.student.user), 2)
+        self.assertFalse(Notification.objects.filter(is_read=True).exists())
+
+    def test_watermark_never_moves_back_or_past_the_newest(self):
+        inbox.mark_all_read(self.student.user, up_to=self.notifications[4].pk)
+        inbox.mark_all_read(self.student.user, up_to=self.notifications[2].pk)
+        self.assertEqual(inbox.watermark(self.student.user), self.notifications[4].pk)
+
+        inbox.mark_all_read(self.student.user, up_to=10 ** 9)
+        self.assertEqual(inbox.watermark(self.student.user), self.notifications[-1].pk)
+        self.assertEqual(NotificationReadState.objects.count(), 1)
+
+    def test_mark_selected_is_limited_to_the_owner(self):
+        self.client.force_login(self.make_student('ben').user)
+        self.client.post(reverse('notification_read', args=[self.notifications[0].pk]))
+        self.assertEqual(inbox.unread_count(self.student.user), 7)
+
+        self.client.force_login(self.student.user)
+        response = self.client.post(
+            reverse('notifications_mark_read'), {'ids': [n.pk for n in self.notifications[:3]], 'after': 'u9'},
+        )
+        self.assertRedirects(response, f"{reverse('notifications')}?after=u9", fetch_redirect_response=False)
+        self.assertEqual(inbox.unread_count(self.student.user), 4)
+
+    def test_archiving_folds_in_the_watermark(self):
+        inbox.mark_all_read(self.student.user, up_to=self.notifications[2].pk)
+        rows = inbox.apply_watermarks(list(Notification.objects.values('id', 'user_id', 'is_read')))
+        self.assertEqual(sum(row['is_read'] for row in rows), 3)
+
+
+# ============================================
+# TERM ROLLOVER
+# ============================================
+
+class RolloverTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        today = timezone.localdate()
+        self.target = SchoolYear.objects.create(
+            year_start=2031, year_end=2032, semester='1st',
+            enrollment_start=today, enrollment_end=today + timedelta(days=30),
+        )
+        self.continuing = self.enroll_as('approved', '1')
+        self.enroll_as('enrolled', '4', student=self.make_student('ben'))        # completes the program
+        self.enroll_as('pending', '2', student=self.make_student('cid'))         # not eligible
+        self.already = self.enroll_as('approved', '2', student=self.make_student('dee'))
+        Enrollment.objects.create(
+            student=self.already.student, program=self.program, school_year=self.target, year_level='3',
+        )
+
+    def enroll_as(self, status, year_level, student=None):
+        return Enrollment.objects.create(
+            student=student or self.student, program=self.program, school_year=self.school_year,
+            year_level=year_level, status=status,
+        )
+
+    def test_preview_counts(self):
+        self.assertEqual(
+            rollover.preview(self.school_year, self.target),
+            {'eligible': 3, 'to_create': 1, 'already_enrolled': 1, 'completed': 1},
+        )
+
+    def test_creates_pending_enrollments_at_the_next_year_level(self):
+        counts = rollover.roll_over(self.school_year, self.target, batch_size=1)
+
+        self.assertEqual(counts, {'created': 1, 'completed': 1, 'finished': True})
+        created = Enrollment.objects.get(student=self.student, school_year=self.target)
+        self.assertEqual((created.status, created.year_level, created.program), ('pending', '2', self.program))
+        self.assertTrue(created.enrollment_id)
+        self.assertEqual(summaries.enrollment_count(school_year=self.target), 2)
+
+    def test_same_school_year_keeps_the_year_level(self):
+        self.assertFalse(rollover.advances_year_level(self.school_year, SchoolYear(year_start=2030, semester='2nd')))
+        self.assertEqual(rollover.next_year_level('1', 4, advance=False), '1')
+        self.assertIsNone(rollover.next_year_level('4', 4, advance=True))
+
+    def test_rerun_only_creates_what_is_missing(self):
+        rollover.roll_over(self.school_year, self.target)
+        self.assertEqual(rollover.roll_over(self.school_year, self.target)['created'], 0)
+        self.assertEqual(Enrollment.objects.filter(school_year=self.target).count(), 2)
+
+    def test_invalid_terms_are_refused(self):
+        with self.assertRaises(rollover.RolloverError):
+            rollover.roll_over(self.school_year, self.school_year)
+        with self.assertRaises(rollover.RolloverError):
+            rollover.preview(self.target, self.school_year)
+
+    def test_allocated_ids_continue_past_99999(self):
+        year = timezone.now().year
+        newest = Enrollment.objects.latest('pk')
+        Enrollment.objects.filter(pk=self.continuing.pk).update(enrollment_id=f'ENR-{year}-99999')
+        # Sorts before 'ENR-...-99999', but is the most recently issued
+        Enrollment.objects.filter(pk=newest.pk).update(enrollment_id=f'ENR-{year}-100000')
+        self.assertEqual(Enrollment.allocate_ids(2), [f'ENR-{year}-100001', f'ENR-{year}-100002'])
+
+    def test_staff_page_queues_one_keyed_job(self):
+        self.client.force_login(self.staff)
+        data = {'source': self.school_year.pk, 'target': self.target.pk}
+        self.client.post(reverse('term_rollover'), data)
+        self.client.post(reverse('term_rollover'), data)
+
+        job = Job.objects.get()
+        self.assertEqual(job.key, rollover.job_key(self.school_year, self.target))
+        response = self.client.get(reverse('term_rollover'), data)
+        self.assertEqual(response.context['preview']['to_create'], 1)
+
+
+# ============================================
+# STRESS HARNESS
+# ============================================
+
+class StressHarnessTests(EnrollmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fixtures = stress_enrollments._create_fixtures('test', 1, 2)
+        self.command = stress_enrollments.Command(stdout=StringIO())
+
+    def make_enrollment(self, index=0):
+        return Enrollment.objects.create(
+            student=Student.objects.get(student_id=f'Stest-0-{index}'), program_id=self.fixtures['program_ids'][0],
+            school_year_id=self.fixtures['school_year_id'], year_level='1',
+        )
+
+    def test_bad_mix_is_refused(self):
+        for mix in ('create', 'create=4,teleport=1', 'create=0'):
+            with self.assertRaises(CommandError):
+                call_command('stress_enrollments', mix=mix, stdout=StringIO())
+
+    def test_fixture_sessions_are_logged_in(self):
+        cookies = self.fixtures['sessions'][0]['students'][1]
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = cookies[settings.SESSION_COOKIE_NAME]
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+
+    def test_invariants_hold_for_a_clean_run(self):
+        enrollment = self.make_enrollment()
+        transitions.transition(enrollment, 'approve', by=self.staff)
+        self.make_enrollment(1)
+
+        self.assertTrue(self.command._check_invariants(self.fixtures, [{'decisions': [enrollment.pk]}]))
+        self.assertNotIn('FAIL', self.command.stdout.getvalue())
+
+    def test_double_review_and_missing_notification_are_reported(self):
+        enrollment = self.make_enrollment()
+        transitions.transition(enrollment, 'approve', by=self.staff)
+        Notification.objects.filter(enrollment=enrollment).delete()
+
+        self.assertFalse(self.command._check_invariants(self.fixtures, [{'decisions': [enrollment.pk]}] * 2))
+        output = self.command.stdout.getvalue()
+        self.assertIn('FAIL  one review per enrollment', output)
+        self.assertIn('FAIL  notifications match decisions', output)
+
+    def test_fixtures_are_deleted(self):
+        self.make_enrollment()
+        stress_enrollments._delete_fixtures(self.fixtures)
+        self.assertFalse(Program.objects.filter(pk__in=self.fixtures['program_ids']).exists())
+        self.assertFalse(User.objects.filter(username__startswith='stress-test-').exists())
+
+    def test_error_summary_groups_by_kind(self):
+        body = b'<html><title>IntegrityError at /enrollments/42/approve/</title></html>'
+        self.assertEqual(stress_enrollments._error_summary(body), 'IntegrityError at /enrollments/<pk>/approve/')
+
+
+# ============================================
+# SQLITE PROFILE
+# ============================================
+
+class SQLiteProfileTests(EnrollmentTestCase):
+    def test_profile_sets_pragmas_and_begin_immediate(self):
+        db = sqlite_profile.configure_sqlite(
+            {'ENGINE': 'enrollments.db.sqlite3', 'OPTIONS': {'sslmode': 'require'}},
+            sqlite_profile.sqlite_settings({'BUSY_TIMEOUT_MS': 2500}),
+        )
+        options = db['OPTIONS']
+        self.assertNotIn('sslmode', options)
+        self.assertEqual((options['transaction_mode'], options['timeout']), ('IMMEDIATE', 2.5))
+        self.assertTrue(options['init_command'].startswith('PRAGMA busy_timeout = 2500;'))
+
+    def test_disabled_profile_and_other_engines_are_left_alone(self):
+        stock = sqlite_profile.configure_sqlite(
+            {'ENGINE': 'django.db.backends.sqlite3'}, sqlite_profile.sqlite_settings({'ENABLED': False}),
+        )
+        self.assertEqual(stock['OPTIONS'], {})
+        postgres = {'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {'sslmode': 'require'}}
+        sqlite_profile.configure_sqlite(postgres, sqlite_profile.sqlite_settings())
+        self.assertEqual(postgres['OPTIONS'], {'sslmode': 'require'})
+
+    def test_environment_overrides_defaults(self):
+        with mock.patch.dict('os.environ', {'DB_SQLITE_ENABLED': 'false', 'DB_SQLITE_SYNCHRONOUS': 'FULL'}):
+            config = sqlite_profile.sqlite_settings()
+        self.assertEqual((config['ENABLED'], config['SYNCHRONOUS']), (False, 'FULL'))
+
+    def test_init_command_switches_a_file_database_to_wal(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connection = sqlite3.connect(f'{directory.name}/db.sqlite3')
+        self.addCleanup(connection.close)
+
+        connection.executescript(sqlite_profile.init_command(sqlite_profile.sqlite_settings()))
+
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(connection.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        self.assertEqual(connection.execute('PRAGMA cache_size').fetchone()[0], -32 * 1024)
+
+    def test_checkpoint_modes_are_checked(self):
+        with self.assertRaises(ValueError):
+            sqlite_profile.checkpoint(mode='EVENTUALLY')
+
+    def test_checkpoint_command_needs_wal(self):
+        # The test database lives in memory, which has no WAL
+        with self.assertRaises(CommandError):
+            call_command('checkpoint_sqlite', stdout=StringIO())
+
+
+# ============================================
+# FEES
+# ============================================
+
+class FeeTests(EnrollmentTestCase):
+    def publish(self, *rules, installments=()):
+        schedule = fees.new_version(self.school_year, by=self.staff)
+        for rule in rules:
+            FeeRule.objects.create(schedule=schedule, **rule)
+        for label, due_date, percent in installments:
+            FeeInstallment.objects.create(schedule=schedule, label=label, due_date=due_date, percent=Decimal(percent))
+        return fees.publish(schedule)
+
+    def test_without_a_schedule_the_fee_is_the_tuition(self):
+        self.assertEqual(self.enroll().total_fee, Decimal('20000.00'))
+
+    def test_breakdown_applies_every_rule_kind(self):
+        self.publish(
+            {'kind': 'multiplier', 'name': 'Undergraduate', 'program_type': 'undergraduate', 'multiplier': Decimal('1.2')},
+            {'kind': 'multiplier', 'name': 'BSCS', 'program': self.program, 'multiplier': Decimal('1.5')},
+            {'kind': 'discount', 'name': 'Early bird', 'percent': Decimal('10')},
+            {'kind': 'scholarship', 'name': 'Dean', 'student': self.student, 'percent': Decimal('50'),
+             'amount': Decimal('500')},
+            {'kind': 'misc', 'name': 'Library', 'amount': Decimal('1000')},
+        )
+        rules = fees.Rules.for_school_year(self.school_year)
+
+        self.assertEqual(
+            rules.breakdown(self.program.pk, '1', self.student.pk),
+            fees.Breakdown(Decimal('30000.00'), Decimal('3000.00'), Decimal('14000.00'), Decimal('1000.00'),
+                           Decimal('14000.00')),
+        )
+        self.assertEqual(rules.total(self.program.pk, '1', self.make_student('ben').pk), Decimal('28000.00'))
+        self.assertEqual(self.enroll().total_fee, Decimal('14000.00'))
+
+    def test_installments_take_the_remainder_last(self):
+        self.publish(installments=[('Down', date(2030, 6, 1), '33.33'), ('Prelims', date(2030, 8, 1), '33.33'),
+                                   ('Finals', date(2030, 10, 1), '33.34')])
+        plan = fees.Rules.for_school_year(self.school_year).installment_plan(Decimal('100.00'))
+        self.assertEqual([amount for _, _, amount in plan], [Decimal('33.33'), Decimal('33.33'), Decimal('33.34')])
+
+    def test_versions(self):
+        first = self.publish({'kind': 'misc', 'name': 'Library', 'amount': Decimal('1000')})
+        draft = fees.new_version(self.school_year)
+
+        self.assertEqual((draft.version, draft.rules.count()), (2, 1))
+        with self.assertRaises(fees.FeeError):
+            fees.new_version(self.school_year)
+        with self.assertRaises(fees.FeeError):
+            fees.publish(first)
+        self.assertEqual(fees.current_schedule(self.school_year), first)
+        fees.publish(draft)
+        self.assertEqual(fees.current_schedule(self.school_year), draft)
+
+    def test_installments_must_add_up(self):
+        with self.assertRaises(fees.FeeError):
+            self.publish(installments=[('Down', date(2030, 6, 1), '50')])
+
+    def test_rules_need_the_value_of_their_kind(self):
+        schedule = fees.new_version(self.school_year)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FeeRule.objects.create(schedule=schedule, kind='discount', name='Nothing')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FeeRule.objects.create(schedule=schedule, kind='misc', name='Named', amount=1, student=self.student)
+
+    def test_recompute_writes_only_changed_fees(self):
+        pending = self.enroll()
+        rejected = self.enroll(student=self.make_student('ben'))
+        Enrollment.objects.filter(pk=rejected.pk).update(status='rejected')
+        summaries.rebuild()
+        self.publish({'kind': 'discount', 'name': 'Early bird', 'percent': Decimal('25')})
+
+        dry_run = fees.recompute(self.school_year, dry_run=True)
+        self.assertEqual((dry_run['scanned'], dry_run['changed']), (1, 1))
+        self.assertEqual(Enrollment.objects.get(pk=pending.pk).total_fee, Decimal('20000.00'))
+
+        report = fees.recompute(self.school_year, batch_size=1)
+
+        self.assertEqual((report['changed'], report['decrease'], report['finished']), (1, Decimal('5000.00'), True))
+        updated = Enrollment.objects.get(pk=pending.pk)
+        self.assertEqual((updated.total_fee, updated.version), (Decimal('15000.00'), pending.version + 1))
+        self.assertEqual(Enrollment.objects.get(pk=rejected.pk).total_fee, Decimal('20000.00'))
+        self.assertEqual(
+            EnrollmentSummary.objects.filter(status='pending').aggregate(fee=Sum('total_fee_sum'))['fee'],
+            Decimal('15000.00'),
+        )
+        self.assertEqual(fees.recompute(self.school_year)['changed'], 0)
+
+    def test_recompute_refuses_an_unpublished_schedule(self):
+        draft = fees.new_version(self.school_year)
+        with self.assertRaises(fees.FeeError):
+            fees.recompute(self.school_year, schedule=draft)
+        self.assertEqual(fees.recompute(self.school_year, schedule=draft, dry_run=True)['changed'], 0)
@@ -0,0 +1,300 @@
+"""
+Request tracing and the slow-query log.
+
+With TRACING_ENABLED, settings.py adds TracingMiddleware and the app
+installs hooks around SQL execution, template rendering and form
+validation. A sampled request (TRACING_SAMPLE_RATE, or any staff request
+with ?_trace=1) records a trace. A requested one starts at the view, since
+the user isn't known before; for anyone else ?_trace does nothing.
+
+  * one span for the request, with child spans for every template
+    rendered (extends and includes too), every form's full_clean(), and
+    every SQL query, each nested under whatever was running at the time;
+  * a breakdown of the request time into sql / template / form / view,
+    from each span's self time (its time minus its children's), so the
+    parts add up to the total. "view" is everything else: view code,
+    middleware, serialization;
+  * the queries deduplicated by SQL text and call site, the first frame
+    of this project's code, or else the template that ran them. A query
+    that repeats a lot from one place is usually an N+1.
+
+Traces are appended to TRACING_EXPORT_PATH as JSON lines; `manage.py
+trace_report` summarizes them. Queries slower than TRACING_SLOW_QUERY_MS are
+logged to the 'enrollments.slow_queries' logger on every request (sampled
+or not), and from management commands and job workers too.
+
+Disabled (the default), none of this is installed and it costs nothing.
+Enabled, a request that isn't sampled pays for one timer per query.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.backends.signals import connection_created
+
+slow_query_logger = logging.getLogger('enrollments.slow_queries')
+
+TRACE_PARAM = '_trace'
+MAX_SPANS = 2000
+SQL_MAX_LENGTH = 2000
+
+_current = ContextVar('enrollments_trace', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ============================================
+# TRACES
+# ============================================
+
+class Trace:
+    def __init__(self, path, recording):
+        self.path = path
+        self.recording = recording
+        self.id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.view = None
+        # Asked for with ?_trace by a staff member
+        self.requested = False
+        self.spans = []
+        self.open = []
+        self.dropped = 0
+        self.queries = {}
+
+    def _offset_ms(self, moment):
+        return round((moment - self.started) * 1000, 3)
+
+    def begin(self, kind, name):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        span = {
+            'id': len(self.spans), 'parent': self.open[-1]['id'] if self.open else None,
+            'kind': kind, 'name': name, 'start_ms': self._offset_ms(time.perf_counter()), 'duration_ms': None,
+        }
+        self.spans.append(span)
+        self.open.append(span)
+        return span
+
+    def end(self, span):
+        if span is None:
+            return
+        span['duration_ms'] = round(self._offset_ms(time.perf_counter()) - span['start_ms'], 3)
+        self.open.remove(span)
+
+    def add_query(self, sql, alias, started, elapsed_ms, many):
+        template = next((span['name'] for span in reversed(self.open) if span['kind'] == 'template'), None)
+        callsite = _callsite()
+        key = (sql, callsite, template)
+        entry = self.queries.get(key)
+        if entry is None:
+            entry = self.queries[key] = {
+                'sql': sql[:SQL_MAX_LENGTH], 'alias': alias, 'callsite': callsite, 'template': template,
+                'count': 0, 'total_ms': 0.0,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += elapsed_ms
+
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append({
+            'id': len(self.spans), 'parent': self.open[-1]['id'] if self.open else None,
+            'kind': 'sql', 'name': sql[:200], 'start_ms': self._offset_ms(started),
+            'duration_ms': round(elapsed_ms, 3), 'alias': alias, 'many': many,
+        })
+
+    def to_dict(self, request, response):
+        duration_ms = self._offset_ms(time.perf_counter())
+        child_ms = {}
+        for span in self.spans:
+            if span['parent'] is not None and span['duration_ms'] is not None:
+                child_ms[span['parent']] = child_ms.get(span['parent'], 0) + span['duration_ms']
+
+        # Self times don't overlap, so they add up to (at most) the total;
+        # whatever no span covers is the view's own time
+        breakdown = dict.fromkeys(['sql', 'template', 'form'], 0.0)
+        for span in self.spans:
+            if span['duration_ms'] is not None:
+                span['self_ms'] = round(span['duration_ms'] - child_ms.get(span['id'], 0), 3)
+                breakdown[span['kind']] += span['self_ms']
+        breakdown['view'] = duration_ms - sum(breakdown.values())
+
+        queries = sorted(self.queries.values(), key=lambda q: q['total_ms'], reverse=True)
+        return {
+            'trace_id': self.id,
+            'timestamp': time.time(),
+            'method': request.method,
+            'path': self.path,
+            'view': self.view,
+            'status': response.status_code,
+            'duration_ms': duration_ms,
+            'breakdown_ms': {kind: round(ms, 3) for kind, ms in breakdown.items()},
+            'query_count': sum(q['count'] for q in queries),
+            'duplicate_queries': sum(q['count'] - 1 for q in queries),
+            'queries': [dict(q, total_ms=round(q['total_ms'], 3)) for q in queries],
+            'spans': self.spans,
+            'dropped_spans': self.dropped,
+        }
+
+
+_project_root = None
+
+
+def _callsite():
+    """'path:line function' of the innermost frame in this project's code, outside this module."""
+    global _project_root
+    if _project_root is None:
+        _project_root = os.path.join(str(settings.BASE_DIR), '')
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_project_root) and filename != __file__ and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, _project_root)}:{frame.f_lineno} {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+# ============================================
+# HOOKS (installed by install())
+# ============================================
+
+def _sql_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        alias = context['connection'].alias
+        trace = _current.get()
+        if trace is not None and trace.recording:
+            trace.add_query(sql, alias, started, elapsed_ms, many)
+        threshold = _setting('TRACING_SLOW_QUERY_MS', 0)
+        if threshold and elapsed_ms >= threshold:
+            slow_query_logger.warning(
+                'Slow query (%.1f ms) on %s at %s [%s]: %s',
+                elapsed_ms, alias, _callsite() or '-', trace.path if trace else '-', sql[:SQL_MAX_LENGTH],
+            )
+
+
+def _add_sql_wrapper(sender, connection, **kwargs):
+    # The wrapper list belongs to the connection object, which outlives reconnects
+    if _sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_sql_wrapper)
+
+
+def _traced(kind, original, name_of):
+    def traced(self, *args, **kwargs):
+        trace = _current.get()
+        if trace is None or not trace.recording:
+            return original(self, *args, **kwargs)
+        span = trace.begin(kind, name_of(self))
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            trace.end(span)
+    traced.__wrapped__ = original
+    return traced
+
+
+def _template_name(template):
+    return template.origin.template_name or template.name or '<string>'
+
+
+_installed = False
+
+
+def install():
+    """Hook SQL, template and form timing in. Called from AppConfig.ready() when enabled."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    from django.db import connections
+    from django.forms import BaseForm
+    from django.template.base import Template
+
+    connection_created.connect(_add_sql_wrapper, dispatch_uid='enrollments-tracing-sql')
+    for connection in connections.all(initialized_only=True):
+        _add_sql_wrapper(None, connection)
+
+    Template._render = _traced('template', Template._render, _template_name)
+    BaseForm.full_clean = _traced('form', BaseForm.full_clean, lambda form: type(form).__name__)
+
+
+# ============================================
+# EXPORT
+# ============================================
+
+class JsonLinesExporter:
+    """Appends one JSON object per trace to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, record):
+        line = json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+        with self.lock, open(self.path, 'a', encoding='utf-8') as out:
+            out.write(line)
+
+
+_exporter = None
+
+
+def exporter():
+    global _exporter
+    if _exporter is None:
+        _exporter = JsonLinesExporter(_setting('TRACING_EXPORT_PATH', 'traces.jsonl'))
+    return _exporter
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class TracingMiddleware:
+    """Starts a trace per request and exports the sampled ones."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = _setting('TRACING_SAMPLE_RATE', 0.0)
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        trace = Trace(request.path, recording=sampled)
+        token = _current.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        if sampled or trace.requested:
+            record = trace.to_dict(request, response)
+            exporter().export(record)
+            if trace.requested:
+                response['X-Trace-Id'] = trace.id
+                response['Server-Timing'] = ', '.join(
+                    f'{kind};dur={ms:.1f}' for kind, ms in record['breakdown_ms'].items()
+                ) + f", total;dur={record['duration_ms']:.1f}"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trace = _current.get()
+        if trace is None:
+            return
+        trace.view = getattr(request.resolver_match, 'view_name', None) or view_func.__name__
+        # Staff can ask for a trace of a page that feels slow; the user is known by now
+        if TRACE_PARAM in request.GET and getattr(request, 'user', None) is not None and request.user.is_staff:
+            trace.recording = trace.requested = True
@@ -0,0 +1,165 @@
+"""
+Enrollment status changes.
+
+Every status change after an enrollment is created goes through a named
+transition of the STATUS_CHOICES graph:
+
+    pending --approve--> approved --enroll--> enrolled
+       |                    |                    |
+       +--reject--> rejected +-------drop--------+--> dropped
+
+transition() applies one to a single enrollment as one conditional UPDATE:
+
+    UPDATE ... SET status = <target>, version = version + 1, ...
+    WHERE id = <pk> AND status = <as read> AND version = <as read>
+
+so of two admins reviewing the same row only the first UPDATE matches;
+the second raises TransitionConflict instead of overwriting the first
+decision. Enrollment.version goes up on every write (save() included),
+which is what makes the rest of the row "as read" too: pass
+expected_version (e.g. from a hidden form field) to also refuse a change
+to a row that was edited after the user looked at it.
+
+transition_queryset() applies one to many enrollments in batches, each in
+its own transaction.
+
+UPDATEs send no post_save, so both send enrollment_transitioned instead,
+inside the transaction, with the updated enrollments and what each one
+looked like before. The receivers in signals.py keep the summaries,
+change feed, dashboards and notifications in step.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Enrollment
+from . import summaries
+
+DEFAULT_BATCH_SIZE = 500
+
+Transition = namedtuple('Transition', 'name sources target verb reviews')
+
+TRANSITIONS = {
+    t.name: t for t in [
+        # reviews: sets reviewed_by / reviewed_at
+        Transition('approve', ('pending',), 'approved', 'approve', True),
+        Transition('reject', ('pending',), 'rejected', 'reject', True),
+        Transition('enroll', ('approved',), 'enrolled', 'mark as enrolled', False),
+        Transition('drop', ('approved', 'enrolled'), 'dropped', 'drop', False),
+    ]
+}
+
+# Sent inside the transaction with transition=, enrollments= (updated
+# instances, student and program loaded), previous= ({pk: summaries
+# measure before}), by= (the user or None) and notes=
+enrollment_transitioned = Signal()
+
+
+class TransitionError(Exception):
+    pass
+
+
+class TransitionConflict(TransitionError):
+    """The enrollment changed (or went away) between reading and updating it."""
+
+
+def get_transition(name):
+    try:
+        return TRANSITIONS[name]
+    except KeyError:
+        raise TransitionError(f'Unknown transition {name!r}.')
+
+
+def available(status):
+    """Transitions that can be applied to an enrollment in `status`."""
+    return [t for t in TRANSITIONS.values() if status in t.sources]
+
+
+def _changes(t, by, notes, now):
+    changes = {'status': t.target, 'version': F('version') + 1, 'updated_at': now}
+    if t.reviews:
+        changes.update(reviewed_by=by, reviewed_at=now)
+    if notes is not None:
+        changes['admin_notes'] = notes
+    return changes
+
+
+# ============================================
+# ONE ENROLLMENT
+# ============================================
+
+def transition(enrollment, name, by=None, notes=None, expected_version=None):
+    """Apply transition `name` to `enrollment` (updated in place), or raise TransitionError."""
+    t = get_transition(name)
+    if enrollment.status not in t.sources:
+        raise TransitionError(
+            f"Can't {t.verb} enrollment {enrollment.enrollment_id}: it is {enrollment.get_status_display().lower()}."
+        )
+    if expected_version is not None and expected_version != enrollment.version:
+        raise TransitionConflict(f'Enrollment {enrollment.enrollment_id} was changed by someone else.')
+
+    previous = summaries.enrollment_measure(enrollment)
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Enrollment.objects.filter(
+            pk=enrollment.pk, status=enrollment.status, version=enrollment.version,
+        ).update(**_changes(t, by, notes, now))
+        if not updated:
+            raise TransitionConflict(f'Enrollment {enrollment.enrollment_id} was changed by someone else.')
+
+        enrollment.status = t.target
+        enrollment.version += 1
+        enrollment.updated_at = now
+        if t.reviews:
+            enrollment.reviewed_by, enrollment.reviewed_at = by, now
+        if notes is not None:
+            enrollment.admin_notes = notes
+        enrollment_transitioned.send(
+            sender=Enrollment, transition=t, enrollments=[enrollment],
+            previous={enrollment.pk: previous}, by=by, notes=notes,
+        )
+    return enrollment
+
+
+# ============================================
+# MANY ENROLLMENTS
+# ============================================
+
+def transition_queryset(queryset, name, by=None, notes=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Apply `name` to every enrollment in `queryset` it applies to; returns how many changed."""
+    t = get_transition(name)
+    candidates = queryset.filter(status__in=t.sources).order_by('pk')
+    changed, last_pk = 0, 0
+    while True:
+        with transaction.atomic():
+            # Locked until the batch commits, so the UPDATEs below match every row read
+            batch = list(
+                candidates.filter(pk__gt=last_pk).select_for_update()
+                .values_list('pk', 'status', *summaries.MEASURE_FIELDS)[:batch_size]
+            )
+            if not batch:
+                return changed
+            last_pk = batch[-1][0]
+            changed += _transition_batch(t, batch, by, notes)
+
+
+def _transition_batch(t, batch, by, notes):
+    now = timezone.now()
+    by_status = {}
+    for pk, status, *_ in batch:
+        by_status.setdefault(status, []).append(pk)
+    for status, pks in by_status.items():
+        updated = Enrollment.objects.filter(pk__in=pks, status=status).update(**_changes(t, by, notes, now))
+        if updated != len(pks):
+            # Only without row locks (SQLite outside BEGIN IMMEDIATE); the batch rolls back
+            raise TransitionConflict(f'{len(pks) - updated} enrollment(s) changed during the batch; run it again.')
+
+    previous = {pk: summaries.measure(*fields) for pk, _, *fields in batch}
+    enrollments = list(Enrollment.objects.filter(pk__in=previous).select_related('student', 'program'))
+    enrollment_transitioned.send(
+        sender=Enrollment, transition=t, enrollments=enrollments, previous=previous, by=by, notes=notes,
+    )
+    return len(enrollments)
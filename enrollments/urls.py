@@ -11,6 +11,9 @@ urlpatterns = [
     # Student Profile
     path('profile/', views.student_profile_view, name='student_profile'),
     
+    # Student search (typeahead)
+    path('students/search.json', views.student_search_view, name='student_search'),
+    
     # Programs
     path('programs/', views.program_list_view, name='program_list'),
     path('programs/<int:pk>/', views.program_detail_view, name='program_detail'),
@@ -18,6 +21,9 @@ urlpatterns = [
     path('programs/<int:pk>/update/', views.program_update_view, name='program_update'),
     path('programs/<int:pk>/delete/', views.program_delete_view, name='program_delete'),
     
+    # Term rollover
+    path('school-years/rollover/', views.term_rollover_view, name='term_rollover'),
+    
     # Enrollments
     path('enrollments/', views.enrollment_list_view, name='enrollment_list'),
     path('enrollments/create/', views.enrollment_create_view, name='enrollment_create'),
@@ -30,6 +36,19 @@ urlpatterns = [
     
     # Notifications
     path('notifications/', views.notifications_view, name='notifications'),
+    path('notifications/read/', views.notifications_mark_read_view, name='notifications_mark_read'),
     path('notifications/<int:pk>/read/', views.notification_read_view, name='notification_read'),
+    
+    # Reports
+    path('reports/analytics/', views.analytics_view, name='analytics'),
+    path('reports/analytics.json', views.analytics_json_view, name='analytics_json'),
+    
+    # Change feed
+    path('changes/', views.change_feed_view, name='change_feed'),
+    
+    # Operations
+    path('ops/db-pool/', views.db_pool_stats_view, name='db_pool_stats'),
+    path('ops/dashboard-cache/', views.dashboard_cache_stats_view, name='dashboard_cache_stats'),
+    path('ops/jobs/', views.job_queue_view, name='job_queue'),
 ]
 
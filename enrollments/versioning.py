@@ -0,0 +1,70 @@
+"""
+Data version stamps kept in the shared cache.
+
+Cached results include the current version of the data they were built
+from in their cache key; bumping the version after a write makes every
+stale entry unreachable without having to know which keys exist.
+
+That only works if every worker process sees the same cache (settings.CACHES).
+With a process-local one (LocMemCache, e.g. in a settings file without
+CACHES) a bump reaches one process only, so cache_timeout() caps how long
+entries live there instead.
+"""
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Namespaces
+ENROLLMENT_DATA = 'enrollment-data'
+REFERENCE_DATA = 'reference-data'   # active programs / school years (reference.py)
+STUDENT_DATA = 'student-data'       # student profiles (the staff dashboard's totals)
+USER_DATA = 'user-data'             # per user, see user_namespace() (dashboards.py)
+
+# Longest a versioned entry lives in a process-local cache
+LOCAL_CACHE_SECONDS = 30
+
+
+def user_namespace(user_id):
+    """One user's own data: their enrollments, notifications and profile."""
+    return f'{USER_DATA}:{user_id}'
+
+
+def shared_cache():
+    """Whether the default cache is shared by all processes (not LocMemCache or DummyCache)."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def cache_timeout(seconds):
+    """`seconds`, capped at LOCAL_CACHE_SECONDS unless the cache is shared."""
+    return seconds if shared_cache() else min(seconds, LOCAL_CACHE_SECONDS)
+
+
+def _cache_key(namespace):
+    return f'enrollments:version:{namespace}'
+
+
+def _seed():
+    # A version that was never handed out before: after an eviction (or a cache
+    # flush) a constant seed could repeat an old version whose entries are still cached
+    return time.time_ns()
+
+
+def get_version(namespace):
+    version = cache.get(_cache_key(namespace))
+    if version is None:
+        seed = _seed()
+        cache.add(_cache_key(namespace), seed, timeout=None)
+        version = cache.get(_cache_key(namespace), seed)
+    return version
+
+
+def bump_version(namespace):
+    try:
+        return cache.incr(_cache_key(namespace))
+    except ValueError:
+        # Key was evicted (or never set)
+        version = _seed()
+        cache.set(_cache_key(namespace), version, timeout=None)
+        return version
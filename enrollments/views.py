@@ -1,20 +1,38 @@
+import json
 import random
 import string
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.http import urlencode
+from django.urls import reverse
 from django.db.models import Q
-from .models import Student, Program, Enrollment, Notification
-from .forms import RegisterForm, StudentProfileForm, EnrollmentForm, ProgramForm
+from .models import Student, Program, SchoolYear, Enrollment, Job
+from . import analytics, archive, changefeed, dashboards, inbox, jobs, mail, rollover, search, summaries, transitions
+from .idempotency import idempotent
+from .pagination import ApproximateCountPaginator
+from .replicas import replica_reads
+from .db.pool import pool_stats
+
+# Forms (and django.contrib.auth.forms behind them) are imported inside the
+# views that use them, so a cold start serving the dashboard or a list
+# doesn't pay for them
 
 # ============================================
 # AUTHENTICATION
 # ============================================
 
+@idempotent('register')
 def register_view(request):
+    from .forms import RegisterForm, StudentProfileForm
+
     if request.user.is_authenticated:
         return redirect('dashboard')
     
@@ -24,22 +42,24 @@ def register_view(request):
         
         if form.is_valid() and profile_form.is_valid():
             try:
-                user = form.save()
-                student = profile_form.save(commit=False)
-                student.user = user
-                
-                # --- ROBUST UNIQUE ID GENERATOR ---
-                unique_id_found = False
-                while not unique_id_found:
-                    random_suffix = ''.join(random.choices(string.digits, k=4))
-                    potential_id = f"{timezone.now().year}-{random_suffix}"
+                # User and profile together, or neither
+                with transaction.atomic():
+                    user = form.save()
+                    student = profile_form.save(commit=False)
+                    student.user = user
                     
-                    # Check if this ID already exists in the database
-                    if not Student.objects.filter(student_id=potential_id).exists():
-                        student.student_id = potential_id
-                        unique_id_found = True
-                
-                student.save()
+                    # --- ROBUST UNIQUE ID GENERATOR ---
+                    unique_id_found = False
+                    while not unique_id_found:
+                        random_suffix = ''.join(random.choices(string.digits, k=4))
+                        potential_id = f"{timezone.now().year}-{random_suffix}"
+                        
+                        # Check if this ID already exists in the database
+                        if not Student.objects.filter(student_id=potential_id).exists():
+                            student.student_id = potential_id
+                            unique_id_found = True
+                    
+                    student.save()
                 login(request, user)
                 messages.success(request, f'Registration successful! Your Student ID is {student.student_id}')
                 return redirect('dashboard')
@@ -88,71 +108,20 @@ def logout_view(request):
 # ============================================
 
 @login_required
+@replica_reads
 def dashboard_view(request):
-    # Cleaner way to get student profile using getattr
-    student = getattr(request.user, 'student_profile', None)
-    
-    # Get notifications
-    unread_notifications = Notification.objects.filter(
-        user=request.user, 
-        is_read=False
-    ).count()
-    
-    # Admin view
-    if request.user.is_staff:
-        total_students = Student.objects.count()
-        total_programs = Program.objects.filter(is_active=True).count()
-        pending_enrollments = Enrollment.objects.filter(status='pending').count()
-        approved_enrollments = Enrollment.objects.filter(status='approved').count()
-        
-        recent_enrollments = Enrollment.objects.filter(
-            status='pending'
-        ).order_by('-created_at')[:5]
-        
-        context = {
-            'is_admin': True,
-            'student': student,
-            'total_students': total_students,
-            'total_programs': total_programs,
-            'pending_enrollments': pending_enrollments,
-            'approved_enrollments': approved_enrollments,
-            'recent_enrollments': recent_enrollments,
-            'unread_notifications': unread_notifications,
-        }
-    else:
-        # Student view
-        if student:
-            my_enrollments = Enrollment.objects.filter(student=student)
-            pending_count = my_enrollments.filter(status='pending').count()
-            approved_count = my_enrollments.filter(status='approved').count()
-            enrolled_count = my_enrollments.filter(status='enrolled').count()
-            recent_enrollments = my_enrollments[:5]
-        else:
-            pending_count = 0
-            approved_count = 0
-            enrolled_count = 0
-            recent_enrollments = []
-        
-        available_programs = Program.objects.filter(is_active=True)[:6]
-        
-        context = {
-            'is_admin': False,
-            'student': student,
-            'pending_count': pending_count,
-            'approved_count': approved_count,
-            'enrolled_count': enrolled_count,
-            'recent_enrollments': recent_enrollments,
-            'available_programs': available_programs,
-            'unread_notifications': unread_notifications,
-        }
-    
-    return render(request, 'enrollments/dashboard.html', context)
+    # Counts, recent enrollments and programs come from per-user / staff
+    # snapshots that signals invalidate (see dashboards.py)
+    return render(request, 'enrollments/dashboard.html', dashboards.dashboard_context(request.user))
 
 # ============================================
 # PROGRAM MANAGEMENT
 # ============================================
 
+PROGRAMS_PER_PAGE = 24
+
 @login_required
+@replica_reads
 def program_list_view(request):
     programs = Program.objects.all()
     search = request.GET.get('search', '')
@@ -172,8 +141,11 @@ def program_list_view(request):
     if status:
         programs = programs.filter(is_active=(status == 'active'))
     
+    page_obj = ApproximateCountPaginator(programs, PROGRAMS_PER_PAGE).get_page(request.GET.get('page'))
+    
     context = {
-        'programs': programs,
+        'programs': page_obj,
+        'page_obj': page_obj,
         'search': search,
         'program_type': program_type,
         'status': status,
@@ -181,9 +153,10 @@ def program_list_view(request):
     return render(request, 'enrollments/program_list.html', context)
 
 @login_required
+@replica_reads
 def program_detail_view(request, pk):
     program = get_object_or_404(Program, pk=pk)
-    enrollment_count = Enrollment.objects.filter(program=program).count()
+    enrollment_count = summaries.enrollment_count(program=program)
     return render(request, 'enrollments/program_detail.html', {
         'program': program,
         'enrollment_count': enrollment_count,
@@ -191,6 +164,8 @@ def program_detail_view(request, pk):
 
 @login_required
 def program_create_view(request):
+    from .forms import ProgramForm
+
     if not request.user.is_staff:
         messages.error(request, 'Only admins can add programs.')
         return redirect('program_list')
@@ -207,6 +182,8 @@ def program_create_view(request):
 
 @login_required
 def program_update_view(request, pk):
+    from .forms import ProgramForm
+
     if not request.user.is_staff:
         messages.error(request, 'Only admins can edit programs.')
         return redirect('program_list')
@@ -239,59 +216,78 @@ def program_delete_view(request, pk):
 # ENROLLMENT MANAGEMENT
 # ============================================
 
+ENROLLMENTS_PER_PAGE = 50
+
 @login_required
+@replica_reads
 def enrollment_list_view(request):
     student = getattr(request.user, 'student_profile', None)
     view_mode = request.GET.get('view', 'all' if request.user.is_staff else 'my')
     
+    # Past terms may live in the archive tables; let the router pick the table
+    school_year_id = request.GET.get('school_year', '')
+    school_year = SchoolYear.objects.filter(pk=school_year_id).first() if school_year_id.isdigit() else None
+    base = archive.enrollments_for_school_year(school_year) if school_year else Enrollment.objects.all()
+    
     if request.user.is_staff:
         if view_mode == 'my' and student:
-            enrollments = Enrollment.objects.filter(student=student)
+            enrollments = base.filter(student=student)
             title = "My Enrollments"
         else:
-            enrollments = Enrollment.objects.all()
+            enrollments = base
             title = "All Enrollments (Admin View)"
     else:
-        enrollments = Enrollment.objects.filter(student=student) if student else Enrollment.objects.none()
+        enrollments = base.filter(student=student) if student else base.none()
         title = "My Enrollments"
     
     status = request.GET.get('status', '')
     if status:
         enrollments = enrollments.filter(status=status)
     
+    enrollments = enrollments.select_related('student', 'program', 'school_year')
+    page_obj = ApproximateCountPaginator(enrollments, ENROLLMENTS_PER_PAGE).get_page(request.GET.get('page'))
+    
     return render(request, 'enrollments/enrollment_list.html', {
-        'enrollments': enrollments,
+        'enrollments': page_obj,
+        'page_obj': page_obj,
         'status': status,
         'view_mode': view_mode,
         'title': title,
         'student': student,
+        'school_years': SchoolYear.objects.all(),
+        'school_year': school_year,
     })
 
+def _term_choice(request):
+    # The enrollment form reloads with the picked program / school year to list their sections
+    return {name: request.GET[name] for name in ('program', 'school_year', 'year_level') if request.GET.get(name)}
+
 @login_required
+@idempotent('enrollment_create')
 def enrollment_create_view(request):
+    from .forms import EnrollmentForm
+
     student = getattr(request.user, 'student_profile', None)
     if not student:
         messages.error(request, 'Please complete your student profile first.')
         return redirect('student_profile')
     
     if request.method == 'POST':
-        form = EnrollmentForm(request.POST)
+        form = EnrollmentForm(request.POST, student=student)
         if form.is_valid():
             try:
                 enrollment = form.save(commit=False)
                 enrollment.student = student
+                enrollment.status = 'pending'
+                auto_approve = request.user.is_staff and request.POST.get('auto_approve')
                 
-                # Admin Auto-Approve Logic
-                if request.user.is_staff and request.POST.get('auto_approve'):
-                    enrollment.status = 'approved'
-                    enrollment.reviewed_by = request.user
-                    enrollment.reviewed_at = timezone.now()
-                    msg = 'Enrollment created and auto-approved!'
-                else:
-                    enrollment.status = 'pending'
-                    msg = 'Enrollment submitted! Waiting for approval.'
-                
-                enrollment.save()
+                with transaction.atomic():
+                    enrollment.save()
+                    form.save_m2m()
+                    # Admin auto-approve: the same transition (and notification) as a review
+                    if auto_approve:
+                        transitions.transition(enrollment, 'approve', by=request.user)
+                msg = 'Enrollment created and auto-approved!' if auto_approve else 'Enrollment submitted! Waiting for approval.'
                 messages.success(request, msg)
                 return redirect('enrollment_list')
 
@@ -301,7 +297,7 @@ def enrollment_create_view(request):
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
-        form = EnrollmentForm()
+        form = EnrollmentForm(student=student, initial=_term_choice(request))
     
     return render(request, 'enrollments/enrollment_form.html', {
         'form': form, 
@@ -311,6 +307,8 @@ def enrollment_create_view(request):
 
 @login_required
 def enrollment_update_view(request, pk):
+    from .forms import EnrollmentForm
+
     enrollment = get_object_or_404(Enrollment, pk=pk)
     student = getattr(request.user, 'student_profile', None)
     
@@ -325,11 +323,18 @@ def enrollment_update_view(request, pk):
     if request.method == 'POST':
         form = EnrollmentForm(request.POST, instance=enrollment)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                # save() writes the whole row: only over the version this form was made from
+                current = Enrollment.objects.select_for_update().filter(pk=pk).values_list('version', flat=True).first()
+                seen = form.cleaned_data.get('version')
+                if current != enrollment.version or (seen is not None and seen != current):
+                    messages.error(request, 'This enrollment was changed by someone else in the meantime. Please review it and try again.')
+                    return redirect('enrollment_update', pk=pk)
+                form.save()
             messages.success(request, 'Enrollment updated successfully!')
             return redirect('enrollment_list')
     else:
-        form = EnrollmentForm(instance=enrollment)
+        form = EnrollmentForm(instance=enrollment, initial=_term_choice(request))
     
     return render(request, 'enrollments/enrollment_form.html', {
         'form': form,
@@ -347,7 +352,11 @@ def enrollment_delete_view(request, pk):
         return redirect('enrollment_list')
     
     if request.method == 'POST':
-        enrollment.delete()
+        with transaction.atomic():
+            # Re-read under a row lock: a review committed since the read above would
+            # otherwise be missed (its notification by the cascade, its status by the summaries)
+            enrollment = get_object_or_404(Enrollment.objects.select_for_update(), pk=pk)
+            enrollment.delete()
         messages.success(request, 'Enrollment deleted successfully!')
         return redirect('enrollment_list')
     return render(request, 'enrollments/enrollment_confirm_delete.html', {'enrollment': enrollment})
@@ -356,28 +365,37 @@ def enrollment_delete_view(request, pk):
 # ADMIN APPROVAL SYSTEM
 # ============================================
 
+def _apply_review(request, enrollment, name, admin_notes, template):
+    """None once reviewed, else a 409 showing the enrollment as it is now."""
+    # The version the reviewer saw; someone else's review (or an edit) since then wins
+    try:
+        seen_version = int(request.POST['version'])
+    except (KeyError, ValueError):
+        seen_version = None
+    try:
+        transitions.transition(enrollment, name, by=request.user, notes=admin_notes, expected_version=seen_version)
+    except transitions.TransitionError:
+        try:
+            enrollment.refresh_from_db()
+        except Enrollment.DoesNotExist:
+            raise Http404('This enrollment was deleted.')
+        messages.warning(request, 'Someone else reviewed or changed this enrollment first. Check it again below.')
+        return render(request, template, {'enrollment': enrollment}, status=409)
+    return None
+
 @login_required
 def enrollment_approve_view(request, pk):
     if not request.user.is_staff:
         messages.error(request, 'Only admins can approve enrollments.')
         return redirect('enrollment_list')
     
-    enrollment = get_object_or_404(Enrollment, pk=pk, status='pending')
+    enrollment = get_object_or_404(Enrollment.objects.select_related('student', 'program'), pk=pk, status='pending')
     
     if request.method == 'POST':
         admin_notes = request.POST.get('admin_notes', '')
-        enrollment.status = 'approved'
-        enrollment.reviewed_by = request.user
-        enrollment.reviewed_at = timezone.now()
-        enrollment.admin_notes = admin_notes
-        enrollment.save()
-        
-        Notification.objects.create(
-            user=enrollment.student.user,
-            notification_type='enrollment_approved',
-            enrollment=enrollment,
-            message=f'Your enrollment for {enrollment.program.name} has been approved!'
-        )
+        conflict = _apply_review(request, enrollment, 'approve', admin_notes, 'enrollments/enrollment_approve.html')
+        if conflict:
+            return conflict
         messages.success(request, f'Enrollment approved for {enrollment.student.get_full_name()}!')
         return redirect('enrollment_list')
     
@@ -389,7 +407,7 @@ def enrollment_reject_view(request, pk):
         messages.error(request, 'Only admins can reject enrollments.')
         return redirect('enrollment_list')
     
-    enrollment = get_object_or_404(Enrollment, pk=pk, status='pending')
+    enrollment = get_object_or_404(Enrollment.objects.select_related('student', 'program'), pk=pk, status='pending')
     
     if request.method == 'POST':
         admin_notes = request.POST.get('admin_notes', '')
@@ -397,18 +415,9 @@ def enrollment_reject_view(request, pk):
             messages.error(request, 'Please provide a reason for rejection.')
             return render(request, 'enrollments/enrollment_reject.html', {'enrollment': enrollment})
         
-        enrollment.status = 'rejected'
-        enrollment.reviewed_by = request.user
-        enrollment.reviewed_at = timezone.now()
-        enrollment.admin_notes = admin_notes
-        enrollment.save()
-        
-        Notification.objects.create(
-            user=enrollment.student.user,
-            notification_type='enrollment_rejected',
-            enrollment=enrollment,
-            message=f'Your enrollment for {enrollment.program.name} has been rejected. Reason: {admin_notes}'
-        )
+        conflict = _apply_review(request, enrollment, 'reject', admin_notes, 'enrollments/enrollment_reject.html')
+        if conflict:
+            return conflict
         messages.success(request, 'Enrollment rejected and student notified.')
         return redirect('enrollment_list')
     
@@ -420,23 +429,189 @@ def enrollment_reject_view(request, pk):
 
 @login_required
 def notifications_view(request):
-    notifications = Notification.objects.filter(user=request.user)
-    if request.GET.get('mark_read'):
-        notifications.update(is_read=True)
-        messages.success(request, 'All notifications marked as read.')
-        return redirect('notifications')
+    read_up_to = inbox.watermark(request.user)
+    inbox_page = inbox.page(request.user, request.GET.get('after', ''), read_up_to=read_up_to)
+    unread_count = inbox.unread_count(request.user, read_up_to)
     
     return render(request, 'enrollments/notifications.html', {
-        'notifications': notifications,
-        'unread_count': notifications.filter(is_read=False).count(),
+        'notifications': inbox_page.notifications,
+        'next_cursor': inbox_page.next_cursor,
+        'after': request.GET.get('after', ''),
+        'unread_count': unread_count,
+        # "Mark all as read" covers what was shown, not what arrives meanwhile
+        'newest_id': inbox.newest_id(request.user) if unread_count else 0,
     })
 
+def _back_to_inbox(request):
+    after = request.POST.get('after', '')
+    if after:
+        return redirect(f"{reverse('notifications')}?{urlencode({'after': after})}")
+    return redirect('notifications')
+
 @login_required
 def notification_read_view(request, pk):
-    notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    notification.is_read = True
-    notification.save()
-    return redirect('enrollment_list')
+    if request.method == 'POST':
+        inbox.mark_read(request.user, [pk])
+    return _back_to_inbox(request)
+
+@login_required
+def notifications_mark_read_view(request):
+    if request.method == 'POST':
+        if request.POST.get('all'):
+            up_to = request.POST.get('up_to', '')
+            inbox.mark_all_read(request.user, int(up_to) if up_to.isdigit() else None)
+            messages.success(request, 'All notifications marked as read.')
+        else:
+            ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+            marked = inbox.mark_read(request.user, ids)
+            messages.success(request, f'{marked} notification(s) marked as read.')
+    return _back_to_inbox(request)
+
+# ============================================
+# REPORTS
+# ============================================
+
+def _analytics_filters(request):
+    school_year = request.GET.get('school_year', '')
+    program_type = request.GET.get('type', '')
+    return {
+        'school_year': int(school_year) if school_year.isdigit() else None,
+        'program_type': program_type if program_type in dict(Program.PROGRAM_TYPES) else None,
+    }
+
+@login_required
+@replica_reads
+def analytics_view(request):
+    if not request.user.is_staff:
+        messages.error(request, 'Only admins can view reports.')
+        return redirect('dashboard')
+    
+    filters = _analytics_filters(request)
+    return render(request, 'enrollments/analytics.html', {
+        'report': analytics.get_report(**filters),
+        'school_years': SchoolYear.objects.all(),
+        'program_types': Program.PROGRAM_TYPES,
+        'school_year': filters['school_year'],
+        'program_type': filters['program_type'] or '',
+    })
+
+@login_required
+@replica_reads
+def analytics_json_view(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Only admins can view reports.'}, status=403)
+    
+    return JsonResponse(analytics.get_report(**_analytics_filters(request)))
+
+# ============================================
+# STUDENT SEARCH (typeahead)
+# ============================================
+
+@login_required
+@replica_reads
+def student_search_view(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Only admins can search students.'}, status=403)
+    
+    query = request.GET.get('q', '')
+    limit = request.GET.get('limit', str(search.DEFAULT_LIMIT))
+    if not limit.isdigit():
+        return JsonResponse({'error': '"limit" must be a non-negative integer.'}, status=400)
+    
+    results = search.typeahead(query, limit=min(int(limit), search.MAX_LIMIT))
+    return JsonResponse({'query': query, 'results': results})
+
+# ============================================
+# CHANGE FEED (downstream sync)
+# ============================================
+
+def _change_feed_allowed(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, 'CHANGE_FEED_TOKEN', '')
+    auth = request.headers.get('Authorization', '')
+    return bool(token) and auth.startswith('Bearer ') and constant_time_compare(auth[7:], token)
+
+def change_feed_view(request):
+    if not _change_feed_allowed(request):
+        return JsonResponse({'error': 'Not allowed.'}, status=403)
+    
+    after = request.GET.get('after', '0')
+    limit = request.GET.get('limit', str(changefeed.DEFAULT_LIMIT))
+    if not after.isdigit() or not limit.isdigit():
+        return JsonResponse({'error': '"after" and "limit" must be non-negative integers.'}, status=400)
+    models = [m for m in request.GET.get('models', '').split(',') if m]
+    
+    limit = changefeed.clamp_limit(int(limit))
+    entries = changefeed.fetch(after=int(after), limit=limit, models=models)
+    
+    def stream():
+        # One JSON object per line, then a trailer with the cursor to resume from
+        cursor, count = int(after), 0
+        for entry in entries.iterator():
+            cursor, count = entry.id, count + 1
+            yield json.dumps(changefeed.entry_to_dict(entry), cls=DjangoJSONEncoder) + '\n'
+        yield json.dumps({'cursor': cursor, 'count': count, 'has_more': count >= limit}) + '\n'
+    
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+# ============================================
+# OPERATIONS
+# ============================================
+
+@login_required
+def db_pool_stats_view(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Only admins can view pool statistics.'}, status=403)
+    
+    return JsonResponse({'pools': pool_stats()})
+
+@login_required
+def dashboard_cache_stats_view(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Only admins can view cache statistics.'}, status=403)
+    
+    return JsonResponse({'dashboard_snapshots': dashboards.stats()})
+
+@login_required
+def job_queue_view(request):
+    if not request.user.is_staff:
+        messages.error(request, 'Only admins can view the job queue.')
+        return redirect('dashboard')
+    
+    return render(request, 'enrollments/job_queue.html', {
+        'queue': jobs.queue_stats(),
+        'email': mail.stats(),
+    })
+
+@login_required
+def term_rollover_view(request):
+    from .forms import RolloverForm
+
+    if not request.user.is_staff:
+        messages.error(request, 'Only admins can roll over terms.')
+        return redirect('dashboard')
+    
+    data = request.POST if request.method == 'POST' else (request.GET if 'source' in request.GET else None)
+    form = RolloverForm(data)
+    preview = None
+    if data is not None and form.is_valid():
+        source, target = form.cleaned_data['source'], form.cleaned_data['target']
+        if request.method == 'POST':
+            # Runs on the job workers; re-submitting while it is queued doesn't queue it twice
+            jobs.enqueue(
+                rollover.run_job, {'source': source.pk, 'target': target.pk},
+                priority=5, key=rollover.job_key(source, target),
+            )
+            messages.success(request, f'Rollover from {source} to {target} queued.')
+            return redirect(f"{reverse('term_rollover')}?{urlencode({'source': source.pk, 'target': target.pk})}")
+        preview = rollover.preview(source, target)
+    
+    return render(request, 'enrollments/term_rollover.html', {
+        'form': form,
+        'preview': preview,
+        'recent_runs': Job.objects.filter(name=jobs.task_name(rollover.run_job)).order_by('-created_at')[:10],
+    })
 
 # ============================================
 # STUDENT PROFILE
@@ -444,6 +619,8 @@ def notification_read_view(request, pk):
 
 @login_required
 def student_profile_view(request):
+    from .forms import StudentProfileForm
+
     # Safely get the student profile if it exists
     student = getattr(request.user, 'student_profile', None)
     
@@ -466,5 +643,7 @@ def student_profile_view(request):
     # Passing 'student' here is crucial for the read-only Student ID field in your HTML
     return render(request, 'enrollments/student_profile.html', {
         'form': form,
-        'student': student
+        'student': student,
+        # Enrollments from closed school years that were moved to the archive
+        'archived_enrollments': archive.student_enrollment_history(student) if student else [],
     })
\ No newline at end of file
@@ -46,8 +46,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -70,6 +76,23 @@ DATABASES = {
     }
 }
 
+# SQLite production profile (enrollments/db/sqlite_profile.py): WAL, busy timeout,
+# BEGIN IMMEDIATE, ... tuned with DB_SQLITE_* env vars, e.g. DB_SQLITE_ENABLED=False
+# for Django's stock SQLite settings
+from enrollments.db.sqlite_profile import configure_sqlite, sqlite_settings  # noqa: E402
+
+DB_SQLITE = sqlite_settings()
+for _db in DATABASES.values():
+    configure_sqlite(_db, DB_SQLITE)
+
+# Cache shared by every worker process (see enrollments/versioning.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'enrollments_cache',
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -104,4 +127,10 @@ CSRF_COOKIE_HTTPONLY = True
 SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Change feed for downstream sync jobs (enrollments/changefeed.py)
+CHANGE_FEED_TOKEN = os.getenv('CHANGE_FEED_TOKEN', '')
+# Longest a transaction writing tracked rows may stay open; the feed waits
+# this long for a missing sequence number before treating it as rolled back
+CHANGE_FEED_SETTLE_SECONDS = int(os.getenv('CHANGE_FEED_SETTLE_SECONDS', '60'))